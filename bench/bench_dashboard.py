@@ -0,0 +1,298 @@
+# ------------------------------------------------------------
+# Benchmark do dashboard — tempo por etapa em CSVs sintéticos
+# ------------------------------------------------------------
+# Uso:
+#   python bench/bench_dashboard.py --linhas 10000 100000 1000000 --saida bench.jsonl
+#   python bench/bench_dashboard.py --csv /tmp/vendas_50m.csv --modo streaming --saida bench.jsonl
+#   python bench/bench_dashboard.py --linhas 1000000 --backend duckdb --saida bench.jsonl
+#   python bench/bench_dashboard.py --linhas 1000000 --aproximado --saida bench.jsonl
+#   python bench/bench_dashboard.py --comparar base.jsonl bench.jsonl
+#
+# Os dados vêm de `vendas_engine`; o app é importado em modo "bare" (sem servidor
+# Streamlit) só para medir as funções de gráfico. Para cada CSV mede a carga (fria e a partir do cache colunar) e, para
+# cada seleção da matriz de filtros, o bloco de filtros, os KPIs, a série diária e
+# cada função `chart_*`/`map_*` (agregação + montagem da figura). Cada medição vira
+# uma linha JSON em `--saida`.
+
+import argparse
+import functools
+import importlib.util
+import inspect
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+
+import pandas as pd
+
+from gerar_vendas import gerar
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(RAIZ, "streamlit_app_v1.py")
+sys.path.insert(0, RAIZ)
+
+# Fases do gráfico em medição (ver `medir_graficos`); as funções do motor chamadas pelo app
+# somam nele o tempo de agregação.
+FASES: dict = {}
+
+
+def carregar_app(csv_path: str, cache_dir: str, modo: str, backend: str = "pandas", aproximado: bool = False):
+    """Aponta o motor para `csv_path` e importa o app como módulo isolado.
+
+    Sem cache de resultados nem pool de gráficos, para medir cada etapa por inteiro.
+    Retorna `(motor, app)`.
+    """
+    os.environ.update({
+        "VENDAS_CSV": csv_path,
+        "VENDAS_CACHE_DIR": cache_dir,
+        "VENDAS_MODE": modo,
+        "VENDAS_BACKEND": backend,
+        "VENDAS_APROXIMADO": "1" if aproximado else "0",
+        "VENDAS_RESULT_CACHE_MB": "0",
+        "VENDAS_CHART_WORKERS": "0",
+        "VENDAS_LAZY": "1",
+        "VENDAS_AUTO_REFRESH": "0",
+    })
+    import vendas_engine as motor
+    motor.CSV_PATH, motor.CACHE_DIR, motor.DATA_MODE, motor.BACKEND = csv_path, cache_dir, modo, backend
+    motor.APPROX = aproximado
+    limpar_caches(motor)
+    spec = importlib.util.spec_from_file_location(f"vendas_app_{uuid.uuid4().hex[:8]}", APP)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    cronometrar_motor(app)
+    return motor, app
+
+
+def cronometrar_motor(app):
+    """Envolve, uma única vez, as funções do motor importadas pelo app que recebem o Rollup ou a série."""
+    def cronometrar(func):
+        @functools.wraps(func)
+        def medida(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                FASES["agregacao_s"] = FASES.get("agregacao_s", 0.0) + time.perf_counter() - t0
+        return medida
+
+    for nome, func in list(vars(app).items()):
+        if inspect.isfunction(func) and func.__module__ == "vendas_engine" \
+                and next(iter(inspect.signature(func).parameters), None) in ("rollup", "serie"):
+            setattr(app, nome, cronometrar(func))
+
+
+def limpar_caches(motor):
+    """Esquece datasets e consultas já carregados (o próximo `load_dataset` relê o cache em disco)."""
+    motor.dataset_store.cache_clear()
+    if motor.BACKEND != "pandas":
+        import vendas_sql
+        vendas_sql.banco.cache_clear()
+
+
+def matriz_filtros(motor, ds) -> list:
+    """Seleções representativas: sem filtro, uma/várias dimensões e janelas de data."""
+    todos = dict(motor.FILTER_DIMS)
+    ini, fim = ds.opcoes.data_min, ds.opcoes.data_max
+    mais = lambda col, **f: motor.build_rollup(ds, {**todos, **f}, ini, fim).by(col, "n_linhas") \
+        .set_index(col)["n_linhas"].idxmax()
+    estado = mais("estado")
+    ult30 = max(ini, fim - pd.Timedelta(days=29))
+    return [
+        ("sem_filtro", todos, ini, fim),
+        ("estado", {**todos, "estado": estado}, ini, fim),
+        ("estado_municipio", {**todos, "estado": estado, "municipio": mais("municipio", estado=estado)}, ini, fim),
+        ("categoria", {**todos, "categoria_produto": mais("categoria_produto")}, ini, fim),
+        ("loja_vendedor", {**todos, "loja": mais("loja"), "nome_vendedor": mais("nome_vendedor")}, ini, fim),
+        ("parcelada", {**todos, "venda_parcelada": "sim"}, ini, fim),
+        ("ultimos_30_dias", todos, ult30, fim),
+        ("combinado_30_dias", {**todos, "estado": estado, "categoria_produto": mais("categoria_produto")}, ult30, fim),
+    ]
+
+
+class Medidor:
+    """Acumula medições em registros JSON com o contexto comum da rodada."""
+
+    def __init__(self, contexto: dict):
+        self.contexto = contexto
+        self.registros: list = []
+
+    def medir(self, etapa: str, func, filtro: str | None = None, **extra):
+        t0 = time.perf_counter()
+        resultado = func()
+        self.registrar(etapa, time.perf_counter() - t0, filtro, **extra)
+        return resultado
+
+    def registrar(self, etapa: str, segundos: float, filtro: str | None = None, **extra):
+        self.registros.append({**self.contexto, "filtro": filtro, "etapa": etapa,
+                               "segundos": round(segundos, 6), **extra})
+
+
+def medir_graficos(app, medidor: Medidor, filtro: str, rollup, serie, data_ini):
+    """Chama cada `chart_*`/`map_*` trocando a exibição por uma medição da figura.
+
+    Cada registro separa as fases: agregação (chamadas ao motor que recebem o Rollup ou a
+    série, envolvidas em `carregar_app`), montagem da figura (o restante) e serialização
+    (JSON/HTML enviado ao navegador).
+    """
+    atual = FASES
+
+    def show_figure(key, build, vazio=None):
+        fig = build()
+        t0 = time.perf_counter()
+        payload = len(fig.to_json()) if fig is not None else 0
+        atual.update(serializacao_s=time.perf_counter() - t0, payload_bytes=payload)
+
+    def st_folium(m, **kwargs):
+        t0 = time.perf_counter()
+        html = m.get_root().render()
+        atual.update(serializacao_s=time.perf_counter() - t0, payload_bytes=len(html))
+
+    app.show_figure = show_figure
+    if app.HAS_FOLIUM:
+        import streamlit_folium  # o app o importa só no primeiro mapa
+        streamlit_folium.st_folium = st_folium
+    args = {"rollup": rollup, "serie": serie, "data_ini": data_ini}
+    funcoes = [(n, f) for n, f in vars(app).items()
+               if n.startswith(("chart_", "map_")) and inspect.isfunction(f)
+               and set(inspect.signature(f).parameters) <= set(args)]  # exclui `chart_pool`
+    for nome, func in funcoes:
+        params = [args[p] for p in inspect.signature(func).parameters]
+        atual.clear()
+        t0 = time.perf_counter()
+        func(*params)
+        total = time.perf_counter() - t0
+        agregacao, serializacao = atual.get("agregacao_s", 0.0), atual.get("serializacao_s", 0.0)
+        medidor.registrar(nome, total, filtro,
+                          agregacao_s=round(agregacao, 6),
+                          montagem_s=round(total - agregacao - serializacao, 6),
+                          serializacao_s=round(serializacao, 6),
+                          payload_bytes=atual.get("payload_bytes", 0))
+
+
+def rodar_csv(csv_path: str, modo: str, backend: str, repeticoes: int, contexto: dict,
+              aproximado: bool = False) -> list:
+    """Todas as etapas para um CSV; retorna os registros."""
+    cache_dir = tempfile.mkdtemp(prefix="vendas_bench_cache_")
+    linhas = sum(1 for _ in open(csv_path, "rb")) - 1
+    medidor = Medidor({**contexto, "csv": os.path.basename(csv_path), "linhas": linhas,
+                       "bytes_csv": os.path.getsize(csv_path), "modo": modo, "backend": backend,
+                       "aproximado": aproximado})
+    try:
+        t0 = time.perf_counter()
+        motor, app = carregar_app(csv_path, cache_dir, modo, backend, aproximado)
+        medidor.registrar("import_app", time.perf_counter() - t0)
+        for rep in range(repeticoes):
+            # Carga fria (sem cache colunar/banco) e carga a partir do cache
+            limpar_caches(motor)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            medidor.medir("load_data_frio", lambda: motor.load_dataset(csv_path), repeticao=rep)
+            limpar_caches(motor)
+            ds = medidor.medir("load_data_cache", lambda: motor.load_dataset(csv_path), repeticao=rep)
+
+            for nome, sel, ini, fim in matriz_filtros(motor, ds):
+                rollup = medidor.medir("filtros", lambda: motor.build_rollup(ds, sel, ini, fim), nome,
+                                       repeticao=rep)
+                medidor.registros[-1]["linhas_saida"] = int(rollup.total("n_linhas"))
+                if rollup.total("n_linhas") == 0:
+                    continue
+                medidor.medir("kpis", lambda: motor.compute_kpis(rollup), nome, repeticao=rep)
+                serie = medidor.medir("serie_diaria",
+                                      lambda: motor.daily_series(ds, sel, ini, fim,
+                                                                 lookback_dias=motor.SERIE_LOOKBACK_DIAS),
+                                      nome, repeticao=rep)
+                inicio = len(medidor.registros)
+                medir_graficos(app, medidor, nome, rollup, serie, ini)
+                for r in medidor.registros[inicio:]:
+                    r["repeticao"] = rep
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return medidor.registros
+
+
+def resumo(registros: list) -> pd.DataFrame:
+    """Mediana (s) por CSV/modo/backend/aproximado/etapa, somando as seleções de filtro.
+
+    Os gráficos também entram somados por fase (`graficos:agregacao`, `:montagem`, `:serializacao`).
+    """
+    df = pd.DataFrame(registros)
+    if "agregacao_s" in df:
+        graficos = df[df["agregacao_s"].notna()]
+        fases = [graficos.assign(etapa=f"graficos:{fase}", segundos=graficos[f"{fase}_s"])
+                 for fase in ("agregacao", "montagem", "serializacao")]
+        df = pd.concat([df, *fases], ignore_index=True)
+    df["backend"] = df["backend"].fillna("pandas") if "backend" in df else "pandas"  # resultados antigos
+    df["aproximado"] = df["aproximado"].fillna(False) if "aproximado" in df else False
+    colunas = ["csv", "modo", "backend", "aproximado"]
+    por_rep = df.groupby([*colunas, "etapa", "repeticao"], dropna=False)["segundos"].sum()
+    return por_rep.groupby([*colunas, "etapa"]).median().unstack(colunas)
+
+
+def comparar(base: str, atual: str):
+    """Razão atual/base das medianas por etapa (> 1 = mais lento)."""
+    ler = lambda p: resumo([json.loads(l) for l in open(p, encoding="utf-8")])
+    a, b = ler(base), ler(atual)
+    razao = (b / a).round(2)
+    print(pd.concat({"base_s": a.round(4), "atual_s": b.round(4), "razao": razao}, axis=1).to_string())
+
+
+def contexto_rodada() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(APP)).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {"rodada": time.strftime("%Y%m%dT%H%M%S"), "git": rev, "python": platform.python_version(),
+            "pandas": pd.__version__, "cpus": os.cpu_count()}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Mede cada etapa do dashboard em CSVs de vendas sintéticos.")
+    ap.add_argument("--linhas", type=int, nargs="*", default=[], help="tamanhos a gerar (ex.: 10000 1000000)")
+    ap.add_argument("--csv", nargs="*", default=[], help="CSVs já existentes a medir")
+    ap.add_argument("--modo", default="auto", choices=["auto", "memoria", "streaming"])
+    ap.add_argument("--backend", default="pandas", choices=["pandas", "duckdb", "sqlite"])
+    ap.add_argument("--aproximado", action="store_true", help="modo aproximado (sketches HLL/t-digest)")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--dados", default=tempfile.gettempdir(), help="pasta dos CSVs gerados")
+    ap.add_argument("--saida", default="bench_output.jsonl", help="arquivo JSON Lines de resultados")
+    ap.add_argument("--comparar", nargs=2, metavar=("BASE", "ATUAL"), help="compara dois arquivos de resultados")
+    args = ap.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+    logging.disable(logging.WARNING)  # avisos do modo bare do Streamlit
+    warnings.filterwarnings("ignore", category=UserWarning, module="folium")
+
+    csvs = list(args.csv)
+    for n in args.linhas:
+        caminho = os.path.join(args.dados, f"vendas_sinteticas_{n}.csv")
+        if not os.path.exists(caminho):
+            print(f"gerando {caminho} ...", file=sys.stderr)
+            gerar(n, caminho)
+        csvs.append(caminho)
+    if not csvs:
+        ap.error("informe --linhas e/ou --csv")
+
+    contexto = contexto_rodada()
+    registros = []
+    with open(args.saida, "a", encoding="utf-8") as out:
+        for caminho in csvs:
+            print(f"medindo {caminho} ({args.modo}, {args.backend}{', aproximado' if args.aproximado else ''}) ...",
+                  file=sys.stderr)
+            novos = rodar_csv(caminho, args.modo, args.backend, args.repeticoes, contexto, args.aproximado)
+            out.writelines(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in novos)
+            registros += novos
+    print(resumo(registros).round(4).to_string())
+
+
+if __name__ == "__main__":
+    main()
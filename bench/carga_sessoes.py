@@ -0,0 +1,288 @@
+# ------------------------------------------------------------
+# Teste de carga — várias sessões simultâneas num servidor Streamlit
+# ------------------------------------------------------------
+# Uso:
+#   python bench/carga_sessoes.py --sessoes 1 4 16 32 --duracao 30 --saida carga.jsonl
+#   python bench/carga_sessoes.py --linhas 1000000 --sessoes 8 --secoes --result-cache-mb 0
+#   python bench/carga_sessoes.py --url ws://127.0.0.1:8501 --pid 12345 --sessoes 4 16
+#
+# Sobe `streamlit run streamlit_app_v1.py` headless (ou usa um servidor já no ar via
+# `--url`) e abre N sessões pelo mesmo websocket do navegador (`/_stcore/stream`,
+# mensagens protobuf BackMsg/ForwardMsg). Cada sessão abre a página e, até o fim da
+# janela de `--duracao`, troca um filtro aleatório (um selectbox ou o período) após uma
+# pausa e espera o script terminar antes da próxima troca, como um usuário. Para cada
+# nível de concorrência registra a latência dos reruns (p50/p90/p99), a vazão
+# (reruns/s) e a memória residente do processo do servidor, uma linha JSON por nível.
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from bench_dashboard import APP, RAIZ, contexto_rodada
+from gerar_vendas import gerar
+
+FIM_OK = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR)  # fim do rerun
+PROB_TODOS = 0.3  # chance de uma troca voltar o filtro para "(Todos)" / período inteiro
+
+
+class Sessao:
+    """Uma aba do navegador: websocket próprio, valores dos widgets e latências dos reruns."""
+
+    def __init__(self, url: str, rng: random.Random, secoes: bool):
+        self.url = url
+        self.rng = rng
+        self.secoes = secoes
+        self.ws = None
+        self.widgets: dict = {}  # rótulo ou key -> (tipo, proto) do último rerun
+        self.valores: dict = {}  # rótulo ou key -> (id do widget, campo do WidgetState, valor)
+        self.latencias: list = []
+        self.erros = 0
+
+    async def abrir(self) -> float:
+        """Conecta e carrega a página; retorna a latência da primeira execução."""
+        try:
+            import websockets
+        except ImportError as e:
+            raise ImportError("o teste de carga requer o pacote websockets:  pip install websockets") from e
+        self.ws = await websockets.connect(f"{self.url}/_stcore/stream", subprotocols=["streamlit"],
+                                           max_size=None, ping_interval=None)
+        latencia = await self.rerun()
+        if self.secoes:  # abre as seções de gráficos (toggles `secao_*`), como quem rola a página
+            for nome, (tipo, w) in self.widgets.items():
+                if tipo == "checkbox" and nome.startswith("secao_"):
+                    self.valores[nome] = (w.id, "bool_value", True)
+        return latencia
+
+    async def fechar(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self) -> float:
+        """Envia os valores atuais dos widgets e espera o fim do script; retorna os segundos."""
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        for id_, campo, valor in self.valores.values():
+            estado = msg.rerun_script.widget_states.widgets.add()
+            estado.id = id_
+            if campo == "string_array_value":
+                estado.string_array_value.data.extend(valor)
+            else:
+                setattr(estado, campo, valor)
+        widgets = {}
+        t0 = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            tipo = fwd.WhichOneof("type")
+            if tipo == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                elemento = fwd.delta.new_element
+                tipo_el = elemento.WhichOneof("type")
+                if tipo_el in ("selectbox", "date_input", "checkbox"):
+                    w = getattr(elemento, tipo_el)
+                    chave = w.id.rsplit("-", 1)[-1]  # key do widget ("None" sem key)
+                    widgets[w.label if chave == "None" else chave] = (tipo_el, w)
+                elif tipo_el == "exception":
+                    self.erros += 1
+            elif tipo == "script_finished" and fwd.script_finished in FIM_OK:
+                self.erros += fwd.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR
+                break
+        latencia = time.perf_counter() - t0
+        self.widgets = widgets
+        # Widget recriado (ex.: opções de município mudam com o estado) volta ao padrão, como no navegador
+        ids = {w.id for _, w in widgets.values()}
+        self.valores = {nome: v for nome, v in self.valores.items() if v[0] in ids}
+        return latencia
+
+    def trocar_filtro(self):
+        """Escolhe um filtro ao acaso (selectbox ou período) e um novo valor para ele."""
+        filtros = [(nome, tipo, w) for nome, (tipo, w) in self.widgets.items() if tipo != "checkbox"]
+        nome, tipo, w = self.rng.choice(filtros)
+        todos = self.rng.random() < PROB_TODOS
+        if tipo == "selectbox":
+            self.valores[nome] = (w.id, "string_value", w.options[0] if todos else self.rng.choice(w.options))
+            return
+        ini, fim = (dt.date.fromisoformat(d) for d in w.default)  # padrão = período inteiro dos dados
+        if not todos and fim > ini:
+            a, b = sorted(self.rng.sample(range((fim - ini).days + 1), 2))
+            ini, fim = ini + dt.timedelta(days=a), ini + dt.timedelta(days=b)
+        self.valores[nome] = (w.id, "string_array_value", [ini.isoformat(), fim.isoformat()])
+
+    async def interagir(self, ate: float, pausa: float):
+        while time.perf_counter() < ate:
+            await asyncio.sleep(self.rng.uniform(0, pausa))
+            self.trocar_filtro()
+            self.latencias.append(await self.rerun())
+
+
+def memoria_mb(pid: int | None) -> tuple:
+    """(residente, pico residente) em MB do processo `pid`, lidos de /proc (Linux); senão None."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            campos = dict(linha.split(":", 1) for linha in f if ":" in linha)
+        return tuple(int(campos[c].split()[0]) / 1024 for c in ("VmRSS", "VmHWM"))
+    except (OSError, KeyError, ValueError, TypeError):
+        return None, None
+
+
+async def rodar_nivel(url: str, pid: int | None, n: int, duracao: float, pausa: float, secoes: bool,
+                      seed: int) -> dict:
+    """N sessões simultâneas durante `duracao` segundos; retorna o resumo do nível."""
+    sessoes = [Sessao(url, random.Random(seed * 1000 + i), secoes) for i in range(n)]
+    amostras = []
+
+    async def amostrar_memoria():
+        while True:
+            amostras.append(memoria_mb(pid)[0])
+            await asyncio.sleep(0.25)
+
+    monitor = asyncio.create_task(amostrar_memoria())
+    try:
+        aberturas = await asyncio.gather(*(s.abrir() for s in sessoes))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(s.interagir(t0 + duracao, pausa) for s in sessoes))
+        decorrido = time.perf_counter() - t0
+    finally:
+        monitor.cancel()
+        await asyncio.gather(*(s.fechar() for s in sessoes))
+    latencias = np.array([lat for s in sessoes for lat in s.latencias]) * 1000
+    p50, p90, p99 = np.percentile(latencias, [50, 90, 99]) if len(latencias) else (np.nan,) * 3
+    rss, pico = memoria_mb(pid)
+    amostras = [a for a in amostras if a is not None]
+    return {
+        "sessoes": n, "reruns": len(latencias), "erros": sum(s.erros for s in sessoes),
+        "abertura_p50_ms": round(float(np.median(aberturas)) * 1000, 1),
+        "p50_ms": round(float(p50), 1), "p90_ms": round(float(p90), 1), "p99_ms": round(float(p99), 1),
+        "max_ms": round(float(latencias.max()), 1) if len(latencias) else None,
+        "reruns_por_s": round(len(latencias) / decorrido, 2),
+        "rss_mb": round(rss, 1) if rss is not None else None,
+        "rss_nivel_max_mb": round(max(amostras), 1) if amostras else None,
+        "rss_pico_mb": round(pico, 1) if pico is not None else None,
+    }
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(csv_path: str, cache_dir: str, env_extra: dict, log_path: str) -> tuple:
+    """Sobe o app headless numa porta livre e espera o health check; retorna `(processo, url)`."""
+    porta = porta_livre()
+    env = {**os.environ, "VENDAS_CSV": csv_path, "VENDAS_CACHE_DIR": cache_dir, "VENDAS_AUTO_REFRESH": "0",
+           **env_extra}
+    cmd = [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+           "--server.port", str(porta), "--browser.gatherUsageStats", "false"]
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(cmd, cwd=RAIZ, env=env, stdout=log, stderr=subprocess.STDOUT)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proc.poll() is not None:
+            raise RuntimeError(f"o servidor Streamlit saiu com código {proc.returncode} (ver {log_path})")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{porta}/_stcore/health", timeout=1):
+                return proc, f"ws://127.0.0.1:{porta}"
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"o servidor Streamlit não respondeu em 60 s (ver {log_path})")
+
+
+async def rodar_carga(url: str, pid: int | None, niveis: list, duracao: float, pausa: float, secoes: bool,
+                      seed: int, contexto: dict) -> list:
+    """Aquece o servidor com uma sessão e mede cada nível de concorrência.
+
+    O aquecimento paga a carga do dataset e, com `secoes`, os imports e a primeira
+    montagem dos gráficos; seu tempo vai para `abertura_fria_s`, fora dos percentis.
+    """
+    aquecimento = Sessao(url, random.Random(seed), secoes)
+    try:
+        fria = await aquecimento.abrir()
+        if secoes:
+            fria += await aquecimento.rerun()
+        contexto = {**contexto, "abertura_fria_s": round(fria, 3)}
+    finally:
+        await aquecimento.fechar()
+    registros = []
+    for n in niveis:
+        print(f"{n} sessões por {duracao:g}s ...", file=sys.stderr)
+        registros.append({**contexto, **await rodar_nivel(url, pid, n, duracao, pausa, secoes, seed)})
+    return registros
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga do dashboard com sessões Streamlit simultâneas.")
+    ap.add_argument("--sessoes", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="níveis de concorrência")
+    ap.add_argument("--duracao", type=float, default=20, help="segundos de interação por nível")
+    ap.add_argument("--pausa", type=float, default=1.0, help="pausa máxima (s) entre trocas de filtro de uma sessão")
+    ap.add_argument("--secoes", action="store_true", help="sessões abrem as seções de gráficos (não só os KPIs)")
+    ap.add_argument("--linhas", type=int, default=None, help="CSV sintético com este nº de linhas")
+    ap.add_argument("--csv", default=None, help="CSV a servir (padrão vendas_dashboard.csv)")
+    ap.add_argument("--modo", default="auto", choices=["auto", "memoria", "streaming"])
+    ap.add_argument("--backend", default="pandas", choices=["pandas", "duckdb", "sqlite"])
+    ap.add_argument("--aproximado", action="store_true", help="modo aproximado (sketches HLL/t-digest)")
+    ap.add_argument("--result-cache-mb", type=float, default=None, help="VENDAS_RESULT_CACHE_MB do servidor (0 desliga)")
+    ap.add_argument("--url", default=None, help="servidor já no ar (ex.: ws://127.0.0.1:8501) em vez de subir um")
+    ap.add_argument("--pid", type=int, default=None, help="com --url: processo do servidor para medir a memória")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--dados", default=tempfile.gettempdir(), help="pasta dos CSVs gerados")
+    ap.add_argument("--saida", default="carga_sessoes.jsonl", help="arquivo JSON Lines de resultados")
+    args = ap.parse_args()
+
+    csv_path = os.path.abspath(args.csv or os.path.join(RAIZ, "vendas_dashboard.csv"))
+    if args.linhas:
+        csv_path = os.path.join(args.dados, f"vendas_sinteticas_{args.linhas}.csv")
+        if not os.path.exists(csv_path):
+            print(f"gerando {csv_path} ...", file=sys.stderr)
+            gerar(args.linhas, csv_path)
+    env = {"VENDAS_MODE": args.modo, "VENDAS_BACKEND": args.backend,
+           "VENDAS_APROXIMADO": "1" if args.aproximado else "0"}
+    if args.result_cache_mb is not None:
+        env["VENDAS_RESULT_CACHE_MB"] = f"{args.result_cache_mb:g}"
+    contexto = {**contexto_rodada(), "duracao_s": args.duracao, "pausa_s": args.pausa, "secoes": args.secoes}
+    if args.url:
+        contexto.update(servidor=args.url)
+    else:
+        contexto.update(csv=os.path.basename(csv_path), bytes_csv=os.path.getsize(csv_path), modo=args.modo,
+                        backend=args.backend, aproximado=args.aproximado,
+                        result_cache_mb=args.result_cache_mb)
+
+    proc, cache_dir = None, tempfile.mkdtemp(prefix="vendas_carga_cache_")
+    try:
+        url, pid = args.url, args.pid
+        if url is None:
+            proc, url = iniciar_servidor(csv_path, cache_dir, env, os.path.join(cache_dir, "streamlit.log"))
+            pid = proc.pid
+        registros = asyncio.run(rodar_carga(url, pid, args.sessoes, args.duracao, args.pausa, args.secoes,
+                                            args.seed, contexto))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    with open(args.saida, "a", encoding="utf-8") as out:
+        out.writelines(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in registros)
+    colunas = ["reruns", "erros", "abertura_p50_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms", "reruns_por_s",
+               "rss_mb", "rss_nivel_max_mb"]
+    print(f"abertura fria: {registros[0]['abertura_fria_s']:.2f}s")
+    print(pd.DataFrame(registros).set_index("sessoes")[colunas].to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# ------------------------------------------------------------
+# Gerador de vendas sintéticas — mesmo esquema de vendas_dashboard.csv
+# ------------------------------------------------------------
+# Uso:  python bench/gerar_vendas.py --linhas 1000000 --saida /tmp/vendas_1m.csv
+#
+# Mesmo delimitador (`;`), colunas e formatos do CSV original. As cardinalidades de
+# clientes, lojas e vendedores crescem com o volume, como numa rede de lojas real;
+# os municípios são os de `vendas_engine.STATE_CITY_LATLON` (com o estado correto), opcionalmente
+# acrescidos de municípios sem geocódigo.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vendas_engine import STATE_CITY_LATLON
+
+COLUNAS = [
+    "id_venda", "data_venda", "nome_vendedor", "nome_cliente", "municipio", "bairro", "loja",
+    "quantidade_vendida", "preco_unitario", "preco_total", "categoria_produto", "venda_parcelada",
+    "categoria_cliente", "data_entrega_prevista", "estado",
+]
+
+# Municípios de cada estado: os geocodificados do motor (uma única fonte)
+CIDADES_POR_ESTADO = {estado: list(cidades) for estado, cidades in STATE_CITY_LATLON.items()}
+
+BAIRROS = [
+    "Areão", "Boa Esperança", "Boa Vista", "CPA I", "CPA II", "Centro", "Coxipó", "Industrial",
+    "Jardim América", "Jardim Atlântico", "Jardim Europa", "Residencial Norte", "Residencial Sul",
+    "Vila Alta", "Vila Aurora",
+]
+
+# Categoria -> (mediana do preço unitário em R$, dispersão log-normal)
+CATEGORIAS = {
+    "Eletrodomésticos": (1200.0, 0.5), "Eletrônicos": (1400.0, 0.5), "Escritório": (90.0, 0.8),
+    "Esporte": (150.0, 0.8), "Informática": (1500.0, 0.4), "Móveis": (900.0, 0.6),
+    "Papelaria": (25.0, 0.9), "Utilidades Domésticas": (80.0, 0.8),
+}
+
+PRENOMES = [
+    "Ana", "André", "Beatriz", "Bruna", "Bruno", "Carlos", "Cristina", "Daniela", "Eduardo", "Fabiana",
+    "Felipe", "Fernanda", "Fábio", "Gustavo", "Helena", "Juliana", "Lucas", "Luana", "Marcos", "Marina",
+    "Patrícia", "Paulo", "Rafael", "Ricardo", "Roberto", "Tatiane", "Vanessa", "Vinícius", "Ítalo", "Larissa",
+]
+SOBRENOMES = [
+    "Alves", "Andrade", "Bezerra", "Carvalho", "Castro", "Costa", "Dias", "Duarte", "Fernandes", "Ferreira",
+    "Freitas", "Gomes", "Lima", "Martins", "Melo", "Moura", "Nogueira", "Nunes", "Oliveira", "Pereira",
+    "Ribeiro", "Rocha", "Souza", "Torres", "Barbosa", "Cardoso", "Mendes", "Pinto", "Ramos", "Teixeira",
+]
+
+
+def nomes(n: int, rng: np.random.Generator) -> np.ndarray:
+    """`n` nomes distintos "Prenome Sobrenome [Sobrenome]" (numerados além das combinações)."""
+    simples = [f"{p} {s}" for p in PRENOMES for s in SOBRENOMES]
+    compostos = [f"{p} {s1} {s2}" for p in PRENOMES for s1 in SOBRENOMES for s2 in SOBRENOMES if s1 != s2]
+    base = np.array(simples + compostos, dtype=object)
+    rng.shuffle(base)
+    if n <= len(base):
+        return base[:n]
+    extra = np.arange(n - len(base)) // len(base) + 2
+    return np.concatenate([base, base[np.arange(n - len(base)) % len(base)] + " " + extra.astype(str)])
+
+
+def nome_loja(i: int) -> str:
+    """Loja A, ..., Loja Z, Loja AA, ... (mesmo padrão do CSV original)."""
+    letras = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        letras = chr(ord("A") + r) + letras
+    return f"Loja {letras}"
+
+
+def cardinalidades(linhas: int) -> dict:
+    """Nº de clientes, lojas e vendedores para um volume de vendas."""
+    lojas = int(np.clip(linhas // 250_000, 4, 400))
+    return {
+        "clientes": int(np.clip(linhas // 8, 95, 2_000_000)),
+        "lojas": lojas,
+        "vendedores": int(np.clip(4 * lojas, 15, 2_000)),
+    }
+
+
+class Universo:
+    """Dimensões fixas de uma geração (clientes, lojas, vendedores, municípios)."""
+
+    def __init__(self, linhas: int, municipios_extra: int, rng: np.random.Generator):
+        card = cardinalidades(linhas)
+        self.clientes = nomes(card["clientes"], rng)
+        self.nivel_cliente = rng.choice(["bronze", "prata", "ouro"], size=len(self.clientes), p=[0.6, 0.3, 0.1])
+        # Popularidade dos clientes com cauda longa (Zipf truncada)
+        peso = 1.0 / np.arange(1, len(self.clientes) + 1) ** 0.8
+        self.p_cliente = peso / peso.sum()
+        self.lojas = np.array([nome_loja(i) for i in range(card["lojas"])], dtype=object)
+        self.vendedores = nomes(card["vendedores"], np.random.default_rng(rng.integers(1 << 32)))
+        self.loja_vendedor = rng.integers(0, len(self.lojas), size=len(self.vendedores))
+        cidades = [(c, e) for e, lista in CIDADES_POR_ESTADO.items() for c in lista]
+        estados = list(CIDADES_POR_ESTADO)
+        cidades += [(f"{estados[i % len(estados)]} — Município {i + 1}", estados[i % len(estados)])
+                    for i in range(municipios_extra)]
+        self.municipios = np.array([c for c, _ in cidades], dtype=object)
+        self.estado_municipio = np.array([e for _, e in cidades], dtype=object)
+        peso = 1.0 / np.arange(1, len(cidades) + 1) ** 0.6
+        self.p_municipio = peso / peso.sum()
+        self.categorias = np.array(list(CATEGORIAS), dtype=object)
+        self.preco_mediana = np.array([m for m, _ in CATEGORIAS.values()])
+        self.preco_sigma = np.array([s for _, s in CATEGORIAS.values()])
+
+
+def bloco(u: Universo, inicio_id: int, n: int, data_ini: pd.Timestamp, dias: int,
+          rng: np.random.Generator) -> pd.DataFrame:
+    """`n` vendas sintéticas a partir de `inicio_id` (colunas e formatos do CSV original)."""
+    cli = rng.choice(len(u.clientes), size=n, p=u.p_cliente)
+    vend = rng.integers(0, len(u.vendedores), size=n)
+    mun = rng.choice(len(u.municipios), size=n, p=u.p_municipio)
+    cat = rng.integers(0, len(u.categorias), size=n)
+    qtd = np.minimum(rng.geometric(0.55, size=n), 10)
+    preco_unit = np.round(np.maximum(u.preco_mediana[cat] * rng.lognormal(0.0, u.preco_sigma[cat]), 1.0), 2)
+    preco_total = np.round(qtd * preco_unit, 2)
+    data = data_ini + pd.to_timedelta(rng.integers(0, dias, size=n), unit="D")
+    entrega = data + pd.to_timedelta(rng.integers(1, 13, size=n), unit="D")
+    parcelada = rng.random(n) < np.where(preco_total > 500, 0.8, 0.35)
+    return pd.DataFrame({
+        "id_venda": np.arange(inicio_id, inicio_id + n),
+        "data_venda": data.strftime("%Y-%m-%d"),
+        "nome_vendedor": u.vendedores[vend],
+        "nome_cliente": u.clientes[cli],
+        "municipio": u.municipios[mun],
+        "bairro": np.array(BAIRROS, dtype=object)[rng.integers(0, len(BAIRROS), size=n)],
+        "loja": u.lojas[u.loja_vendedor[vend]],
+        "quantidade_vendida": qtd,
+        "preco_unitario": preco_unit,
+        "preco_total": preco_total,
+        "categoria_produto": u.categorias[cat],
+        "venda_parcelada": np.where(parcelada, "sim", "não"),
+        "categoria_cliente": u.nivel_cliente[cli],
+        "data_entrega_prevista": entrega.strftime("%Y-%m-%d"),
+        "estado": u.estado_municipio[mun],
+    }, columns=COLUNAS)
+
+
+def gerar(linhas: int, saida: str, seed: int = 42, inicio: str = "2024-01-01", dias: int = 730,
+          municipios_extra: int = 0, chunk: int = 1_000_000) -> str:
+    """Grava `linhas` vendas sintéticas em `saida` (em blocos; memória limitada a `chunk` linhas)."""
+    rng = np.random.default_rng(seed)
+    u = Universo(linhas, municipios_extra, rng)
+    data_ini = pd.Timestamp(inicio)
+    with open(saida, "w", encoding="utf-8", newline="") as fh:
+        for ini in range(0, linhas, chunk):
+            df = bloco(u, ini + 1, min(chunk, linhas - ini), data_ini, dias, rng)
+            df.to_csv(fh, sep=";", index=False, header=ini == 0, float_format="%.2f", lineterminator="\n")
+    return saida
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera um CSV de vendas sintético no esquema de vendas_dashboard.csv.")
+    ap.add_argument("--linhas", type=int, required=True, help="nº de vendas (ex.: 10000 a 50000000)")
+    ap.add_argument("--saida", required=True, help="arquivo CSV de saída")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--inicio", default="2024-01-01", help="primeira data de venda (AAAA-MM-DD)")
+    ap.add_argument("--dias", type=int, default=730, help="período coberto pelas vendas, em dias")
+    ap.add_argument("--municipios-extra", type=int, default=0, help="municípios adicionais sem geocódigo")
+    ap.add_argument("--chunk", type=int, default=1_000_000, help="linhas geradas por bloco")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    gerar(args.linhas, args.saida, args.seed, args.inicio, args.dias, args.municipios_extra, args.chunk)
+    print(f"{args.linhas} vendas em {args.saida} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,32 +12,67 @@
 # ------------------------------------------------------------
 
 import os
-import math
+import json
+import time
+import importlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+import numpy as np
 import pandas as pd
 import streamlit as st
-import plotly.express as px
+from plotly.colors import qualitative as cores
 
-# Folium opcional (o app funciona sem ele)
-try:
-    import folium
-    from streamlit_folium import st_folium
-    HAS_FOLIUM = True
-except Exception:
-    HAS_FOLIUM = False
+from vendas_engine import (
+    CACHE_DIR, PLOT_MAX_POINTS, RESULT_CACHE_MB, RESULT_CACHE_TTL_S, SERIE_LOOKBACK_DIAS,
+    Rollup, Tracer, NullTracer,
+    load_dataset, cached_rollup, daily_series, filter_key, result_cache, deep_nbytes, memory_report, all_rows,
+    compute_kpis, fmt_currency, fmt_currency_series,
+    faturamento_por_cliente, faturamento_por_vendedor, quantidade_por_categoria, faturamento_por_loja,
+    vendas_por_mes, top_clientes, top_vendedores, faturamento_por_estado, vendas_por_parcelamento,
+    faturamento_por_estado_municipio, faturamento_mensal_por_categoria, distribuicao_ticket,
+    boxplot_preco_por_categoria, dispersao_qtd_preco, geo_faturamento,
+    media_movel_faturamento, comparativo_mensal,
+)
+
+class _ImportSobDemanda:
+    """Módulo importado apenas no primeiro uso de um atributo (ex.: `px.bar`).
+
+    `plotly.express`, `folium` e `streamlit_folium` somam cerca de 1 s de import, e as
+    classes de `plotly.graph_objects`/`plotly.io` são carregadas no primeiro `go.Figure`
+    ou `pio.from_json`; com as seções sob demanda a primeira página (só KPIs) não paga
+    esse custo.
+    """
+
+    def __init__(self, nome: str):
+        self._nome = nome
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._nome), attr)  # `import_module` é seguro entre threads
+
+
+px = _ImportSobDemanda("plotly.express")
+go = _ImportSobDemanda("plotly.graph_objects")
+pio = _ImportSobDemanda("plotly.io")
+
+# Folium opcional (o app funciona sem ele) — só verifica a instalação; o import fica para o mapa
+HAS_FOLIUM = all(importlib.util.find_spec(m) is not None for m in ("folium", "streamlit_folium"))
+folium = _ImportSobDemanda("folium")
+streamlit_folium = _ImportSobDemanda("streamlit_folium")
 
 st.set_page_config(page_title="Dashboard de Vendas — APP3", page_icon="📊", layout="wide")
 
 # Paletas variadas (cores diferentes entre gráficos)
 PALETTES = {
-    "bar": px.colors.qualitative.Set2,
-    "bar_alt": px.colors.qualitative.Plotly,
-    "pie": px.colors.qualitative.Pastel,
-    "area": px.colors.qualitative.Vivid,
-    "line": px.colors.qualitative.Safe,
-    "stacked": px.colors.qualitative.Dark24,
-    "hist": px.colors.qualitative.Antique,
-    "box": px.colors.qualitative.Bold,
-    "treemap": px.colors.qualitative.Prism,
+    "bar": cores.Set2,
+    "bar_alt": cores.Plotly,
+    "pie": cores.Pastel,
+    "area": cores.Vivid,
+    "line": cores.Safe,
+    "stacked": cores.Dark24,
+    "hist": cores.Antique,
+    "box": cores.Bold,
+    "treemap": cores.Prism,
 }
 
 # Cores únicas solicitadas
@@ -45,105 +80,92 @@ LIGHT_BLUE  = "#66B3FF"  # azul claro
 LIGHT_GREEN = "#7ED957"  # verde claro
 LIGHT_GRAY  = "#D3D3D3"  # cinza claro
 
-# ------------------------------------------------------------
-# Geocódigos aproximados (lat, lon) — cidades comuns no dataset
-# ------------------------------------------------------------
-CITY_LATLON = {
-    # SP
-    "São Paulo": (-23.5505, -46.6333), "Campinas": (-22.9056, -47.0608),
-    "Sorocaba": (-23.5015, -47.4526), "Ribeirão Preto": (-21.1775, -47.8103),
-    "São José dos Campos": (-23.2237, -45.9009),
-    # RJ
-    "Rio de Janeiro": (-22.9068, -43.1729), "Niterói": (-22.8832, -43.1034),
-    "Campos dos Goytacazes": (-21.7622, -41.3181), "Volta Redonda": (-22.5200, -44.0996),
-    # MG
-    "Belo Horizonte": (-19.9167, -43.9345), "Uberlândia": (-18.9113, -48.2622),
-    "Contagem": (-19.9317, -44.0533), "Juiz de Fora": (-21.7619, -43.3496),
-    # RS
-    "Porto Alegre": (-30.0346, -51.2177), "Caxias do Sul": (-29.1678, -51.1794),
-    "Pelotas": (-31.7654, -52.3371), "Santa Maria": (-29.6842, -53.8069),
-    # SC
-    "Florianópolis": (-27.5949, -48.5482), "Joinville": (-26.3045, -48.8487),
-    "Blumenau": (-26.9173, -49.0661), "Chapecó": (-27.1004, -52.6152),
-    # PR
-    "Curitiba": (-25.4284, -49.2733), "Londrina": (-23.3045, -51.1696),
-    "Maringá": (-23.4205, -51.9333), "Cascavel": (-24.9555, -53.4552),
-    # MT
-    "Cuiabá": (-15.6010, -56.0974), "Várzea Grande": (-15.6467, -56.1322),
-    "Rondonópolis": (-16.4708, -54.6356), "Sinop": (-11.8642, -55.5030),
-    "Tangará da Serra": (-14.6225, -57.4850), "Lucas do Rio Verde": (-13.0559, -55.9199),
-    "Sorriso": (-12.5420, -55.7211), "Barra do Garças": (-15.8931, -52.2569),
-    # MS
-    "Campo Grande": (-20.4697, -54.6201), "Dourados": (-22.2211, -54.8056),
-    "Três Lagoas": (-20.7849, -51.7004), "Corumbá": (-19.0077, -57.6510),
-    # PA
-    "Belém": (-1.4558, -48.4902), "Ananindeua": (-1.3650, -48.3720),
-    "Marabá": (-5.3803, -49.1327), "Santarém": (-2.4390, -54.7009),
-    # AM
-    "Manaus": (-3.1190, -60.0217), "Itacoatiara": (-3.1386, -58.4449),
-    "Parintins": (-2.6283, -56.7358),
-    # GO
-    "Goiânia": (-16.6869, -49.2648), "Anápolis": (-16.3281, -48.9534),
-    "Aparecida de Goiânia": (-16.8193, -49.2473),
-    # DF
-    "Brasília": (-15.7939, -47.8828),
-    # ES
-    "Vitória": (-20.3155, -40.3128), "Vila Velha": (-20.3361, -40.2939), "Serra": (-20.1286, -40.3074),
-    # RO
-    "Porto Velho": (-8.7619, -63.9039), "Ji-Paraná": (-10.8777, -61.9321), "Ariquemes": (-9.9134, -63.0405),
-    # TO
-    "Palmas": (-10.1842, -48.3336), "Araguaína": (-7.1911, -48.2077), "Gurupi": (-11.7292, -49.0689),
-    # MA
-    "São Luís": (-2.5387, -44.2825), "Imperatriz": (-5.5185, -47.4784), "Caxias": (-4.8650, -43.3617),
-    # PI
-    "Teresina": (-5.0919, -42.8034), "Parnaíba": (-2.9059, -41.7760), "Picos": (-7.0768, -41.4679),
-    # BA
-    "Salvador": (-12.9777, -38.5016), "Feira de Santana": (-12.2664, -38.9663),
-    "Vitória da Conquista": (-14.8615, -40.8442), "Ilhéus": (-14.7935, -39.0460),
-    # PE
-    "Recife": (-8.0476, -34.8770), "Olinda": (-7.9993, -34.8450), "Caruaru": (-8.2835, -35.9759), "Petrolina": (-9.3891, -40.5033),
-    # CE
-    "Fortaleza": (-3.7319, -38.5267), "Caucaia": (-3.7361, -38.6535), "Juazeiro do Norte": (-7.2131, -39.3155),
-    "Sobral": (-3.6891, -40.3482),
-}
+AUTO_REFRESH_S = float(os.environ.get("VENDAS_AUTO_REFRESH", "0"))  # 0 = desligado
+
+# Gráficos montados em paralelo num pool de threads; 0 ou 1 = sequencial
+CHART_WORKERS = int(os.environ.get("VENDAS_CHART_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Diagnóstico de desempenho (spans por execução); também ativável no sidebar
+PROFILE = os.environ.get("VENDAS_PROFILE", "0") == "1"
+TRACE_DIR = os.environ.get("VENDAS_TRACE_DIR", os.path.join(CACHE_DIR, "traces"))
+
+# Seções de gráficos carregadas sob demanda (o primeiro carregamento mostra só os KPIs)
+LAZY_SECTIONS = os.environ.get("VENDAS_LAZY", "1") != "0"
 
 # ------------------------------------------------------------
-# Utilidades
+# Exibição de figuras — cache de resultados, pool de threads e spans
 # ------------------------------------------------------------
-@st.cache_data
-def load_data() -> pd.DataFrame:
-    """Carrega e higieniza o dataset fixo `vendas_dashboard.csv` (delimitador ;)"""
-    csv_path = "vendas_dashboard.csv"
-    if not os.path.exists(csv_path):
-        st.error("⚠️ Arquivo vendas_dashboard.csv não encontrado na pasta do aplicativo.")
-        st.stop()
+@st.cache_resource
+def chart_pool() -> ThreadPoolExecutor:
+    """Pool de threads do processo para montar figuras (compartilhado entre sessões)."""
+    return ThreadPoolExecutor(max_workers=CHART_WORKERS, thread_name_prefix="vendas-chart")
+
+
+def show_figure(key: str, build, vazio: str | None = None) -> None:
+    """Exibe a figura `key` do estado de filtros atual (`cache_scope`).
+
+    O JSON da figura fica no cache entre sessões; num acerto a agregação e a montagem
+    da figura são puladas. `build` pode retornar None (sem dados): nesse caso mostra o
+    aviso `vazio`, se houver.
+
+    Com `CHART_WORKERS > 1`, `build` roda no pool e a posição da figura fica reservada
+    por um `st.empty()`, preenchido por `flush_figures` na thread do script. `build`
+    não deve chamar `st.*`.
+    """
+    cache = result_cache()
+
+    def compute():
+        with tracer.span(f"build:{key}"):
+            fig = build()
+        if fig is None:
+            return ""
+        with tracer.span(f"to_json:{key}"):
+            return fig.to_json()
+
+    def figura():
+        with tracer.span(f"figura:{key}") as sp:
+            fig_json = cache.get_or_compute((*cache_scope, key), "figura", compute, len)
+            sp["payload_bytes"] = len(fig_json)
+        return fig_json
+
+    if CHART_WORKERS <= 1:
+        _render_figure(st, key, figura(), vazio)
+        return
+    _pendentes.append((st.empty(), key, vazio, chart_pool().submit(figura)))
+
+
+def flush_figures() -> None:
+    """Preenche as posições reservadas por `show_figure` à medida que cada figura fica pronta."""
+    slots = {fut: (slot, key, vazio) for slot, key, vazio, fut in _pendentes}
+    _pendentes.clear()
+    for fut in as_completed(slots):
+        slot, key, vazio = slots[fut]
+        _render_figure(slot, key, fut.result(), vazio)
+
+
+def _render_figure(alvo, key: str, fig_json: str, vazio: str | None) -> None:
+    with tracer.span(f"plotly_chart:{key}", payload_bytes=len(fig_json)) as sp:
+        if fig_json:
+            fig = pio.from_json(fig_json, skip_invalid=True)
+            if tracer.enabled:
+                sp["linhas_saida"] = _pontos(fig)
+            alvo.plotly_chart(fig, use_container_width=True, key=key)
+        elif vazio:
+            alvo.warning(vazio)
+
+
+_pendentes: list = []  # (placeholder, key, aviso, future) desta execução do script
+
+
+def _pontos(fig) -> int:
+    """Nº de pontos de dados de uma figura (soma por trace)."""
+    total = 0
+    for trace in fig.data:
+        tamanhos = [len(v) for a in ("x", "y", "values", "lat", "labels")
+                    if (v := getattr(trace, a, None)) is not None and not isinstance(v, str)]
+        total += max(tamanhos, default=1)
+    return total
 
-    df = pd.read_csv(csv_path, sep=";", encoding="utf-8")
-    # Datas e numéricos
-    df["data_venda"] = pd.to_datetime(df["data_venda"], errors="coerce")
-    if "data_entrega_prevista" in df.columns:
-        df["data_entrega_prevista"] = pd.to_datetime(df["data_entrega_prevista"], errors="coerce")
-
-    for col in ["preco_unitario", "preco_total"]:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.replace(",", ".", regex=False).astype(float)
-    if "quantidade_vendida" in df.columns:
-        df["quantidade_vendida"] = pd.to_numeric(df["quantidade_vendida"], errors="coerce").fillna(0).astype(int)
-
-    # Auxiliares
-    df["ano"] = df["data_venda"].dt.year
-    df["mes"] = df["data_venda"].dt.month
-    df["dia"] = df["data_venda"].dt.date
-    df["mes_nome"] = df["data_venda"].dt.strftime("%b")
-    return df
-
-def fmt_currency(x: float) -> str:
-    """Formata valores monetários em BRL (R$) com separador PT-BR."""
-    return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-def safe_pct(a, b) -> float:
-    """Retorna a porcentagem (0–100) de a/b com proteção para divisão por zero."""
-    return 0.0 if b == 0 else round(100.0 * a / b, 2)
 
 # ------------------------------------------------------------
 # Layout — Título e Filtros no topo
@@ -151,35 +173,56 @@ def safe_pct(a, b) -> float:
 st.title("📊 Dashboard de Vendas — APP3 (Dataset Fixo)")
 st.caption("Base: **vendas_dashboard.csv** — upload e download desabilitados.")
 
-df = load_data()
+with st.sidebar:
+    diagnostico = st.toggle("⏱️ Diagnóstico de desempenho", value=PROFILE, key="diag_perf")
+tracer = Tracer() if diagnostico else NullTracer()
+
+with tracer.span("load_data") as sp, st.spinner("Carregando dataset…"):
+    try:
+        dataset = load_dataset()
+    except FileNotFoundError:
+        st.error("⚠️ Arquivo vendas_dashboard.csv não encontrado na pasta do aplicativo.")
+        st.stop()
+    sp["linhas_saida"] = dataset.opcoes.n_vendas
+opcoes = dataset.opcoes  # opções dos filtros calculadas uma vez por versão do dataset
+
+if AUTO_REFRESH_S > 0:
+    @st.fragment(run_every=AUTO_REFRESH_S)
+    def _auto_refresh(versao: int):
+        """Verifica o CSV periodicamente e reexecuta a página se chegaram linhas novas."""
+        if load_dataset().version != versao:
+            st.rerun(scope="app")
+        st.caption(f"Atualização automática a cada {AUTO_REFRESH_S:g}s — {opcoes.n_vendas} vendas carregadas.")
+
+    _auto_refresh(dataset.version)
 
 with st.container():
     c1, c2, c3, c4 = st.columns([1, 1, 1, 2])
     with c1:
-        estados = ["(Todos)"] + sorted(df["estado"].dropna().unique().tolist())
+        estados = ["(Todos)", *opcoes.valores["estado"]]
         estado_sel = st.selectbox("Estado", estados, index=0)
         if estado_sel != "(Todos)":
-            municipios_opts = ["(Todos)"] + sorted(df.loc[df["estado"] == estado_sel, "municipio"].dropna().unique().tolist())
+            municipios_opts = ["(Todos)", *opcoes.municipios.get(estado_sel, ())]
         else:
-            municipios_opts = ["(Todos)"] + sorted(df["municipio"].dropna().unique().tolist())
+            municipios_opts = ["(Todos)", *opcoes.valores["municipio"]]
         municipio_sel = st.selectbox("Município", municipios_opts, index=0)
 
     with c2:
-        lojas_opts = ["(Todas)"] + sorted(df["loja"].dropna().unique().tolist())
+        lojas_opts = ["(Todas)", *opcoes.valores["loja"]]
         loja_sel = st.selectbox("Loja", lojas_opts, index=0)
 
-        categorias_opts = ["(Todas)"] + sorted(df["categoria_produto"].dropna().unique().tolist())
+        categorias_opts = ["(Todas)", *opcoes.valores["categoria_produto"]]
         categoria_sel = st.selectbox("Categoria", categorias_opts, index=0)
 
     with c3:
-        vendedores_opts = ["(Todos)"] + sorted(df["nome_vendedor"].dropna().unique().tolist())
+        vendedores_opts = ["(Todos)", *opcoes.valores["nome_vendedor"]]
         vendedor_sel = st.selectbox("Vendedor", vendedores_opts, index=0)
 
-        cat_cliente_opts = ["(Todas)"] + sorted(df["categoria_cliente"].dropna().unique().tolist())
+        cat_cliente_opts = ["(Todas)", *opcoes.valores["categoria_cliente"]]
         cat_cliente_sel = st.selectbox("Categoria do Cliente", cat_cliente_opts, index=0)
 
     with c4:
-        min_date, max_date = df["data_venda"].min(), df["data_venda"].max()
+        min_date, max_date = opcoes.data_min, opcoes.data_max
         data_ini, data_fim = st.date_input(
             "Período (Data da Venda)",
             (min_date.date(), max_date.date())
@@ -188,313 +231,470 @@ with st.container():
         parcelada_opts = ["(Todas)", "sim", "não"]
         parcelada_sel = st.selectbox("Venda Parcelada", parcelada_opts, index=0)
 
-# Aplicação dos filtros
-filtered = df.copy()
-if estado_sel != "(Todos)":
-    filtered = filtered[filtered["estado"] == estado_sel]
-if municipio_sel != "(Todos)":
-    filtered = filtered[filtered["municipio"] == municipio_sel]
-if loja_sel != "(Todas)":
-    filtered = filtered[filtered["loja"] == loja_sel]
-if categoria_sel != "(Todas)":
-    filtered = filtered[filtered["categoria_produto"] == categoria_sel]
-if vendedor_sel != "(Todos)":
-    filtered = filtered[filtered["nome_vendedor"] == vendedor_sel]
-if cat_cliente_sel != "(Todas)":
-    filtered = filtered[filtered["categoria_cliente"] == cat_cliente_sel]
-if parcelada_sel != "(Todas)":
-    filtered = filtered[filtered["venda_parcelada"].str.lower() == parcelada_sel]
-
-filtered = filtered[
-    (filtered["data_venda"] >= pd.to_datetime(data_ini)) &
-    (filtered["data_venda"] <= pd.to_datetime(data_fim))
-]
+# Aplicação dos filtros (índice invertido + um único take)
+selecoes = {
+    "estado": estado_sel,
+    "municipio": municipio_sel,
+    "loja": loja_sel,
+    "categoria_produto": categoria_sel,
+    "nome_vendedor": vendedor_sel,
+    "categoria_cliente": cat_cliente_sel,
+    "venda_parcelada": parcelada_sel,
+}
+result_cache().retain_version(dataset.chave)
+cache_scope = (dataset.chave, filter_key(selecoes, data_ini, data_fim))
+with (tracer.span("filtros", linhas_entrada=opcoes.n_vendas) as sp,
+      st.spinner("Processando dados em blocos…") if dataset.df is None and dataset.sql is None else nullcontext()):
+    rollup = cached_rollup(dataset, selecoes, data_ini, data_fim)
+    sp["linhas_saida"] = int(rollup.total("n_linhas"))
+filtered = rollup.rows  # no modo streaming, amostra das linhas filtradas
 
 # ------------------------------------------------------------
 # KPIs
 # ------------------------------------------------------------
 st.header("📈 KPIs")
 
-fat = filtered["preco_total"].sum() if not filtered.empty else 0.0
-n_vendas = len(filtered)
-ticket = fat / n_vendas if n_vendas > 0 else 0.0
-itens = filtered["quantidade_vendida"].sum() if "quantidade_vendida" in filtered.columns else 0
-itens_por_venda = itens / n_vendas if n_vendas > 0 else 0.0
-clientes_unicos = filtered["nome_cliente"].nunique() if "nome_cliente" in filtered.columns else 0
-parc_sim = (filtered["venda_parcelada"].str.lower() == "sim").sum() if "venda_parcelada" in filtered.columns else 0
-pct_parc = safe_pct(parc_sim, n_vendas)
-
-if "estado" in filtered.columns and n_vendas > 0:
-    por_estado = filtered.groupby("estado", as_index=False)["preco_total"].sum().sort_values("preco_total", ascending=False)
-    estado_lider = por_estado.iloc[0]["estado"]
-    part_lider = safe_pct(por_estado.iloc[0]["preco_total"], fat)
-else:
-    estado_lider, part_lider = "—", 0.0
+with tracer.span("kpis"):
+    kpis = result_cache().get_or_compute((*cache_scope, "kpis"), "kpis", lambda: compute_kpis(rollup), deep_nbytes)
+n_vendas = kpis["n_vendas"]
 
 k1, k2, k3, k4, k5, k6 = st.columns(6)
-with k1: st.metric("Faturamento", fmt_currency(fat))
+with k1: st.metric("Faturamento", fmt_currency(kpis["fat"]))
 with k2: st.metric("Nº de Vendas", f"{n_vendas}")
-with k3: st.metric("Ticket Médio", fmt_currency(ticket))
-with k4: st.metric("% Parceladas", f"{pct_parc:.2f}%")
-with k5: st.metric("Estado Líder", f"{estado_lider} — {part_lider:.2f}%")
-with k6: st.metric("Clientes Únicos / Itens/Venda", f"{clientes_unicos} / {itens_por_venda:.2f}")
+with k3: st.metric("Ticket Médio", fmt_currency(kpis["ticket"]))
+with k4: st.metric("% Parceladas", f"{kpis['pct_parc']:.2f}%")
+with k5: st.metric("Estado Líder", f"{kpis['estado_lider']} — {kpis['part_lider']:.2f}%")
+with k6:
+    if rollup.aprox is not None:  # modo aproximado: clientes únicos estimados por HyperLogLog
+        st.metric("Clientes Únicos / Itens/Venda", f"≈{kpis['clientes_unicos']} / {kpis['itens_por_venda']:.2f}",
+                  help=f"Clientes únicos estimados (erro padrão de ±{rollup.aprox.erro_distintos:.1%}).")
+    else:
+        st.metric("Clientes Únicos / Itens/Venda", f"{kpis['clientes_unicos']} / {kpis['itens_por_venda']:.2f}")
 
 st.divider()
 
 # ------------------------------------------------------------
 # Funções de gráficos (cada uma com docstring)
 # ------------------------------------------------------------
-def chart_vendas_por_cliente(df_plot: pd.DataFrame):
+def chart_vendas_por_cliente(rollup: Rollup):
     """Barra: Faturamento total por cliente no período/recorte filtrado."""
-    base = df_plot.groupby("nome_cliente", as_index=False)["preco_total"].sum().sort_values("preco_total", ascending=False)
-    fig = px.bar(base, x="nome_cliente", y="preco_total",
-                 color="nome_cliente", color_discrete_sequence=PALETTES["bar"],
-                 labels={"preco_total": "Faturamento (R$)", "nome_cliente": "Cliente"},
-                 title="Faturamento por Cliente")
-    fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
-    st.plotly_chart(fig, use_container_width=True, key="app3_clientes")
+    def build():
+        base = faturamento_por_cliente(rollup)
+        fig = px.bar(base, x="nome_cliente", y="preco_total",
+                     color="nome_cliente", color_discrete_sequence=PALETTES["bar"],
+                     labels={"preco_total": "Faturamento (R$)", "nome_cliente": "Cliente"},
+                     title="Faturamento por Cliente")
+        fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
+        return fig
+
+    show_figure("app3_clientes", build)
 
 
-def chart_vendas_por_vendedor(df_plot: pd.DataFrame):
+def chart_vendas_por_vendedor(rollup: Rollup):
     """Barra: Faturamento total por vendedor no período/recorte filtrado."""
-    base = df_plot.groupby("nome_vendedor", as_index=False)["preco_total"].sum().sort_values("preco_total", ascending=False)
-    fig = px.bar(
-        base, x="nome_vendedor", y="preco_total",
-        labels={"preco_total": "Faturamento (R$)", "nome_vendedor": "Vendedor"},
-        title="Faturamento por Vendedor"
-    )
-    # Cor única (azul claro)
-    fig.update_traces(marker_color=LIGHT_BLUE)
-    fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
-    st.plotly_chart(fig, use_container_width=True, key="app3_vendedores")
-
-
-def chart_categorias_qtd(df_plot: pd.DataFrame):
+    def build():
+        base = faturamento_por_vendedor(rollup)
+        fig = px.bar(
+            base, x="nome_vendedor", y="preco_total",
+            labels={"preco_total": "Faturamento (R$)", "nome_vendedor": "Vendedor"},
+            title="Faturamento por Vendedor"
+        )
+        # Cor única (azul claro)
+        fig.update_traces(marker_color=LIGHT_BLUE)
+        fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
+        return fig
+
+    show_figure("app3_vendedores", build)
+
+
+def chart_categorias_qtd(rollup: Rollup):
     """Barra: Quantidade vendida por categoria de produto."""
-    base = df_plot.groupby("categoria_produto", as_index=False)["quantidade_vendida"].sum().sort_values("quantidade_vendida", ascending=False)
-    fig = px.bar(
-        base, x="categoria_produto", y="quantidade_vendida",
-        labels={"quantidade_vendida": "Quantidade", "categoria_produto": "Categoria"},
-        title="Quantidade Vendida por Categoria"
-    )
-    # Cor única (verde claro)
-    fig.update_traces(marker_color=LIGHT_GREEN)
-    fig.update_layout(xaxis_tickangle=-30)
-    st.plotly_chart(fig, use_container_width=True, key="app3_cat_qtd")
-
-
-def chart_vendas_por_mes(df_plot: pd.DataFrame):
+    def build():
+        base = quantidade_por_categoria(rollup)
+        fig = px.bar(
+            base, x="categoria_produto", y="quantidade_vendida",
+            labels={"quantidade_vendida": "Quantidade", "categoria_produto": "Categoria"},
+            title="Quantidade Vendida por Categoria"
+        )
+        # Cor única (verde claro)
+        fig.update_traces(marker_color=LIGHT_GREEN)
+        fig.update_layout(xaxis_tickangle=-30)
+        return fig
+
+    show_figure("app3_cat_qtd", build)
+
+
+def chart_vendas_por_mes(rollup: Rollup):
     """Área: Contagem de vendas por mês e ano (série temporal agregada)."""
-    por_mes = (df_plot.assign(mes_ord=df_plot["data_venda"].dt.month)
-               .groupby(["ano", "mes_ord"], as_index=False)
-               .agg(qtd_vendas=("id_venda", "count")))
-    por_mes["mes_label"] = pd.to_datetime(por_mes["mes_ord"], format="%m").dt.strftime("%b")
-    por_mes = por_mes.sort_values(["ano", "mes_ord"])
-    fig = px.area(por_mes, x="mes_label", y="qtd_vendas", color="ano",
-                  color_discrete_sequence=PALETTES["area"],
-                  labels={"mes_label": "Mês", "qtd_vendas": "Qtd. Vendas", "ano": "Ano"},
-                  title="Quantidade de Vendas por Mês (Área)")
-    st.plotly_chart(fig, use_container_width=True, key="app3_area_mes")
-
-
-def chart_top5_clientes(df_plot: pd.DataFrame):
+    def build():
+        por_mes = vendas_por_mes(rollup)
+        fig = px.area(por_mes, x="mes_label", y="qtd_vendas", color="ano",
+                      color_discrete_sequence=PALETTES["area"],
+                      labels={"mes_label": "Mês", "qtd_vendas": "Qtd. Vendas", "ano": "Ano"},
+                      title="Quantidade de Vendas por Mês (Área)")
+        return fig
+
+    show_figure("app3_area_mes", build)
+
+
+def chart_top5_clientes(rollup: Rollup):
     """Barra: Top 5 clientes por faturamento."""
-    top = df_plot.groupby("nome_cliente", as_index=False)["preco_total"].sum().sort_values("preco_total", ascending=False).head(5)
-    fig = px.bar(top, x="nome_cliente", y="preco_total",
-                 color="nome_cliente", color_discrete_sequence=PALETTES["bar_alt"],
-                 labels={"preco_total": "Faturamento (R$)", "nome_cliente": "Cliente"},
-                 title="Top 5 Clientes por Faturamento")
-    fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
-    st.plotly_chart(fig, use_container_width=True, key="app3_top5_cli")
+    def build():
+        top = top_clientes(rollup, 5)
+        fig = px.bar(top, x="nome_cliente", y="preco_total",
+                     color="nome_cliente", color_discrete_sequence=PALETTES["bar_alt"],
+                     labels={"preco_total": "Faturamento (R$)", "nome_cliente": "Cliente"},
+                     title="Top 5 Clientes por Faturamento")
+        fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
+        return fig
 
+    show_figure("app3_top5_cli", build)
 
-def chart_top5_vendedores(df_plot: pd.DataFrame):
+
+def chart_top5_vendedores(rollup: Rollup):
     """Barra: Top 5 vendedores por faturamento."""
-    top = df_plot.groupby("nome_vendedor", as_index=False)["preco_total"].sum().sort_values("preco_total", ascending=False).head(5)
-    fig = px.bar(top, x="nome_vendedor", y="preco_total",
-                 color="nome_vendedor", color_discrete_sequence=PALETTES["bar"],
-                 labels={"preco_total": "Faturamento (R$)", "nome_vendedor": "Vendedor"},
-                 title="Top 5 Vendedores por Faturamento")
-    fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
-    st.plotly_chart(fig, use_container_width=True, key="app3_top5_vend")
+    def build():
+        top = top_vendedores(rollup, 5)
+        fig = px.bar(top, x="nome_vendedor", y="preco_total",
+                     color="nome_vendedor", color_discrete_sequence=PALETTES["bar"],
+                     labels={"preco_total": "Faturamento (R$)", "nome_vendedor": "Vendedor"},
+                     title="Top 5 Vendedores por Faturamento")
+        fig.update_layout(xaxis_tickangle=-45, yaxis_tickformat=",")
+        return fig
+
+    show_figure("app3_top5_vend", build)
 
 
-def chart_lojas_fat(df_plot: pd.DataFrame):
+def chart_lojas_fat(rollup: Rollup):
     """Barra: Faturamento total por loja."""
-    base = df_plot.groupby("loja", as_index=False)["preco_total"].sum().sort_values("preco_total", ascending=False)
-    fig = px.bar(
-        base, x="loja", y="preco_total",
-        labels={"preco_total": "Faturamento (R$)", "loja": "Loja"},
-        title="Faturamento por Loja"
-    )
-    # Cor única (cinza claro)
-    fig.update_traces(marker_color=LIGHT_GRAY)
-    fig.update_layout(yaxis_tickformat=",")
-    st.plotly_chart(fig, use_container_width=True, key="app3_lojas")
-
-
-def chart_participacao_estado(df_plot: pd.DataFrame):
+    def build():
+        base = faturamento_por_loja(rollup)
+        fig = px.bar(
+            base, x="loja", y="preco_total",
+            labels={"preco_total": "Faturamento (R$)", "loja": "Loja"},
+            title="Faturamento por Loja"
+        )
+        # Cor única (cinza claro)
+        fig.update_traces(marker_color=LIGHT_GRAY)
+        fig.update_layout(yaxis_tickformat=",")
+        return fig
+
+    show_figure("app3_lojas", build)
+
+
+def chart_participacao_estado(rollup: Rollup):
     """Pizza: Participação do faturamento por estado."""
-    base = df_plot.groupby("estado", as_index=False)["preco_total"].sum().sort_values("preco_total", ascending=False)
-    fig = px.pie(base, names="estado", values="preco_total",
-                 color_discrete_sequence=PALETTES["pie"],
-                 title="Participação do Faturamento por Estado")
-    fig.update_layout(height=650)  # aumenta altura
-    st.plotly_chart(fig, use_container_width=True, key="app3_pizza_estado")
+    def build():
+        base = faturamento_por_estado(rollup)
+        fig = px.pie(base, names="estado", values="preco_total",
+                     color_discrete_sequence=PALETTES["pie"],
+                     title="Participação do Faturamento por Estado")
+        fig.update_layout(height=650)  # aumenta altura
+        return fig
+
+    show_figure("app3_pizza_estado", build)
 
 
-def chart_parceladas_pizza(df_plot: pd.DataFrame):
+def chart_parceladas_pizza(rollup: Rollup):
     """Pizza: Distribuição de vendas parceladas vs. não parceladas."""
-    base = (
-        df_plot.assign(parcelada=df_plot["venda_parcelada"].str.lower())
-               .groupby("parcelada", as_index=False)["id_venda"].count()
-               .rename(columns={"id_venda": "vendas"})
-    )
-    fig = px.pie(base, names="parcelada", values="vendas",
-                 color_discrete_sequence=PALETTES["pie"],
-                 title="Distribuição de Vendas Parceladas")
-    fig.update_layout(height=650)  # aumenta altura
-    st.plotly_chart(fig, use_container_width=True, key="app3_pizza_parc")
-
-
-def chart_treemap_estado_municipio(df_plot: pd.DataFrame):
+    def build():
+        base = vendas_por_parcelamento(rollup)
+        fig = px.pie(base, names="parcelada", values="vendas",
+                     color_discrete_sequence=PALETTES["pie"],
+                     title="Distribuição de Vendas Parceladas")
+        fig.update_layout(height=650)  # aumenta altura
+        return fig
+
+    show_figure("app3_pizza_parc", build)
+
+
+def chart_treemap_estado_municipio(rollup: Rollup):
     """Treemap: Hierarquia Estado → Município pelo faturamento."""
-    base = df_plot.groupby(["estado", "municipio"], as_index=False)["preco_total"].sum()
-    fig = px.treemap(base, path=["estado", "municipio"], values="preco_total",
-                     color="estado", color_discrete_sequence=PALETTES["treemap"],
-                     title="Treemap — Faturamento por Estado/Município")
-    fig.update_layout(height=750)  # aumenta altura
-    st.plotly_chart(fig, use_container_width=True, key="app3_treemap")
-
-
-def chart_boxplot_preco_por_categoria(df_plot: pd.DataFrame):
-    """Boxplot: Distribuição do preço total por categoria de produto."""
-    fig = px.box(df_plot, x="categoria_produto", y="preco_total",
-                 color="categoria_produto", color_discrete_sequence=PALETTES["box"],
-                 labels={"preco_total": "Preço Total (R$)", "categoria_produto": "Categoria"},
-                 title="Boxplot — Preço Total por Categoria")
-    fig.update_layout(xaxis_tickangle=-30)
-    st.plotly_chart(fig, use_container_width=True, key="app3_box_preco_cat")
+    def build():
+        base = faturamento_por_estado_municipio(rollup)
+        fig = px.treemap(base, path=["estado", "municipio"], values="preco_total",
+                         color="estado", color_discrete_sequence=PALETTES["treemap"],
+                         title="Treemap — Faturamento por Estado/Município")
+        fig.update_layout(height=750)  # aumenta altura
+        return fig
+
+    show_figure("app3_treemap", build)
+
+
+def chart_boxplot_preco_por_categoria(rollup: Rollup):
+    """Boxplot: Distribuição do preço total por categoria de produto (quartis pré-calculados)."""
+    def build():
+        stats, outliers = boxplot_preco_por_categoria(rollup)
+        if stats.empty:
+            return None
+        fig = go.Figure()
+        for i, r in enumerate(stats.itertuples(index=False)):
+            cor = PALETTES["box"][i % len(PALETTES["box"])]
+            fig.add_trace(go.Box(x=[r.categoria_produto], q1=[r.q1], median=[r.mediana], q3=[r.q3],
+                                 lowerfence=[r.bigode_inf], upperfence=[r.bigode_sup],
+                                 name=str(r.categoria_produto), legendgroup=str(r.categoria_produto),
+                                 marker_color=cor))
+            pontos = outliers.loc[outliers["categoria_produto"] == r.categoria_produto, "preco_total"]
+            if len(pontos):
+                fig.add_trace(go.Scatter(x=[r.categoria_produto] * len(pontos), y=pontos, mode="markers",
+                                         name=str(r.categoria_produto), legendgroup=str(r.categoria_produto),
+                                         marker_color=cor, showlegend=False))
+        fig.update_layout(title="Boxplot — Preço Total por Categoria", xaxis_title="Categoria",
+                          yaxis_title="Preço Total (R$)", legend_title_text="Categoria", xaxis_tickangle=-30)
+        return fig
+
+    show_figure("app3_box_preco_cat", build, vazio="Não há preços para o boxplot no recorte filtrado.")
     st.caption("O boxplot resume a variação do preço total por categoria (mediana, quartis e possíveis outliers).")
 
 
-def chart_hist_ticket(df_plot: pd.DataFrame):
-    """Histograma: Distribuição do valor de venda (ticket) no recorte filtrado."""
-    fig = px.histogram(df_plot, x="preco_total", nbins=20,
-                       color_discrete_sequence=PALETTES["hist"],
-                       labels={"preco_total": "Preço Total (R$)"},
-                       title="Distribuição por Ticket (Preço Total por Venda)")
-    st.plotly_chart(fig, use_container_width=True, key="app3_hist_ticket")
+def chart_hist_ticket(rollup: Rollup):
+    """Histograma: Distribuição do valor de venda (ticket) no recorte filtrado (faixas calculadas no servidor)."""
+    def build():
+        base = distribuicao_ticket(rollup)
+        if base.empty:
+            return None
+        fig = px.bar(base, x="centro", y="vendas",
+                     color_discrete_sequence=PALETTES["hist"],
+                     hover_data={"inicio": ":.2f", "fim": ":.2f", "centro": False},
+                     labels={"centro": "Preço Total (R$)", "vendas": "Vendas",
+                             "inicio": "De (R$)", "fim": "Até (R$)"},
+                     title="Distribuição por Ticket (Preço Total por Venda)")
+        fig.update_traces(width=float(base["fim"].iloc[0] - base["inicio"].iloc[0]))
+        fig.update_layout(bargap=0)
+        return fig
+
+    show_figure("app3_hist_ticket", build, vazio="Não há preços para o histograma no recorte filtrado.")
     st.caption("Este histograma mostra como os valores de venda (tickets) se distribuem: concentrações indicam faixas de preço mais recorrentes.")
 
 
-def chart_stacked_area_fat_categoria_mensal(df_plot: pd.DataFrame):
+def chart_stacked_area_fat_categoria_mensal(rollup: Rollup):
     """Stacked Area: Faturamento mensal por categoria (séries empilhadas)."""
-    base = (df_plot.assign(mes_ord=df_plot["data_venda"].dt.to_period("M").astype(str))
-            .groupby(["mes_ord", "categoria_produto"], as_index=False)["preco_total"].sum())
-    base = base.sort_values("mes_ord")
-    fig = px.area(base, x="mes_ord", y="preco_total", color="categoria_produto",
-                  color_discrete_sequence=PALETTES["stacked"],
-                  labels={"mes_ord": "Mês", "preco_total": "Faturamento (R$)", "categoria_produto": "Categoria"},
-                  title="Faturamento Mensal por Categoria (Empilhado)")
-    st.plotly_chart(fig, use_container_width=True, key="app3_stack_area_cat")
-
-
-def chart_scatter_qty_vs_preco_unit(df_plot: pd.DataFrame):
-    """Scatter: Relação entre quantidade vendida e preço unitário (por categoria)."""
-    fig = px.scatter(df_plot, x="preco_unitario", y="quantidade_vendida",
-                     color="categoria_produto", size="preco_total",
-                     color_discrete_sequence=PALETTES["line"],
-                     labels={"preco_unitario": "Preço Unitário (R$)", "quantidade_vendida": "Quantidade"},
-                     title="Dispersão: Quantidade vs. Preço Unitário (tamanho ~ Preço Total)")
-    st.plotly_chart(fig, use_container_width=True, key="app3_scatter_qty_preco")
-
-
-def map_plotly_faturamento_por_cidade(df_plot: pd.DataFrame):
+    def build():
+        base = faturamento_mensal_por_categoria(rollup)
+        fig = px.area(base, x="mes_ord", y="preco_total", color="categoria_produto",
+                      color_discrete_sequence=PALETTES["stacked"],
+                      labels={"mes_ord": "Mês", "preco_total": "Faturamento (R$)", "categoria_produto": "Categoria"},
+                      title="Faturamento Mensal por Categoria (Empilhado)")
+        return fig
+
+    show_figure("app3_stack_area_cat", build)
+
+
+def chart_media_movel_faturamento(serie: pd.DataFrame, data_ini):
+    """Linha: Faturamento diário com médias móveis de 7 e 30 dias."""
+    def build():
+        base = media_movel_faturamento(serie, data_ini)
+        fig = px.line(base, x="dia", y=["preco_total", "mm7", "mm30"],
+                      color_discrete_sequence=PALETTES["line"],
+                      labels={"dia": "Dia", "value": "Faturamento (R$)", "variable": "Série"},
+                      title="Faturamento Diário e Médias Móveis (7 e 30 dias)")
+        fig.for_each_trace(lambda t: t.update(name={"preco_total": "Diário", "mm7": "Média 7d", "mm30": "Média 30d"}[t.name]))
+        fig.update_layout(yaxis_tickformat=",")
+        return fig
+
+    show_figure("app3_media_movel", build)
+
+
+def chart_comparativo_mensal(serie: pd.DataFrame, data_ini):
+    """Barra: Variação do faturamento mensal — mês contra mês anterior (MoM) e contra o mesmo mês do ano anterior (YoY)."""
+    def build():
+        base = comparativo_mensal(serie, data_ini)
+        fig = px.bar(base, x="mes", y="variacao", color="comparacao", barmode="group",
+                     color_discrete_sequence=PALETTES["bar_alt"],
+                     labels={"mes": "Mês", "variacao": "Variação (%)", "comparacao": "Comparação"},
+                     title="Faturamento Mensal — Variação MoM e YoY")
+        return fig
+
+    show_figure("app3_mom_yoy", build)
+    st.caption("MoM compara cada mês com o anterior; YoY com o mesmo mês do ano anterior (vazio quando não há histórico).")
+
+
+def chart_scatter_qty_vs_preco_unit(rollup: Rollup):
+    """Scatter: Relação entre quantidade vendida e preço unitário (por categoria).
+
+    Acima de `PLOT_MAX_POINTS` linhas usa uma amostra estratificada por categoria.
+    """
+    def build():
+        base = dispersao_qtd_preco(rollup).dropna(subset=["preco_total"])  # sem preço não há tamanho do ponto
+        if base.empty:
+            return None
+        fig = px.scatter(base, x="preco_unitario", y="quantidade_vendida",
+                         color="categoria_produto", size="preco_total",
+                         color_discrete_sequence=PALETTES["line"],
+                         labels={"preco_unitario": "Preço Unitário (R$)", "quantidade_vendida": "Quantidade"},
+                         title="Dispersão: Quantidade vs. Preço Unitário (tamanho ~ Preço Total)")
+        return fig
+
+    show_figure("app3_scatter_qty_preco", build, vazio="Não há preços para a dispersão no recorte filtrado.")
+    if rollup.total("n_linhas") > PLOT_MAX_POINTS:
+        st.caption(f"Amostra estratificada por categoria: cerca de {PLOT_MAX_POINTS} de {int(rollup.total('n_linhas'))} vendas.")
+
+
+def map_plotly_faturamento_por_cidade(rollup: Rollup):
     """Mapa Plotly: Pontos por cidade (tamanho ~ faturamento; cor = estado)."""
-    agg = (df_plot.groupby(["estado", "municipio"], as_index=False)
-           .agg(faturamento=("preco_total", "sum"), vendas=("id_venda", "count")))
-    agg["lat"] = agg["municipio"].map(lambda m: CITY_LATLON.get(str(m), (None, None))[0])
-    agg["lon"] = agg["municipio"].map(lambda m: CITY_LATLON.get(str(m), (None, None))[1])
-    agg = agg.dropna(subset=["lat", "lon"])
-    if agg.empty:
-        st.warning("Não há geocódigos disponíveis para as cidades filtradas.")
-        return
-    fig = px.scatter_mapbox(
-        agg, lat="lat", lon="lon",
-        size="faturamento", color="estado",
-        hover_name="municipio",
-        hover_data={"faturamento": ":.2f", "vendas": True, "lat": False, "lon": False},
-        zoom=3.2, height=520,
-        title="Faturamento por Cidade (Plotly Mapbox)"
-    )
-    fig.update_layout(mapbox_style="open-street-map", margin=dict(l=0, r=0, t=50, b=0))
-    st.plotly_chart(fig, use_container_width=True, key="app3_map_plotly")
-
-
-def map_folium_circles(df_plot: pd.DataFrame):
-    """Mapa Folium: Círculos proporcionais por cidade (raio ~ faturamento)."""
+    def build():
+        agg = geo_faturamento(rollup)
+        if agg.empty:
+            return None
+        fig = px.scatter_mapbox(
+            agg, lat="lat", lon="lon",
+            size="faturamento", color="estado",
+            hover_name="municipio",
+            hover_data={"faturamento": ":.2f", "vendas": True, "lat": False, "lon": False},
+            zoom=3.2, height=520,
+            title="Faturamento por Cidade (Plotly Mapbox)"
+        )
+        fig.update_layout(mapbox_style="open-street-map", margin=dict(l=0, r=0, t=50, b=0))
+        return fig
+
+    show_figure("app3_map_plotly", build, vazio="Não há geocódigos disponíveis para as cidades filtradas.")
+
+
+def map_folium_circles(rollup: Rollup):
+    """Mapa Folium: Círculos proporcionais por cidade (raio ~ faturamento) numa única camada GeoJSON."""
     if not HAS_FOLIUM:
         st.info("Instale `folium` e `streamlit-folium` para este mapa:  pip install folium streamlit-folium")
         return
-    agg = (df_plot.groupby(["estado", "municipio"], as_index=False)
-           .agg(faturamento=("preco_total", "sum"), vendas=("id_venda", "count")))
-    agg["lat"] = agg["municipio"].map(lambda m: CITY_LATLON.get(str(m), (None, None))[0])
-    agg["lon"] = agg["municipio"].map(lambda m: CITY_LATLON.get(str(m), (None, None))[1])
-    agg = agg.dropna(subset=["lat", "lon"])
+    agg = geo_faturamento(rollup)
     if agg.empty:
         st.warning("Não há geocódigos disponíveis para as cidades filtradas.")
         return
 
-    m = folium.Map(location=[-14.2350, -51.9253], zoom_start=4, tiles="CartoDB positron")
-    for _, row in agg.iterrows():
-        valor = float(row["faturamento"])
-        radius = max(4, min(30, math.sqrt(valor) / 8))  # escala suave
-        folium.CircleMarker(
-            location=[row["lat"], row["lon"]],
-            radius=radius,
-            popup=folium.Popup(
-                f"<b>{row['municipio']}/{row['estado']}</b><br/>"
-                f"Vendas: {int(row['vendas'])}<br/>"
-                f"Faturamento: {fmt_currency(valor)}",
-                max_width=250
-            ),
-            color="#2a7ae2",
-            fill=True,
-            fill_opacity=0.45
+    raio = np.clip(np.sqrt(agg["faturamento"].to_numpy(dtype="float64")) / 8, 4, 30).round(1)  # escala suave
+    popup = ("<b>" + agg["municipio"].astype(str) + "/" + agg["estado"].astype(str) + "</b><br/>"
+             + "Vendas: " + agg["vendas"].astype("int64").astype(str) + "<br/>"
+             + "Faturamento: " + fmt_currency_series(agg["faturamento"]))
+    cidades = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+             "properties": {"raio": r, "popup": texto}}
+            for lat, lon, r, texto in zip(agg["lat"].tolist(), agg["lon"].tolist(), raio.tolist(), popup.tolist())
+        ],
+    }
+
+    with tracer.span("map_folium_circles", linhas_saida=len(agg)):
+        m = folium.Map(location=[-14.2350, -51.9253], zoom_start=4, tiles="CartoDB positron")
+        folium.GeoJson(
+            cidades,
+            marker=folium.CircleMarker(color="#2a7ae2", fill=True, fill_opacity=0.45),
+            style_function=lambda f: {"radius": f["properties"]["raio"]},
+            popup=folium.GeoJsonPopup(fields=["popup"], labels=False, localize=False, max_width=250),
         ).add_to(m)
-
-    st_folium(m, width=None, height=540, returned_objects=[])
+        streamlit_folium.st_folium(m, width=None, height=540, returned_objects=[])
 
 # ------------------------------------------------------------
 # Renderização — Um gráfico abaixo do outro (rolagem)
 # ------------------------------------------------------------
-if filtered.empty:
+def secao_vendas():
+    chart_vendas_por_cliente(rollup)
+    chart_vendas_por_vendedor(rollup)              # azul claro
+    chart_categorias_qtd(rollup)                   # verde claro
+    chart_lojas_fat(rollup)                        # cinza claro
+
+
+def secao_series():
+    chart_vendas_por_mes(rollup)                   # (série temporal por mês — área)
+    chart_stacked_area_fat_categoria_mensal(rollup)  # (stacked area por categoria)
+    with tracer.span("serie_diaria") as sp:
+        serie = daily_series(dataset, selecoes, data_ini, data_fim, lookback_dias=SERIE_LOOKBACK_DIAS)
+        sp["linhas_saida"] = len(serie)
+    chart_media_movel_faturamento(serie, data_ini)
+    chart_comparativo_mensal(serie, data_ini)
+    chart_top5_clientes(rollup)
+    chart_top5_vendedores(rollup)
+
+
+def secao_distribuicoes():
+    if rollup.aprox is not None:
+        st.caption(f"Modo aproximado: histograma e boxplot vêm de sketches t-digest por célula "
+                   f"(erro de posição até ±{rollup.aprox.erro_quantis:.1%} nos quantis).")
+    if rollup.amostrado:
+        graficos = "a dispersão usa" if rollup.aprox is not None else "histograma, boxplot e dispersão usam"
+        st.caption(f"Modo streaming: {graficos} uma amostra de {len(filtered)} de {n_vendas} vendas.")
+    chart_hist_ticket(rollup)                      # com explicação
+    chart_boxplot_preco_por_categoria(rollup)      # com explicação
+    chart_participacao_estado(rollup)              # pizza maior
+    chart_parceladas_pizza(rollup)                 # pizza maior
+    chart_treemap_estado_municipio(rollup)         # treemap maior
+    chart_scatter_qty_vs_preco_unit(rollup)
+
+
+def secao_mapas():
+    map_plotly_faturamento_por_cidade(rollup)
+    map_folium_circles(rollup)
+
+
+SECOES = [
+    ("🔹 Vendas por Cliente / Vendedor / Categoria / Loja", "vendas", secao_vendas),
+    ("🔹 Séries Temporais e Rankings", "series", secao_series),
+    ("🔹 Distribuições e Hierarquias", "distribuicoes", secao_distribuicoes),
+    ("🔹 Mapas", "mapas", secao_mapas),
+]
+
+
+def render_secao(titulo: str, chave: str, render) -> None:
+    """Seção de gráficos; no modo sob demanda só é calculada quando o usuário a carrega.
+
+    O estado do toggle persiste entre reruns, e as figuras já montadas para o estado de
+    filtros atual vêm do cache de resultados.
+    """
+    if not LAZY_SECTIONS:
+        st.subheader(titulo)
+        with tracer.span(f"secao:{chave}"):
+            render()
+        return
+    toggle_key = f"secao_{chave}"
+    with st.expander(titulo, expanded=st.session_state.get(toggle_key, False)):
+        if st.toggle("Carregar gráficos", key=toggle_key):
+            with tracer.span(f"secao:{chave}"):
+                render()
+
+
+if n_vendas == 0:
     st.info("Sem dados para os filtros selecionados.")
 else:
-    st.subheader("🔹 Vendas por Cliente / Vendedor / Categoria / Loja")
-    chart_vendas_por_cliente(filtered)
-    chart_vendas_por_vendedor(filtered)           # azul claro
-    chart_categorias_qtd(filtered)                 # verde claro
-    chart_lojas_fat(filtered)                      # cinza claro
-
-    st.subheader("🔹 Séries Temporais e Rankings")
-    chart_vendas_por_mes(filtered)                 # (série temporal por mês — área)
-    chart_stacked_area_fat_categoria_mensal(filtered)  # (stacked area por categoria)
-    chart_top5_clientes(filtered)
-    chart_top5_vendedores(filtered)
-
-    st.subheader("🔹 Distribuições e Hierarquias")
-    chart_hist_ticket(filtered)                    # com explicação
-    chart_boxplot_preco_por_categoria(filtered)    # com explicação
-    chart_participacao_estado(filtered)            # pizza maior
-    chart_parceladas_pizza(filtered)               # pizza maior
-    chart_treemap_estado_municipio(filtered)       # treemap maior
-    chart_scatter_qty_vs_preco_unit(filtered)
-
-    st.subheader("🔹 Mapas")
-    map_plotly_faturamento_por_cidade(filtered)
-    map_folium_circles(filtered)
+    for titulo, chave, render in SECOES:
+        render_secao(titulo, chave, render)
+    with tracer.span("flush_figures"):
+        flush_figures()
+
+with st.expander("🧮 Memória do dataset"):
+    if st.toggle("Calcular relatório de memória por coluna", value=False):
+        if dataset.df is None and dataset.cube is None:
+            st.caption("Streaming: o cubo de agregados passou do orçamento de memória e ficou só em disco.")
+        else:
+            alvo = all_rows(dataset) if dataset.df is not None else dataset.cube
+            st.caption("Linhas fora da memória (streaming ou banco SQL): relatório do cubo de agregados." if dataset.df is None else
+                       "Antes: strings `object`, int64 e auxiliares armazenadas. Depois: representação compacta em uso.")
+            st.dataframe(memory_report(alvo), use_container_width=True)
+        if dataset.sketches is not None:
+            st.caption(f"Sketches do modo aproximado: {len(dataset.sketches.celulas)} células • "
+                       f"{dataset.sketches.nbytes() / 1024 ** 2:.1f} MB.")
+
+with st.expander("♻️ Cache de resultados"):
+    stats = result_cache().stats()
+    st.caption(f"{stats.attrs['entradas']} entradas • {stats.attrs['mb']:.1f} MB de {RESULT_CACHE_MB:g} MB • TTL {RESULT_CACHE_TTL_S:g}s")
+    st.dataframe(stats, use_container_width=True)
+
+if tracer.enabled:
+    with st.sidebar:
+        spans = tracer.report()
+        total_ms = (time.perf_counter() - tracer.t0) * 1000
+        st.subheader("⏱️ Spans desta execução")
+        st.caption(f"{len(spans)} spans • {total_ms:.0f} ms até aqui")
+        raiz = spans[spans["pai"].isna()]
+        st.dataframe(raiz[["nome", "duracao_ms", *[c for c in ("linhas_entrada", "linhas_saida", "payload_bytes") if c in raiz]]],
+                     hide_index=True, use_container_width=True)
+        with st.expander("Todos os spans"):
+            st.dataframe(spans, hide_index=True, use_container_width=True)
+        if st.button("Exportar trace (Chrome/Perfetto)"):
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            destino = os.path.join(TRACE_DIR, f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+            with open(destino, "w", encoding="utf-8") as fh:
+                json.dump(tracer.chrome_trace(), fh, default=str)
+            st.caption(f"Trace gravado em `{destino}`.")
+    tracer.log()
 
 st.divider()
 st.caption("Execução:  streamlit run streamlit_app3.py  •  Dataset fixo: vendas_dashboard.csv  •  Upload/Download desabilitados.")
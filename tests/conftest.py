@@ -0,0 +1,25 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture
+def csv_vendas(tmp_path, monkeypatch):
+    """Cópia de `vendas_dashboard.csv` num diretório temporário, com o cache do motor ao lado."""
+    import vendas_engine as motor
+    csv_path = str(tmp_path / "vendas.csv")
+    shutil.copy(os.path.join(RAIZ, "vendas_dashboard.csv"), csv_path)
+    monkeypatch.setattr(motor, "CSV_PATH", csv_path)
+    monkeypatch.setattr(motor, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(motor, "DATA_MODE", "memoria")
+    monkeypatch.setattr(motor, "BACKEND", "pandas")
+    motor.dataset_store.cache_clear()
+    motor.result_cache.cache_clear()
+    yield csv_path
+    motor.dataset_store.cache_clear()
+    motor.result_cache.cache_clear()
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app_v1.py")
+VENDEDOR_SEM_PRECO = "Vendedor Sem Preço"
+
+
+@pytest.fixture
+def csv_sem_preco(csv_vendas):
+    """Acrescenta uma venda sem preço de um vendedor que não tem outras vendas."""
+    with open(csv_vendas, "rb") as fh:
+        fh.seek(-1, os.SEEK_END)
+        quebra = "" if fh.read(1) == b"\n" else "\n"
+    with open(csv_vendas, "a", encoding="utf-8") as fh:
+        fh.write(f"{quebra}9999;2025-03-13;{VENDEDOR_SEM_PRECO};Bruna Lima;Rio de Janeiro;Coxipó;Loja D;2;;;"
+                 f"Papelaria;sim;bronze;2025-03-17;Rio de Janeiro\n")
+    return csv_vendas
+
+
+def _distribuicoes(vendedor: str) -> AppTest:
+    at = AppTest.from_file(APP, default_timeout=60).run()
+    next(s for s in at.selectbox if s.label == "Vendedor").select(vendedor).run()
+    next(t for t in at.toggle if t.key == "secao_distribuicoes").set_value(True).run()
+    return at
+
+
+def test_graficos_de_distribuicao_sem_preco_mostram_aviso(csv_sem_preco):
+    at = _distribuicoes(VENDEDOR_SEM_PRECO)
+    assert not at.exception
+    avisos = [w.value for w in at.warning]
+    assert "Não há preços para o histograma no recorte filtrado." in avisos
+    assert "Não há preços para o boxplot no recorte filtrado." in avisos
+    assert "Não há preços para a dispersão no recorte filtrado." in avisos
+
+
+def test_graficos_de_distribuicao_com_preco(csv_vendas):
+    at = _distribuicoes("(Todos)")
+    assert not at.exception
+    assert not at.warning
@@ -0,0 +1,57 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import vendas_api
+import vendas_engine as motor
+
+
+@pytest.fixture
+def api(csv_vendas):
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), vendas_api.VendasHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_port}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _get(url: str) -> tuple:
+    try:
+        with urllib.request.urlopen(url) as resp:
+            return resp.status, json.load(resp)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_kpis(api):
+    status, corpo = _get(f"{api}/kpis?estado=Bahia")
+    assert status == 200
+    assert corpo["filtros"]["selecoes"] == {"estado": "Bahia"}
+    assert corpo["kpis"]["n_vendas"] > 0
+
+
+@pytest.mark.parametrize("rota", ["/nada", "/kpis/inexistente", "/agregados/inexistente", "/kpis/a/b"])
+def test_rota_inexistente_404(api, rota):
+    status, corpo = _get(api + rota)
+    assert status == 404
+    assert "não encontrado" in corpo["erro"]
+
+
+def test_filtro_desconhecido_400(api):
+    status, corpo = _get(f"{api}/kpis?cor=azul")
+    assert status == 400
+    assert "cor" in corpo["erro"]
+
+
+def test_falha_interna_500(api, monkeypatch):
+    def falha(rollup):
+        raise KeyError("coluna")
+
+    monkeypatch.setattr(motor, "compute_kpis", falha)
+    status, corpo = _get(f"{api}/kpis")
+    assert status == 500
+    assert corpo == {"erro": "erro interno: KeyError"}
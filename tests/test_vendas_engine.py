@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import vendas_engine as motor
+
+
+def test_hist_bins_ignora_valores_ausentes():
+    hist = motor.hist_bins(pd.Series([10.0, np.nan, 30.0, 20.0]), nbins=2)
+    assert list(hist.columns) == ["inicio", "fim", "centro", "vendas"]
+    assert hist["vendas"].tolist() == [1, 2]
+    assert hist["inicio"].iloc[0] == 10.0 and hist["fim"].iloc[-1] == 30.0
+
+
+def test_hist_bins_sem_valores_retorna_vazio():
+    for valores in (pd.Series([np.nan, np.nan]), pd.Series([], dtype="float64")):
+        hist = motor.hist_bins(valores)
+        assert hist.empty
+        assert list(hist.columns) == ["inicio", "fim", "centro", "vendas"]
+
+
+def test_distribuicao_ticket_com_linha_sem_preco():
+    rows = pd.DataFrame({"preco_total": [100.0, np.nan, 300.0]})
+    hist = motor.distribuicao_ticket(motor.Rollup(rows, None))
+    assert hist["vendas"].sum() == 2
+
+
+def test_box_stats_sem_valores_retorna_vazio():
+    rows = pd.DataFrame({"categoria_produto": ["Papelaria", "Papelaria"], "preco_total": [np.nan, np.nan]})
+    stats, outliers = motor.box_stats(rows, "categoria_produto", "preco_total")
+    assert stats.empty and outliers.empty
+    assert list(stats.columns) == ["categoria_produto", "q1", "mediana", "q3", "bigode_inf", "bigode_sup"]
+    assert list(outliers.columns) == ["categoria_produto", "preco_total"]
+
+
+def _termina_com_quebra(csv_path: str) -> bytes:
+    """Garante a quebra de linha final (como no CSV gerado por `bench/gerar_vendas.py`) e devolve o conteúdo."""
+    with open(csv_path, "rb") as fh:
+        dados = fh.read()
+    if not dados.endswith(b"\n"):
+        dados += b"\n"
+        with open(csv_path, "wb") as fh:
+            fh.write(dados)
+    return dados
+
+
+def _reescreve_preco_no_meio(csv_path: str, delta: float) -> None:
+    """Soma `delta` ao preço total de uma venda no meio do CSV sem mudar o tamanho do arquivo."""
+    with open(csv_path, "rb") as fh:
+        dados = fh.read()
+    inicio = dados.index(b"\n", len(dados) // 2) + 1
+    fim = dados.index(b"\n", inicio)
+    campos = dados[inicio:fim].split(b";")
+    novo = f"{float(campos[9]) + delta:.2f}".encode()
+    assert len(novo) == len(campos[9])
+    campos[9] = novo
+    stat = os.stat(csv_path)
+    with open(csv_path, "wb") as fh:
+        fh.write(dados[:inicio] + b";".join(campos) + dados[fim:])
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.mark.parametrize("modo", ["memoria", "streaming"])
+def test_reescrita_do_mesmo_tamanho_invalida_o_cache(csv_vendas, monkeypatch, modo):
+    monkeypatch.setattr(motor, "MARKER_BYTES", 256)  # marker amostrado mesmo no CSV pequeno
+    monkeypatch.setattr(motor, "DATA_MODE", modo)
+    _termina_com_quebra(csv_vendas)
+    antes = motor.load_dataset().diario["preco_total"].sum()
+    _reescreve_preco_no_meio(csv_vendas, 10.0)
+    assert motor.load_dataset().diario["preco_total"].sum() == pytest.approx(antes + 10.0)
+    motor.dataset_store.cache_clear()  # partida a frio: só o cache em disco
+    assert motor.load_dataset().diario["preco_total"].sum() == pytest.approx(antes + 10.0)
+
+
+def test_anexacao_continua_incremental(csv_vendas, monkeypatch):
+    monkeypatch.setattr(motor, "MARKER_BYTES", 256)
+    ultima = _termina_com_quebra(csv_vendas).rstrip(b"\n").rsplit(b"\n", 1)[1]
+    ds = motor.load_dataset()
+    with open(csv_vendas, "ab") as fh:
+        fh.write(ultima + b"\n")
+    novo = motor.load_dataset()
+    assert len(novo.tails) == 1 and novo.df is ds.df
+    assert novo.opcoes.n_vendas == ds.opcoes.n_vendas + 1
+
+
+def test_series_por_vendedor_vem_do_rollup_diario(csv_vendas):
+    ds = motor.load_dataset()
+    vendedor = ds.df["nome_vendedor"].dropna().iloc[0]
+    sel = {**motor.FILTER_DIMS, "nome_vendedor": vendedor}
+    ini, fim = ds.opcoes.data_min.date(), ds.opcoes.data_max.date()
+    rollup = motor.build_rollup(ds, sel, ini, fim)
+    assert rollup._tabela(["ano", "mes"])[0] == "diario"
+    linhas = ds.df[ds.df["nome_vendedor"] == vendedor]
+    por_mes = rollup.by(["ano", "mes"], "preco_total").set_index(["ano", "mes"])["preco_total"]
+    esperado = linhas.groupby([linhas["data_venda"].dt.year, linhas["data_venda"].dt.month])["preco_total"].sum()
+    assert por_mes.to_numpy() == pytest.approx(esperado.to_numpy())
+    serie = motor.daily_series(ds, sel, ini, fim)
+    assert serie["preco_total"].sum() == pytest.approx(linhas["preco_total"].sum())
@@ -0,0 +1,73 @@
+import datetime as dt
+import importlib.util
+
+import pytest
+
+import vendas_engine as motor
+import vendas_sql
+
+BACKENDS = [
+    pytest.param("duckdb", marks=pytest.mark.skipif(importlib.util.find_spec("duckdb") is None,
+                                                    reason="duckdb não instalado")),
+    "sqlite",
+]
+
+# (seleções ativas, data_ini, data_fim); None = período inteiro do dataset
+ESTADOS = [
+    ({}, None, None),
+    ({"estado": "Bahia"}, None, None),
+    ({"loja": "Loja A", "venda_parcelada": "sim"}, dt.date(2025, 2, 1), dt.date(2025, 5, 31)),
+    ({"nome_vendedor": "Fabiana Ribeiro"}, dt.date(2025, 3, 10), dt.date(2025, 8, 20)),
+    ({"categoria_cliente": "ouro"}, dt.date(2030, 1, 1), dt.date(2030, 12, 31)),  # sem vendas
+]
+DIMS = ["estado", ["loja", "venda_parcelada"], "nome_cliente", ["estado", "municipio"], ["ano", "mes"]]
+
+
+@pytest.fixture
+def datasets(csv_vendas, request):
+    fingerprint = motor._csv_fingerprint(csv_vendas)
+    ref = motor._memory_load(csv_vendas, fingerprint, 1)
+    sql = motor._sql_load(csv_vendas, fingerprint, 1, request.param)
+    yield ref, sql
+    vendas_sql.banco.cache_clear()
+
+
+def _rollups(ref, sql, ativos, ini, fim):
+    sel = {**motor.FILTER_DIMS, **ativos}
+    ini, fim = ini or ref.opcoes.data_min.date(), fim or ref.opcoes.data_max.date()
+    return motor.build_rollup(ref, sel, ini, fim), motor.build_rollup(sql, sel, ini, fim)
+
+
+def _igual(a, b):
+    assert vendas_sql._diferenca(a, b) is None, vendas_sql._diferenca(a, b)
+
+
+@pytest.mark.parametrize("datasets", BACKENDS, indirect=True)
+@pytest.mark.parametrize("ativos, ini, fim", ESTADOS)
+def test_sql_rollup_igual_ao_pandas(datasets, ativos, ini, fim):
+    esperado, obtido = _rollups(*datasets, ativos, ini, fim)
+    for medida in motor.CUBE_MEASURES:
+        _igual(float(esperado.total(medida)), float(obtido.total(medida)))
+    for dims in DIMS:
+        _igual(esperado.by(dims, *motor.CUBE_MEASURES), obtido.by(dims, *motor.CUBE_MEASURES))
+    _igual(esperado.nunique("nome_cliente"), obtido.nunique("nome_cliente"))
+    _igual(esperado.hist("preco_total"), obtido.hist("preco_total"))
+    if esperado.total("n_linhas"):
+        _igual(esperado.box("categoria_produto", "preco_total"), obtido.box("categoria_produto", "preco_total"))
+
+
+@pytest.mark.parametrize("datasets", BACKENDS, indirect=True)
+def test_sql_agregados_da_carga(datasets):
+    ref, sql = datasets
+    _igual(ref.cube, sql.cube)
+    _igual(ref.diario, sql.diario)
+    assert ref.opcoes == sql.opcoes
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_paridade_de_kpis_e_graficos(csv_vendas, backend):
+    """Cada KPI (`motor.KPIS`) e agregado de gráfico (`AGREGADOS`, `AGREGADOS_SERIE`) em filtros sorteados."""
+    try:
+        assert vendas_sql.paridade(csv_vendas, backend, 10) == []
+    finally:
+        vendas_sql.banco.cache_clear()
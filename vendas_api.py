@@ -0,0 +1,150 @@
+# vendas_api.py
+# ------------------------------------------------------------
+# API HTTP/JSON local — KPIs e dados dos gráficos sem renderizar o dashboard
+# ------------------------------------------------------------
+# Uso:  python vendas_api.py --porta 8765
+#
+#   GET /saude                               versão do dataset e nº de vendas
+#   GET /opcoes                              valores disponíveis por filtro
+#   GET /kpis?estado=Bahia&data_ini=2025-03-01
+#   GET /kpis/faturamento?loja=Loja%20A      um KPI (nomes em vendas_engine.KPIS)
+#   GET /agregados                           nomes dos agregados
+#   GET /agregados/faturamento_por_loja?...  dados de um gráfico
+#
+# Filtros na query string: as dimensões de `FILTER_DIMS` e `data_ini`/`data_fim`
+# (AAAA-MM-DD). Usa o mesmo motor, cache colunar e cache de resultados do app.
+
+import argparse
+import json
+import math
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+import pandas as pd
+
+import vendas_engine as motor
+
+
+def _json_default(obj):
+    """Tipos NumPy/pandas e datas em JSON."""
+    if isinstance(obj, (np.integer, np.floating, np.bool_)):
+        return obj.item()
+    if isinstance(obj, (pd.Timestamp, np.datetime64)) or hasattr(obj, "isoformat"):
+        return pd.Timestamp(obj).isoformat()
+    raise TypeError(f"{type(obj).__name__} não serializável")
+
+
+def _sem_nan(valor):
+    """NaN/inf viram null (JSON estrito)."""
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    if isinstance(valor, dict):
+        return {k: _sem_nan(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_sem_nan(v) for v in valor]
+    return valor
+
+
+def _registros(dados):
+    """DataFrame (ou tupla de DataFrames, ex.: boxplot) em listas de registros."""
+    if isinstance(dados, pd.DataFrame):
+        return dados.astype(object).where(dados.notna(), None).to_dict(orient="records")
+    if isinstance(dados, tuple):
+        return [_registros(d) for d in dados]
+    return dados
+
+
+def _opcoes(ds: motor.Dataset) -> dict:
+    opcoes = ds.opcoes
+    return {
+        **{dim: list(opcoes.valores[dim]) for dim in motor.FILTER_DIMS},
+        "data_ini": opcoes.data_min.date().isoformat(),
+        "data_fim": opcoes.data_max.date().isoformat(),
+    }
+
+
+class VendasHandler(BaseHTTPRequestHandler):
+    """Rotas GET da API; erros viram `{"erro": ...}`.
+
+    404 para rota, KPI ou agregado inexistente (`motor.NotFoundError`), 400 para filtros
+    inválidos (`ValueError`) e 500, registrado em `perf_log`, para qualquer outra falha.
+    """
+
+    server_version = "VendasAPI/1.0"
+
+    def do_GET(self):
+        t0 = time.perf_counter()
+        url = urlparse(self.path)
+        partes = [p for p in url.path.split("/") if p]
+        params = dict(parse_qsl(url.query))
+        try:
+            ds = motor.load_dataset()
+            motor.result_cache().retain_version(ds.chave)
+            corpo = self._rota(partes, params, ds)
+        except motor.NotFoundError as e:
+            return self._responder(404, {"erro": f"não encontrado: {e.args[0]}"})
+        except ValueError as e:
+            return self._responder(400, {"erro": str(e)})
+        except Exception as e:
+            motor.perf_log.exception("api %s falhou", self.path)
+            return self._responder(500, {"erro": f"erro interno: {type(e).__name__}"})
+        corpo["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        self._responder(200, corpo)
+
+    def _rota(self, partes: list, params: dict, ds: motor.Dataset) -> dict:
+        versao = {"versao": ds.version, "offset": ds.offset}
+        if partes == ["saude"]:
+            return {"status": "ok", **versao, "vendas": ds.opcoes.n_vendas}
+        if partes == ["opcoes"]:
+            return {**versao, "opcoes": _opcoes(ds)}
+        if partes == ["agregados"]:
+            return {"agregados": sorted([*motor.AGREGADOS, *motor.AGREGADOS_SERIE])}
+        if not partes or partes[0] not in ("kpis", "agregados") or len(partes) > 2:
+            raise motor.NotFoundError(self.path)
+
+        selecoes, data_ini, data_fim = motor.resolve_filtros(ds, params)
+        filtros = {"selecoes": {k: v for k, v in selecoes.items() if v != motor.FILTER_DIMS[k]},
+                   "data_ini": data_ini.isoformat(), "data_fim": data_fim.isoformat()}
+        if partes[0] == "kpis" and len(partes) == 1:
+            rollup = motor.cached_rollup(ds, selecoes, data_ini, data_fim)
+            return {**versao, "filtros": filtros, "kpis": motor.compute_kpis(rollup),
+                    "aproximado": rollup.aprox is not None}
+        if partes[0] == "kpis":
+            valor = motor.kpi(partes[1], ds, selecoes, data_ini, data_fim)
+            return {**versao, "filtros": filtros, "kpi": partes[1], "valor": valor}
+        dados = motor.agregado(partes[1], ds, selecoes, data_ini, data_fim)
+        return {**versao, "filtros": filtros, "agregado": partes[1], "dados": _registros(dados)}
+
+    def _responder(self, status: int, corpo: dict):
+        payload = json.dumps(_sem_nan(corpo), ensure_ascii=False, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        motor.perf_log.info("api %s", format % args)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="API HTTP/JSON local com os KPIs e agregados do dashboard.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--porta", type=int, default=8765)
+    args = ap.parse_args()
+
+    motor.load_dataset()  # carga antes da primeira requisição
+    servidor = ThreadingHTTPServer((args.host, args.porta), VendasHandler)
+    print(f"API de vendas em http://{args.host}:{args.porta}  (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2023 @@
+# vendas_engine.py
+# ------------------------------------------------------------
+# Motor de dados do Dashboard de Vendas — sem dependência do Streamlit
+# - Carga do CSV (cache colunar, ingestão incremental, modo streaming)
+# - Filtros (índice invertido), cubo de agregados e Rollup por estado de filtros
+# - Uma função pura por KPI e por agregado de gráfico
+# - Usado por streamlit_app_v1.py e pela API HTTP local (vendas_api.py)
+# ------------------------------------------------------------
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import hashlib
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from collections import Counter, OrderedDict
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# ------------------------------------------------------------
+# Geocódigos aproximados (lat, lon) por estado — cidades comuns no dataset
+# ------------------------------------------------------------
+STATE_CITY_LATLON = {
+    "São Paulo": {
+        "São Paulo": (-23.5505, -46.6333), "Campinas": (-22.9056, -47.0608),
+        "Sorocaba": (-23.5015, -47.4526), "Ribeirão Preto": (-21.1775, -47.8103),
+        "São José dos Campos": (-23.2237, -45.9009),
+    },
+    "Rio de Janeiro": {
+        "Rio de Janeiro": (-22.9068, -43.1729), "Niterói": (-22.8832, -43.1034),
+        "Campos dos Goytacazes": (-21.7622, -41.3181), "Volta Redonda": (-22.5200, -44.0996),
+    },
+    "Minas Gerais": {
+        "Belo Horizonte": (-19.9167, -43.9345), "Uberlândia": (-18.9113, -48.2622),
+        "Contagem": (-19.9317, -44.0533), "Juiz de Fora": (-21.7619, -43.3496),
+    },
+    "Rio Grande do Sul": {
+        "Porto Alegre": (-30.0346, -51.2177), "Caxias do Sul": (-29.1678, -51.1794),
+        "Pelotas": (-31.7654, -52.3371), "Santa Maria": (-29.6842, -53.8069),
+    },
+    "Santa Catarina": {
+        "Florianópolis": (-27.5949, -48.5482), "Joinville": (-26.3045, -48.8487),
+        "Blumenau": (-26.9173, -49.0661), "Chapecó": (-27.1004, -52.6152),
+    },
+    "Paraná": {
+        "Curitiba": (-25.4284, -49.2733), "Londrina": (-23.3045, -51.1696),
+        "Maringá": (-23.4205, -51.9333), "Cascavel": (-24.9555, -53.4552),
+    },
+    "Mato Grosso": {
+        "Cuiabá": (-15.6010, -56.0974), "Várzea Grande": (-15.6467, -56.1322),
+        "Rondonópolis": (-16.4708, -54.6356), "Sinop": (-11.8642, -55.5030),
+        "Tangará da Serra": (-14.6225, -57.4850), "Lucas do Rio Verde": (-13.0559, -55.9199),
+        "Sorriso": (-12.5420, -55.7211), "Barra do Garças": (-15.8931, -52.2569),
+    },
+    "Mato Grosso do Sul": {
+        "Campo Grande": (-20.4697, -54.6201), "Dourados": (-22.2211, -54.8056),
+        "Três Lagoas": (-20.7849, -51.7004), "Corumbá": (-19.0077, -57.6510),
+    },
+    "Pará": {
+        "Belém": (-1.4558, -48.4902), "Ananindeua": (-1.3650, -48.3720),
+        "Marabá": (-5.3803, -49.1327), "Santarém": (-2.4390, -54.7009),
+    },
+    "Amazonas": {
+        "Manaus": (-3.1190, -60.0217), "Itacoatiara": (-3.1386, -58.4449),
+        "Parintins": (-2.6283, -56.7358),
+    },
+    "Goiás": {
+        "Goiânia": (-16.6869, -49.2648), "Anápolis": (-16.3281, -48.9534),
+        "Aparecida de Goiânia": (-16.8193, -49.2473),
+    },
+    "Distrito Federal": {
+        "Brasília": (-15.7939, -47.8828),
+    },
+    "Espírito Santo": {
+        "Vitória": (-20.3155, -40.3128), "Vila Velha": (-20.3361, -40.2939), "Serra": (-20.1286, -40.3074),
+    },
+    "Rondônia": {
+        "Porto Velho": (-8.7619, -63.9039), "Ji-Paraná": (-10.8777, -61.9321), "Ariquemes": (-9.9134, -63.0405),
+    },
+    "Tocantins": {
+        "Palmas": (-10.1842, -48.3336), "Araguaína": (-7.1911, -48.2077), "Gurupi": (-11.7292, -49.0689),
+    },
+    "Maranhão": {
+        "São Luís": (-2.5387, -44.2825), "Imperatriz": (-5.5185, -47.4784), "Caxias": (-4.8650, -43.3617),
+    },
+    "Piauí": {
+        "Teresina": (-5.0919, -42.8034), "Parnaíba": (-2.9059, -41.7760), "Picos": (-7.0768, -41.4679),
+    },
+    "Bahia": {
+        "Salvador": (-12.9777, -38.5016), "Feira de Santana": (-12.2664, -38.9663),
+        "Vitória da Conquista": (-14.8615, -40.8442), "Ilhéus": (-14.7935, -39.0460),
+    },
+    "Pernambuco": {
+        "Recife": (-8.0476, -34.8770), "Olinda": (-7.9993, -34.8450), "Caruaru": (-8.2835, -35.9759), "Petrolina": (-9.3891, -40.5033),
+    },
+    "Ceará": {
+        "Fortaleza": (-3.7319, -38.5267), "Caucaia": (-3.7361, -38.6535), "Juazeiro do Norte": (-7.2131, -39.3155),
+        "Sobral": (-3.6891, -40.3482),
+    },
+}
+
+# Município -> (lat, lon)
+CITY_LATLON = {cidade: latlon for cidades in STATE_CITY_LATLON.values() for cidade, latlon in cidades.items()}
+
+# Tabela indexada por município (join vetorizado na montagem do cubo; ver `with_geocodes`)
+GEO_LOOKUP = pd.DataFrame.from_dict(CITY_LATLON, orient="index", columns=["lat", "lon"]).rename_axis("municipio")
+
+# ------------------------------------------------------------
+# Utilidades
+# ------------------------------------------------------------
+CSV_PATH = os.environ.get("VENDAS_CSV", "vendas_dashboard.csv")
+
+# Cache colunar (Arrow/Feather) gerado a partir do CSV — tipos já convertidos
+CACHE_DIR = os.environ.get("VENDAS_CACHE_DIR", ".vendas_cache")
+CACHE_HASH = os.environ.get("VENDAS_CACHE_HASH", "0") == "1"  # compara o hash de todo o prefixo (mais lento)
+CACHE_META_KEY = b"vendas_fingerprint"
+CACHE_SCHEMA = 4  # incrementar quando o formato das colunas em cache mudar
+
+# Ingestão incremental: linhas anexadas ao CSV são lidas a partir do último byte consumido
+INCREMENTAL = os.environ.get("VENDAS_INCREMENTAL", "1") == "1"
+MARKER_BYTES = 64 * 1024  # janela usada para reconhecer que o prefixo já lido não mudou
+# Caudas anexadas ficam em segmentos próprios até somarem esta fração da base (ou COMPACT_MAX_SEGMENTS
+# segmentos); então tudo é reordenado num único DataFrame, reindexado e regravado no cache
+COMPACT_FRACTION = float(os.environ.get("VENDAS_COMPACT_FRACTION", "0.25"))
+COMPACT_MAX_SEGMENTS = 16
+
+# Modo de execução: "memoria" (DataFrame completo), "streaming" (out-of-core, em blocos) ou "auto"
+DATA_MODE = os.environ.get("VENDAS_MODE", "auto")
+MEMORY_BUDGET_MB = float(os.environ.get("VENDAS_MEMORY_BUDGET_MB", "1024"))
+CSV_MEMORY_FACTOR = 5  # memória aproximada de um DataFrame tipado / tamanho do CSV em disco
+
+# Backend das consultas: "pandas" (padrão) ou um banco colunar embutido ("duckdb", "sqlite"),
+# onde filtros e agregações viram SQL (ver vendas_sql.py)
+BACKEND = os.environ.get("VENDAS_BACKEND", "pandas")
+
+# Modo aproximado: clientes únicos (HyperLogLog) e quantis/histograma de `preco_total`
+# (t-digest) unindo sketches por célula mês × estado × loja × categoria (ver vendas_sketch.py)
+APPROX = os.environ.get("VENDAS_APROXIMADO", "0") == "1"
+APPROX_ERRO_DISTINTOS = float(os.environ.get("VENDAS_ERRO_DISTINTOS", "0.02"))  # erro padrão relativo
+APPROX_ERRO_QUANTIS = float(os.environ.get("VENDAS_ERRO_QUANTIS", "0.01"))      # erro de posição (rank)
+
+# Cache de resultados entre sessões (linhas filtradas, KPIs e figuras); 0 MB desliga
+RESULT_CACHE_MB = float(os.environ.get("VENDAS_RESULT_CACHE_MB", "256"))
+RESULT_CACHE_TTL_S = float(os.environ.get("VENDAS_RESULT_CACHE_TTL", "900"))
+
+# Gráficos de linhas brutas: limite de pontos enviados ao navegador
+PLOT_MAX_POINTS = int(os.environ.get("VENDAS_PLOT_MAX_POINTS", "5000"))
+HIST_BINS = 20
+BOX_MAX_OUTLIERS = 50  # por categoria
+
+
+def _csv_fingerprint(csv_path: str) -> tuple:
+    """Identifica a versão do CSV por mtime e tamanho (verificação barata a cada rerun)."""
+    stat = os.stat(csv_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _prefix_marker(csv_path: str, offset: int) -> str:
+    """Hash BLAKE2 do prefixo [0, offset) já consumido.
+
+    Por padrão considera só o início do arquivo e os `MARKER_BYTES` anteriores a `offset`;
+    com `VENDAS_CACHE_HASH=1` considera o prefixo inteiro.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(offset).encode())
+    with open(csv_path, "rb") as fh:
+        if _marker_completo(offset):
+            restante = offset
+            while restante > 0:
+                bloco = fh.read(min(restante, 1 << 20))
+                if not bloco:
+                    break
+                h.update(bloco)
+                restante -= len(bloco)
+        else:
+            h.update(fh.read(MARKER_BYTES))
+            fh.seek(offset - MARKER_BYTES)
+            h.update(fh.read(MARKER_BYTES))
+    return h.hexdigest()
+
+
+def _marker_completo(offset: int) -> bool:
+    """True se `_prefix_marker` cobre o prefixo inteiro (não só as janelas das pontas)."""
+    return CACHE_HASH or offset <= 2 * MARKER_BYTES
+
+
+def _prefix_intact(csv_path: str, offset: int, marker: str | None, mtime_ns: int | None) -> bool:
+    """True se o CSV ainda começa pelo prefixo [0, offset) consumido e o restante é anexação.
+
+    `mtime_ns` é o mtime do CSV quando ele tinha `offset` bytes. Mesmo tamanho com outro
+    mtime não é anexação, e sim reescrita no lugar: a amostra de `_prefix_marker` não vê
+    edições no meio do arquivo, então só o hash do prefixo inteiro pode confirmar que
+    nada mudou; sem ele o prefixo conta como alterado (carga completa).
+    """
+    stat = os.stat(csv_path)
+    if stat.st_size < offset:
+        return False
+    if stat.st_size == offset and stat.st_mtime_ns != mtime_ns and not _marker_completo(offset):
+        return False
+    return _prefix_marker(csv_path, offset) == marker and _is_clean_append(csv_path, offset)
+
+
+def _is_clean_append(csv_path: str, offset: int) -> bool:
+    """True se os bytes após `offset` começam uma linha nova (não continuam a última linha lida)."""
+    if offset == 0:
+        return True
+    with open(csv_path, "rb") as fh:
+        fh.seek(offset - 1)
+        anterior, proximo = fh.read(1), fh.read(1)
+    return anterior == b"\n" or proximo in (b"\n", b"\r")
+
+
+class _BoundedReader(io.RawIOBase):
+    """Leitor que expõe apenas os bytes [início, fim) de um arquivo aberto."""
+
+    def __init__(self, fh, fim: int):
+        self._fh = fh
+        self._restante = fim - fh.tell()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buf) -> int:
+        n = min(len(buf), self._restante)
+        if n <= 0:
+            return 0
+        dados = self._fh.read(n)
+        buf[:len(dados)] = dados
+        self._restante -= len(dados)
+        return len(dados)
+
+
+def _csv_range_reader(fh, inicio: int, fim: int) -> tuple:
+    """Posiciona `fh` em `inicio` e devolve `(leitor limitado a fim, kwargs do read_csv)`."""
+    header = fh.readline()
+    kwargs = {"sep": ";", "encoding": "utf-8"}
+    if inicio > 0:
+        fh.seek(inicio)
+        kwargs.update(header=None, names=header.decode("utf-8").rstrip("\r\n").split(";"))
+    else:
+        fh.seek(0)
+    return io.BufferedReader(_BoundedReader(fh, fim)), kwargs
+
+
+def _read_csv_range(csv_path: str, inicio: int, fim: int) -> pd.DataFrame:
+    """Lê as linhas completas entre os offsets [inicio, fim) (inicio=0 inclui o cabeçalho)."""
+    with open(csv_path, "rb") as fh:
+        reader, kwargs = _csv_range_reader(fh, inicio, fim)
+        return pd.read_csv(reader, **kwargs)
+
+
+def _iter_csv_chunks(csv_path: str, inicio: int, fim: int, chunksize: int):
+    """Itera o CSV entre os offsets [inicio, fim) em blocos de `chunksize` linhas, já tipados."""
+    with open(csv_path, "rb") as fh:
+        reader, kwargs = _csv_range_reader(fh, inicio, fim)
+        for chunk in pd.read_csv(reader, chunksize=chunksize, **kwargs):
+            yield _clean_types(chunk)
+
+
+def _clean_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Aplica a higienização de tipos (datas, numéricos e auxiliares)."""
+    # Datas e numéricos
+    df["data_venda"] = pd.to_datetime(df["data_venda"], errors="coerce").dt.normalize()  # o período dos filtros é em dias
+    if "data_entrega_prevista" in df.columns:
+        df["data_entrega_prevista"] = pd.to_datetime(df["data_entrega_prevista"], errors="coerce")
+
+    for col in ["preco_unitario", "preco_total"]:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.replace(",", ".", regex=False).astype(float)
+    if "quantidade_vendida" in df.columns:
+        df["quantidade_vendida"] = pd.to_numeric(df["quantidade_vendida"], errors="coerce").fillna(0).astype(int)
+    if "venda_parcelada" in df.columns:  # "Sim"/"sim" viram o mesmo valor de filtro
+        df["venda_parcelada"] = df["venda_parcelada"].str.lower()
+    return df
+
+
+# ------------------------------------------------------------
+# Representação compacta — categorias, inteiros reduzidos e colunas derivadas sob demanda
+# ------------------------------------------------------------
+# Colunas de dimensão (texto repetitivo) guardadas como `category`
+DIM_COLUMNS = [
+    "estado", "municipio", "bairro", "loja", "categoria_produto",
+    "nome_vendedor", "nome_cliente", "categoria_cliente", "venda_parcelada",
+]
+# Inteiros reduzidos ao menor tipo que comporta os valores (preços seguem float64: somas em R$)
+INT_COLUMNS = ["id_venda", "quantidade_vendida"]
+
+# Auxiliares calculadas a partir de `data_venda` apenas quando alguém precisa delas
+DERIVED_COLUMNS = {
+    "ano": lambda d: d.dt.year,
+    "mes": lambda d: d.dt.month,
+    "dia": lambda d: d.dt.date,
+    "mes_nome": lambda d: d.dt.strftime("%b"),
+    "mes_ord": lambda d: d.dt.to_period("M").astype(str),
+}
+
+
+def sort_by_date(df: pd.DataFrame) -> pd.DataFrame:
+    """Ordena fisicamente por `data_venda` (estável; datas inválidas ao final)."""
+    return df.sort_values("data_venda", kind="stable", na_position="last", ignore_index=True)
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte dimensões para `category` e reduz inteiros (in-place; retorna o próprio df)."""
+    for col in DIM_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    for col in INT_COLUMNS:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+
+def with_derived(df: pd.DataFrame, *cols: str) -> pd.DataFrame:
+    """Retorna `df` com as colunas derivadas pedidas (ver `DERIVED_COLUMNS`).
+
+    Cada derivada é calculada uma vez por data distinta e expandida pelos códigos.
+    """
+    codes, datas = pd.factorize(df["data_venda"])  # NaT -> -1
+    if (codes < 0).any():
+        datas = datas.append(pd.DatetimeIndex([pd.NaT]))  # código -1 lê a última posição
+    datas = pd.Series(datas)
+    return df.assign(**{c: DERIVED_COLUMNS[c](datas).to_numpy()[codes] for c in cols})
+
+
+def with_geocodes(df: pd.DataFrame) -> pd.DataFrame:
+    """Retorna `df` com `lat`/`lon` do município (NaN quando não há geocódigo).
+
+    O join é feito uma vez por categoria de `municipio` e expandido pelos códigos.
+    """
+    mun = df["municipio"].astype("category")
+    geo = GEO_LOOKUP.reindex(mun.cat.categories.astype(str)).to_numpy()
+    codes = mun.cat.codes.to_numpy()
+    coords = np.where((codes >= 0)[:, None], geo[codes], np.nan)
+    return df.assign(lat=coords[:, 0], lon=coords[:, 1])
+
+
+def concat_compact(frames: list) -> pd.DataFrame:
+    """Concatena preservando as colunas `category` (une as categorias antes do concat)."""
+    frames = [f for f in frames if len(f)] or frames[:1]
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            cats = frames[0][col].cat.categories
+            for f in frames[1:]:
+                cats = cats.union(f[col].astype("category").cat.categories)
+            frames = [f.assign(**{col: f[col].astype(pd.CategoricalDtype(cats))}) for f in frames]
+    return pd.concat(frames)
+
+
+def _plain_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """Troca colunas `category` por seus valores (evita legendas com categorias não observadas)."""
+    cats = {c: df[c].astype(df[c].cat.categories.dtype) for c in df.columns
+            if isinstance(df[c].dtype, pd.CategoricalDtype)}
+    return df.assign(**cats) if cats else df
+
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Memória por coluna (MB): representação original vs. compacta.
+
+    "Antes" reconstrói o formato anterior — dimensões como strings `object`, inteiros
+    int64 e as auxiliares (`ano`, `mes`, `dia`, `mes_nome`) armazenadas.
+    """
+    antes_df = with_derived(df, "ano", "mes", "dia", "mes_nome")
+    for col in antes_df.columns:
+        if isinstance(antes_df[col].dtype, pd.CategoricalDtype):
+            antes_df[col] = antes_df[col].astype(object)
+        elif pd.api.types.is_integer_dtype(antes_df[col]):
+            antes_df[col] = antes_df[col].astype("int64")
+    mb = 1024 * 1024
+    rep = pd.DataFrame({
+        "dtype": df.dtypes.astype(str).reindex(antes_df.columns).fillna("(sob demanda)"),
+        "antes_mb": antes_df.memory_usage(deep=True, index=False) / mb,
+        "depois_mb": df.memory_usage(deep=True, index=False).reindex(antes_df.columns).fillna(0) / mb,
+    })
+    rep.loc["TOTAL"] = ["", rep["antes_mb"].sum(), rep["depois_mb"].sum()]
+    rep["reducao_x"] = (rep["antes_mb"] / rep["depois_mb"].where(rep["depois_mb"] > 0)).round(1)
+    return rep.round(3)
+
+
+def _cache_path(csv_path: str) -> str:
+    """Caminho do arquivo Feather correspondente ao CSV."""
+    base = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(CACHE_DIR, f"{base}.feather")
+
+
+def _read_cache(cache_path: str, csv_path: str):
+    """Lê o cache Feather via memory-map se o prefixo do CSV ainda coincidir (ver `_prefix_intact`).
+
+    Retorna `(df, offset, opcoes, marker)` — `offset` é o byte do CSV até onde o cache
+    cobre, `opcoes` as `FilterOptions` gravadas com ele e `marker` o hash do prefixo — ou None.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        table = feather.read_table(cache_path, memory_map=True)
+        meta = json.loads((table.schema.metadata or {}).get(CACHE_META_KEY, b"{}"))
+        offset = int(meta["offset"])
+    except Exception:
+        return None
+    if meta.get("schema") != CACHE_SCHEMA:
+        return None
+    if not _prefix_intact(csv_path, offset, meta.get("marker"), meta.get("mtime")):
+        return None
+    return table.to_pandas(self_destruct=True), offset, FilterOptions.from_json(meta["opcoes"]), meta["marker"]
+
+
+def _write_table(table: pa.Table, path: str, meta: dict) -> None:
+    """Grava uma tabela em Feather sem compressão (permite memory-map), com `meta` nos metadados."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), CACHE_META_KEY: json.dumps(meta).encode()})
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)  # troca atômica: leitores nunca veem arquivo parcial
+
+
+def _write_cache(df: pd.DataFrame, cache_path: str, offset: int, marker: str, mtime_ns: int,
+                 opcoes: "FilterOptions") -> None:
+    """Grava o DataFrame já tipado em Feather, com as opções dos filtros e o mtime do CSV lido."""
+    try:
+        _write_table(pa.Table.from_pandas(df, preserve_index=False), cache_path,
+                     {"offset": offset, "marker": marker, "mtime": mtime_ns, "schema": CACHE_SCHEMA,
+                      "opcoes": opcoes.to_json()})
+    except OSError:
+        pass  # cache é apenas otimização; sem permissão de escrita seguimos com o CSV
+
+
+def _aggregate_path(cache_path: str, parte: str) -> str:
+    """Arquivo de um agregado gravado ao lado do cache (`<base>.cubo.feather` etc.)."""
+    return f"{os.path.splitext(cache_path)[0]}.{parte}.feather"
+
+
+def _write_aggregates(cache_path: str, offset: int, marker: str, cube: pd.DataFrame, diario: pd.DataFrame,
+                      index: "FilterIndex | None" = None) -> None:
+    """Grava cubo, rollup diário e (em memória) índice de filtros marcados com o mesmo prefixo do cache."""
+    meta = {"offset": offset, "marker": marker, "schema": CACHE_SCHEMA}
+    try:
+        _write_table(pa.Table.from_pandas(cube, preserve_index=False), _aggregate_path(cache_path, "cubo"), meta)
+        _write_table(pa.Table.from_pandas(diario, preserve_index=False), _aggregate_path(cache_path, "diario"), meta)
+        if index is not None:
+            _write_table(index.to_table(), _aggregate_path(cache_path, "indice"), meta)
+    except OSError:
+        pass
+
+
+def _read_aggregates(cache_path: str, df: pd.DataFrame | None, offset: int, marker: str):
+    """`(cubo, rollup diário, índice)` gravados para o mesmo prefixo do cache, ou None.
+
+    Sem `df` (modo streaming) o índice não é lido e volta None.
+    """
+    tabelas = {}
+    for parte in ("cubo", "diario", "indice") if df is not None else ("cubo", "diario"):
+        try:
+            table = feather.read_table(_aggregate_path(cache_path, parte), memory_map=True)
+            meta = json.loads(table.schema.metadata[CACHE_META_KEY])
+        except Exception:
+            return None
+        if meta != {"offset": offset, "marker": marker, "schema": CACHE_SCHEMA}:
+            return None
+        tabelas[parte] = table
+    try:
+        index = FilterIndex.from_table(df, tabelas["indice"]) if df is not None else None
+    except (KeyError, ValueError):
+        return None
+    return tabelas["cubo"].to_pandas(), tabelas["diario"].to_pandas(), index
+
+
+# ------------------------------------------------------------
+# Motor de filtros — índice invertido construído uma vez por versão do dataset
+# ------------------------------------------------------------
+# Dimensões filtráveis no topo (coluna -> rótulo "todos" do selectbox)
+FILTER_DIMS = {
+    "estado": "(Todos)",
+    "municipio": "(Todos)",
+    "loja": "(Todas)",
+    "categoria_produto": "(Todas)",
+    "nome_vendedor": "(Todos)",
+    "categoria_cliente": "(Todas)",
+    "venda_parcelada": "(Todas)",
+}
+
+
+class FilterIndex:
+    """Índice invertido dos filtros do topo sobre linhas em ordem de `data_venda`.
+
+    Os códigos por linha são os da coluna `category` de cada dimensão (sem cópia); as listas
+    de row-ids de todos os valores ficam num único array `ordem` (linhas agrupadas por
+    código, em ordem crescente), fatiado por `limites`. Como as linhas estão ordenadas por
+    data, o período vira uma fatia [lo, hi) obtida por busca binária e o corte das listas
+    de row-ids também é O(log n). Uma seleção parte do conjunto mais seletivo e refina
+    apenas os candidatos, então o custo acompanha o nº de linhas casadas.
+
+    Listas e limites são gravados junto ao cache colunar (`to_table`/`from_table`).
+    """
+
+    def __init__(self, df: pd.DataFrame, postings: dict | None = None):
+        self.n_rows = len(df)
+        self.codes: dict = {}
+        self.lookup: dict = {}
+        self.postings: dict = {}  # dimensão -> (ordem, limites)
+        for dim in FILTER_DIMS:
+            col = df[dim] if isinstance(df[dim].dtype, pd.CategoricalDtype) else df[dim].astype("category")
+            codes = col.cat.codes.to_numpy()  # NaN -> -1 (nunca casa)
+            self.codes[dim] = codes
+            self.lookup[dim] = {v: i for i, v in enumerate(col.cat.categories)}
+            if postings is not None:
+                self.postings[dim] = postings[dim]
+            else:
+                ordem = np.argsort(codes, kind="stable").astype(np.int32)
+                limites = np.cumsum(np.bincount(codes + 1, minlength=len(col.cat.categories) + 1))
+                self.postings[dim] = (ordem, limites)
+        dates = df["data_venda"].to_numpy(dtype="datetime64[ns]")
+        self.dates_sorted = dates[:len(dates) - int(np.isnat(dates).sum())]  # datas inválidas ficam ao final
+        if np.any(self.dates_sorted[1:] < self.dates_sorted[:-1]):
+            raise ValueError("FilterIndex requer linhas em ordem de data (ver `sort_by_date`)")
+
+    def _lista(self, dim: str, code: int) -> np.ndarray:
+        ordem, limites = self.postings[dim]
+        return ordem[limites[code]:limites[code + 1]]
+
+    def select(self, selecoes: dict, data_ini, data_fim) -> np.ndarray:
+        """Retorna os row-ids (ordenados) que atendem às seleções e ao período [data_ini, data_fim]."""
+        ini = np.datetime64(pd.to_datetime(data_ini), "ns")
+        fim = np.datetime64(pd.to_datetime(data_fim), "ns")
+        lo = np.searchsorted(self.dates_sorted, ini, side="left")
+        hi = np.searchsorted(self.dates_sorted, fim, side="right")
+
+        termos = []
+        for dim, valor in selecoes.items():
+            code = self.lookup[dim].get(valor)
+            if code is None:
+                return np.empty(0, dtype=np.intp)
+            _, limites = self.postings[dim]
+            termos.append((limites[code + 1] - limites[code], dim, code))
+        termos.sort(key=lambda t: t[0])
+
+        if termos and termos[0][0] < hi - lo:
+            _, dim, code = termos.pop(0)
+            rows = self._lista(dim, code)
+            rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]  # row-id == posição na ordem por data
+        else:
+            rows = np.arange(lo, hi)
+        for _, dim, code in termos:
+            rows = rows[self.codes[dim][rows] == code]
+        return rows
+
+    def to_table(self) -> pa.Table:
+        """Listas de row-ids (uma coluna por dimensão) com os limites nos metadados."""
+        limites = {dim: lim.tolist() for dim, (_, lim) in self.postings.items()}
+        table = pa.table({dim: ordem for dim, (ordem, _) in self.postings.items()})
+        return table.replace_schema_metadata({b"limites": json.dumps(limites).encode()})
+
+    @classmethod
+    def from_table(cls, df: pd.DataFrame, table: pa.Table) -> "FilterIndex":
+        """Índice de `df` a partir de `to_table` (as categorias de `df` devem ser as mesmas da gravação)."""
+        limites = json.loads(table.schema.metadata[b"limites"])
+        postings = {dim: (table.column(dim).to_numpy(), np.asarray(limites[dim])) for dim in FILTER_DIMS}
+        for dim, (_, lim) in postings.items():
+            if len(lim) != len(df[dim].cat.categories) + 1 or lim[-1] != len(df):
+                raise ValueError(f"índice gravado não corresponde às categorias de {dim}")
+        return cls(df, postings)
+
+
+def apply_filters(df: pd.DataFrame, index: FilterIndex, selecoes: dict, data_ini, data_fim) -> pd.DataFrame:
+    """Aplica os filtros do topo com um único `take` (sem cópia integral do DataFrame).
+
+    `selecoes` mapeia coluna -> valor escolhido; valores "(Todos)"/"(Todas)" são ignorados.
+    Quando todas as linhas casam, devolve o próprio `df`.
+    """
+    rows = index.select(_active(selecoes), data_ini, data_fim)
+    return df if len(rows) == len(df) else df.take(rows)
+
+
+class Segment(NamedTuple):
+    """Linhas anexadas depois da base (em ordem de data) com seu próprio índice de filtros."""
+    df: pd.DataFrame
+    index: FilterIndex
+
+
+def filter_rows(ds: "Dataset", selecoes: dict, data_ini, data_fim, cols: list | None = None) -> pd.DataFrame:
+    """Linhas filtradas de todos os segmentos do dataset em memória (base e caudas anexadas).
+
+    Cada segmento é filtrado pelo seu índice; só as linhas casadas são concatenadas.
+    """
+    partes = [apply_filters(df if cols is None else df[cols], index, selecoes, data_ini, data_fim)
+              for df, index in ((ds.df, ds.index), *ds.tails)]
+    return partes[0] if len(partes) == 1 else concat_compact(partes).reset_index(drop=True)
+
+
+def all_rows(ds: "Dataset") -> pd.DataFrame:
+    """Todas as linhas do dataset em memória (a base, ou base e caudas concatenadas)."""
+    return ds.df if not ds.tails else concat_compact([ds.df, *(t.df for t in ds.tails)]).reset_index(drop=True)
+
+
+class FilterOptions(NamedTuple):
+    """Opções dos filtros do topo de uma versão do dataset, calculadas uma única vez.
+
+    `valores` tem os valores ordenados de cada dimensão de `FILTER_DIMS` e `municipios` os
+    municípios de cada estado; os reruns apenas leem as tuplas. Ficam gravadas no cache
+    colunar e, na ingestão incremental, são unidas às da cauda (`merged`).
+    """
+    valores: dict      # dimensão -> tupla ordenada de valores
+    municipios: dict   # estado -> tupla ordenada de municípios
+    data_min: pd.Timestamp
+    data_max: pd.Timestamp
+    n_vendas: int
+
+    @classmethod
+    def from_rows(cls, df: pd.DataFrame) -> "FilterOptions":
+        """Opções de um conjunto de linhas (o dataset inteiro, um bloco ou uma cauda)."""
+        pares = df.groupby(["estado", "municipio"], observed=True).size().index  # pares existentes, ordenados
+        municipios: dict = {}
+        for estado, municipio in pares:
+            municipios.setdefault(estado, []).append(municipio)
+        return cls(
+            valores={dim: tuple(sorted(df[dim].dropna().unique().tolist())) for dim in FILTER_DIMS},
+            municipios={estado: tuple(lista) for estado, lista in municipios.items()},
+            data_min=df["data_venda"].min(),
+            data_max=df["data_venda"].max(),
+            n_vendas=len(df),
+        )
+
+    def merged(self, outra: "FilterOptions") -> "FilterOptions":
+        """Opções da união de duas partes do dataset (ex.: versão anterior + cauda anexada)."""
+        unir = lambda a, b: tuple(sorted(set(a) | set(b)))
+        estados = self.municipios.keys() | outra.municipios.keys()
+        return FilterOptions(
+            valores={dim: unir(self.valores[dim], outra.valores[dim]) for dim in FILTER_DIMS},
+            municipios={e: unir(self.municipios.get(e, ()), outra.municipios.get(e, ())) for e in sorted(estados)},
+            data_min=min((d for d in (self.data_min, outra.data_min) if pd.notna(d)), default=pd.NaT),
+            data_max=max((d for d in (self.data_max, outra.data_max) if pd.notna(d)), default=pd.NaT),
+            n_vendas=self.n_vendas + outra.n_vendas,
+        )
+
+    def to_json(self) -> dict:
+        datas = {k: None if pd.isna(d) else d.isoformat() for k, d in (("data_min", self.data_min), ("data_max", self.data_max))}
+        return {"valores": self.valores, "municipios": self.municipios, **datas, "n_vendas": self.n_vendas}
+
+    @classmethod
+    def from_json(cls, d: dict) -> "FilterOptions":
+        return cls(
+            valores={dim: tuple(v) for dim, v in d["valores"].items()},
+            municipios={e: tuple(m) for e, m in d["municipios"].items()},
+            data_min=pd.Timestamp(d["data_min"]) if d["data_min"] else pd.NaT,
+            data_max=pd.Timestamp(d["data_max"]) if d["data_max"] else pd.NaT,
+            n_vendas=int(d["n_vendas"]),
+        )
+
+
+# ------------------------------------------------------------
+# Rollup — agregados compartilhados entre KPIs, gráficos e mapas
+# ------------------------------------------------------------
+# Cubo pré-agregado na carga: uma célula por (mês × dimensões dos gráficos e dos sketches).
+# O grão é grosso de propósito — o cubo fica bem menor que as linhas; filtros nas demais
+# dimensões (município, vendedor, categoria do cliente) são respondidos pelas linhas.
+CUBE_DIMS = ["estado", "loja", "categoria_produto", "venda_parcelada"]
+PERIOD_KEYS = {"data_venda", *DERIVED_COLUMNS}  # chaves de agrupamento que formam séries temporais
+CUBE_MEASURES = {
+    "preco_total": "sum",
+    "quantidade_vendida": "sum",
+    "id_venda": "count",
+    "n_linhas": "size",
+}
+
+
+def month_start(datas: pd.Series) -> pd.Series:
+    """1º dia do mês de cada data (NaT preservado), no mesmo dtype."""
+    return pd.Series(datas.to_numpy().astype("datetime64[M]").astype(datas.dtype), index=datas.index, name=datas.name)
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega as linhas brutas em células (mês × `CUBE_DIMS`) com soma/contagem.
+
+    `data_venda` da célula é o 1º dia do mês. Medidas aditivas: meses inteiros de qualquer
+    recorte de `CUBE_DIMS` são re-somados a partir do cubo. Também inclui as chaves de mês
+    usadas pelas séries temporais.
+    """
+    cube = df.groupby([month_start(df["data_venda"]), *CUBE_DIMS], as_index=False, dropna=False, sort=False,
+                      observed=True).agg(
+        preco_total=("preco_total", "sum"),
+        quantidade_vendida=("quantidade_vendida", "sum"),
+        id_venda=("id_venda", "count"),
+        n_linhas=("id_venda", "size"),
+    )
+    return finish_cube(cube)
+
+
+def finish_cube(cube: pd.DataFrame) -> pd.DataFrame:
+    """Completa células já agregadas com as chaves de mês, compactadas e por data."""
+    return compact_dtypes(sort_by_date(with_derived(cube, "ano", "mes", "mes_ord")))
+
+
+def compact_cube(cube: pd.DataFrame) -> pd.DataFrame:
+    """Re-soma células repetidas (ex.: cubos parciais de vários blocos concatenados)."""
+    chaves = [c for c in cube.columns if c not in CUBE_MEASURES]
+    soma = cube.groupby(chaves, as_index=False, dropna=False, sort=False, observed=True)[list(CUBE_MEASURES)].sum()
+    return compact_dtypes(sort_by_date(soma[list(cube.columns)]))
+
+
+# Rollup diário materializado na carga: uma célula por (dia × `DIARIO_DIMS`) com as medidas do
+# cubo, em ordem de dia. Serve as séries temporais (dia e mês) e os recortes por vendedor, que
+# o cubo mensal não cobre; filtros nas demais dimensões caem para as linhas.
+DIARIO_DIMS = ["categoria_produto", "estado", "loja", "nome_vendedor"]
+
+
+def build_daily(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega as linhas em células (dia × `DIARIO_DIMS`) com soma/contagem, em ordem de dia.
+
+    Vendas sem data ficam de fora: nenhum período as seleciona.
+    """
+    diario = df.groupby(["data_venda", *DIARIO_DIMS], as_index=False, dropna=False, sort=False,
+                        observed=True).agg(
+        preco_total=("preco_total", "sum"),
+        quantidade_vendida=("quantidade_vendida", "sum"),
+        id_venda=("id_venda", "count"),
+        n_linhas=("id_venda", "size"),
+    )
+    return compact_dtypes(sort_by_date(diario.dropna(subset=["data_venda"])))
+
+
+def coarsen_daily(diario: pd.DataFrame, dims: list) -> pd.DataFrame:
+    """Re-soma as células do rollup diário mantendo só as dimensões `dims` (e o dia)."""
+    soma = diario.groupby(["data_venda", *dims], as_index=False, dropna=False, sort=False,
+                          observed=True)[list(CUBE_MEASURES)].sum()
+    return compact_dtypes(sort_by_date(soma))
+
+
+def merge_daily(*partes: pd.DataFrame) -> pd.DataFrame:
+    """Une rollups diários de partes disjuntas das linhas (blocos, partições, cauda anexada).
+
+    A maior parte é a base: só as células dela nos dias que aparecem nas demais são
+    re-somadas, e o resultado é intercalado na ordem de dia sem reordenar a base — numa
+    cauda anexada o custo acompanha os dias da cauda, não o histórico. Partes com
+    dimensões diferentes (ver `_fit_budget`) ficam no grão mais grosso.
+    """
+    if not partes:
+        return build_daily(pd.DataFrame({"data_venda": pd.Series([], dtype="datetime64[ns]"),
+                                         **{d: pd.Series([], dtype=object) for d in DIARIO_DIMS},
+                                         "preco_total": [], "quantidade_vendida": [], "id_venda": []}))
+    dims = [d for d in DIARIO_DIMS if all(d in p.columns for p in partes)]
+    partes = [p if len(p.columns) == len(dims) + 1 + len(CUBE_MEASURES) else coarsen_daily(p, dims) for p in partes]
+    cheias = [p for p in partes if len(p)]
+    if len(cheias) <= 1:
+        return cheias[0] if cheias else partes[0]
+    base = max(cheias, key=len)
+    outras = concat_compact([p for p in cheias if p is not base])
+    tocados = base["data_venda"].isin(outras["data_venda"].unique()).to_numpy()
+    novas = coarsen_daily(concat_compact([base[tocados], outras]), dims)
+    # Posição final: células mantidas da base em ordem (chaves pares); cada célula nova entra
+    # logo depois das mantidas com data <= a sua (chave ímpar)
+    mantidas = np.flatnonzero(~tocados)
+    pos = base["data_venda"].to_numpy()[mantidas].searchsorted(novas["data_venda"].to_numpy(), side="right")
+    chave = np.concatenate([2 * np.arange(len(mantidas)), 2 * pos - 1])
+    ordem = np.concatenate([mantidas, len(base) + np.arange(len(novas))])[np.argsort(chave, kind="stable")]
+    return concat_compact([base, novas]).take(ordem).reset_index(drop=True)
+
+
+def daily_totals(diario: pd.DataFrame) -> pd.DataFrame:
+    """Faturamento e nº de vendas por dia (só dias com venda) de células do rollup diário."""
+    return diario.groupby("data_venda")[["preco_total", "n_linhas"]].sum().rename_axis("dia")
+
+
+def with_keys(df: pd.DataFrame, dims: list) -> pd.DataFrame:
+    """`df` com as colunas de mês (ver `DERIVED_COLUMNS`) de `dims` que ele não tem."""
+    derivadas = [d for d in dims if d not in df.columns and d in DERIVED_COLUMNS]
+    return with_derived(df, *derivadas) if derivadas else df
+
+
+class Rollup:
+    """Agregados de um estado de filtros, calculados uma única vez e compartilhados.
+
+    Agrupamentos por colunas do cubo são re-somados a partir do cubo filtrado (pequeno);
+    os demais (ex.: `nome_cliente`, município) e recortes que o cubo não cobre (`cube`
+    None, ex.: filtro por vendedor) caem para as linhas filtradas. Os resultados ficam
+    memoizados e não devem ser alterados in-place pelos consumidores. Pode ser consultado
+    por várias threads ao mesmo tempo (no pior caso um agregado é calculado duas vezes).
+
+    No modo streaming `rows` é apenas uma amostra (`amostrado=True`) e os agregados fora
+    do cubo chegam prontos em `extras` (tupla de dimensões -> todas as medidas por valor).
+
+    `diario` são as células do rollup diário no recorte (ver `daily_slice`), ou None quando
+    ele não cobre os filtros: agrupamentos por mês ou dia vêm dele; os demais vêm do cubo
+    (menor) e, sem cubo, também dele.
+
+    No modo aproximado, quando os sketches cobrem o recorte, `aprox` (`vendas_sketch.Recorte`)
+    responde clientes distintos, histograma e boxplot de `preco_total` sem usar as linhas.
+    """
+
+    def __init__(self, rows: pd.DataFrame, cube: pd.DataFrame | None, extras: dict | None = None,
+                 amostrado: bool = False, aprox=None, diario: pd.DataFrame | None = None):
+        self.rows = rows
+        self.cube = cube
+        self.extras = extras or {}
+        self.amostrado = amostrado
+        self.aprox = aprox
+        self.diario = diario
+        self._memo: dict = {}
+
+    def _tabela(self, chaves: list):
+        """`(fonte, células)` pré-agregadas que respondem o agrupamento por `chaves`, ou None."""
+        tabelas = [("cubo", self.cube, ()), ("diario", self.diario, DERIVED_COLUMNS)]
+        if not set(chaves).isdisjoint(PERIOD_KEYS):
+            tabelas.reverse()  # séries temporais: grão de dia, sem depender do cubo mensal
+        for fonte, tabela, derivadas in tabelas:
+            if tabela is not None and set(chaves) <= set(tabela.columns) | set(derivadas):
+                return fonte, tabela
+        return None
+
+    def by(self, dims, *medidas) -> pd.DataFrame:
+        """Agregado de `medidas` por `dims` (colunas: dims + medidas)."""
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        key = (tuple(dims), medidas)
+        if key not in self._memo:
+            with thread_span(f"groupby:{'+'.join(dims)}") as sp:
+                chaves = [d for d in dims if d not in ("lat", "lon")]  # geocódigo entra depois, pelo município
+                grupo = next((g for g in self.extras if set(chaves) <= set(g)), None)
+                if (tabela := self._tabela(chaves)) is not None:
+                    fonte, entrada = tabela
+                elif grupo is not None:
+                    fonte, entrada = "extras", self.extras[grupo]
+                else:
+                    fonte, entrada = "linhas", self.rows
+                if fonte == "linhas":
+                    g = with_keys(self.rows, chaves).groupby(chaves, observed=True)
+                    base = pd.concat(
+                        [(g.size() if CUBE_MEASURES[m] == "size" else g[m].agg(CUBE_MEASURES[m])).rename(m)
+                         for m in medidas], axis=1
+                    ).reset_index()
+                else:
+                    base = with_keys(entrada, chaves).groupby(chaves, as_index=False, observed=True)[list(medidas)].sum()
+                if chaves != dims:  # cidades sem geocódigo ficam de fora, como num groupby por lat/lon
+                    base = with_geocodes(base).dropna(subset=["lat", "lon"])[dims + list(medidas)].reset_index(drop=True)
+                self._memo[key] = _plain_keys(base)
+                sp.update(fonte=fonte, linhas_entrada=len(entrada), linhas_saida=len(base))
+        return self._memo[key]
+
+    def total(self, medida: str) -> float:
+        """Total de uma medida aditiva no recorte."""
+        key = ("total", medida)
+        if key not in self._memo:
+            if self.cube is not None:
+                self._memo[key] = self.cube[medida].sum()
+            else:
+                agg = CUBE_MEASURES[medida]
+                self._memo[key] = len(self.rows) if agg == "size" else self.rows[medida].agg(agg)
+        return self._memo[key]
+
+    def nunique(self, col: str) -> int:
+        """Nº de valores distintos de `col` nas linhas filtradas (não é aditivo)."""
+        key = ("nunique", col)
+        if key not in self._memo:
+            if self.aprox is not None and col == self.aprox.distintos:
+                self._memo[key] = self.aprox.nunique()
+            elif (col,) in self.extras:
+                self._memo[key] = len(self.extras[(col,)])
+            else:
+                self._memo[key] = self.rows[col].nunique() if col in self.rows.columns else 0
+        return self._memo[key]
+
+    # Agregados que precisam das linhas (não do cubo): histograma, boxplot e amostra
+    def hist(self, col: str, nbins: int = HIST_BINS) -> pd.DataFrame:
+        """Histograma de `col` (ver `hist_bins`)."""
+        if self.aprox is not None and col == self.aprox.quantis:
+            return self.aprox.hist(nbins)
+        return hist_bins(self.rows[col], nbins)
+
+    def box(self, grupo: str, valor: str) -> tuple:
+        """Estatísticas do boxplot de `valor` por `grupo` (ver `box_stats`)."""
+        if self.aprox is not None and valor == self.aprox.quantis and grupo in self.aprox.dims:
+            return self.aprox.box(grupo)
+        return box_stats(self.rows, grupo, valor)
+
+    def sample(self, cols: list, grupo: str, n: int = PLOT_MAX_POINTS) -> pd.DataFrame:
+        """Até `n` linhas de `cols`, estratificadas por `grupo` (ver `stratified_sample`)."""
+        return _plain_keys(stratified_sample(self.rows[cols], grupo, n))
+
+
+def _active(selecoes: dict) -> dict:
+    """Seleções efetivas (sem "(Todos)"/"(Todas)")."""
+    return {dim: v for dim, v in selecoes.items() if v != FILTER_DIMS[dim]}
+
+
+def cube_slice(ds: "Dataset", rows: pd.DataFrame, selecoes: dict, data_ini, data_fim) -> pd.DataFrame | None:
+    """Células que somam exatamente as linhas filtradas `rows`, ou None se o cubo não cobre o recorte.
+
+    Cobre seleções apenas em `CUBE_DIMS`: os meses com todas as vendas dentro do período
+    vêm do cubo; os meses cortados pelo período (no máximo o primeiro e o último) são
+    agregados a partir das linhas filtradas desses meses.
+    """
+    ativos = _active(selecoes)
+    if not set(ativos) <= set(CUBE_DIMS):
+        return None
+    dias = pd.Series(ds.diario["data_venda"].unique())
+    meses = dias.groupby(month_start(dias)).agg(["min", "max"])
+    inteiros = meses.index[(meses["min"] >= pd.to_datetime(data_ini)) & (meses["max"] <= pd.to_datetime(data_fim))]
+    cube = ds.cube
+    mask = cube["data_venda"].isin(inteiros).to_numpy()
+    for dim, valor in ativos.items():
+        mask = mask & (cube[dim] == valor).to_numpy()
+    if len(inteiros) == 0:
+        return build_cube(rows)
+    datas = rows["data_venda"].to_numpy()  # meses inteiros são consecutivos: a borda fica antes/depois deles
+    fora = (datas < inteiros.min().to_datetime64()) | (datas >= (inteiros.max() + pd.offsets.MonthBegin()).to_datetime64())
+    borda = rows[fora]
+    return concat_compact([cube[mask], build_cube(borda)]) if len(borda) else cube[mask]
+
+
+def build_rollup(ds: "Dataset", selecoes: dict, data_ini, data_fim) -> Rollup:
+    """Rollup do estado de filtros atual.
+
+    Em memória as linhas vêm do índice do DataFrame e o cubo entra quando cobre o recorte
+    (ver `cube_slice`), assim como o rollup diário (ver `daily_slice`); no modo streaming,
+    amostra, cubo e agregados fora dele vêm de uma passada em blocos pelas partições (ver
+    `stream_query`). Com um backend SQL nada é
+    filtrado aqui: o `SqlRollup` compila cada agregado numa consulta ao banco.
+    """
+    if ds.sql is not None:
+        return ds.sql.rollup(selecoes, data_ini, data_fim)
+    diario = daily_slice(ds, selecoes, data_ini, data_fim)
+    if ds.df is not None:
+        rows = filter_rows(ds, selecoes, data_ini, data_fim)
+        rollup = Rollup(rows, cube_slice(ds, rows, selecoes, data_ini, data_fim), diario=diario)
+    else:
+        ativos = tuple(sorted(_active(selecoes).items()))
+        amostra, extras, cube = stream_query(CSV_PATH, ds.offset, ds.chave, ds.partitions, ativos,
+                                             str(data_ini), str(data_fim))
+        rollup = Rollup(amostra, cube, extras, amostrado=True, diario=diario)
+    if ds.sketches is not None:
+        rollup.aprox = ds.sketches.recorte(selecoes, data_ini, data_fim, int(rollup.total("n_linhas")))
+    return rollup
+
+
+def daily_slice(ds: "Dataset", selecoes: dict, data_ini, data_fim) -> pd.DataFrame | None:
+    """Células do rollup diário no período com as seleções, ou None se ele não cobre o recorte.
+
+    O rollup está em ordem de dia: o período é uma fatia por busca binária e só as células
+    dela passam pelas máscaras das dimensões.
+    """
+    ativos = _active(selecoes)
+    if ds.diario is None or not set(ativos) <= set(ds.diario.columns):
+        return None
+    datas = ds.diario["data_venda"]
+    lo = datas.searchsorted(pd.to_datetime(data_ini), side="left")
+    hi = datas.searchsorted(pd.to_datetime(data_fim), side="right")
+    fatia = ds.diario.iloc[lo:hi]
+    if not ativos:
+        return fatia
+    mask = np.ones(len(fatia), dtype=bool)
+    for dim, valor in ativos.items():
+        mask &= (fatia[dim] == valor).to_numpy()
+    return fatia[mask]
+
+
+def daily_series(ds: "Dataset", selecoes: dict, data_ini, data_fim, lookback_dias: int = 0) -> pd.DataFrame:
+    """Série diária (faturamento e nº de vendas; dias sem venda = 0).
+
+    Com filtros só em `DIARIO_DIMS` soma as células do rollup diário mantido na
+    carga/ingestão (custo independe do nº de vendas); com filtros nas demais dimensões
+    agrega as linhas filtradas (ou, no streaming, uma passada pelas partições do período).
+    `lookback_dias` estende o início para janelas móveis e YoY.
+    """
+    ini = pd.to_datetime(data_ini) - pd.Timedelta(days=lookback_dias)
+    fim = pd.to_datetime(data_fim)
+    ativos = _active(selecoes)
+    if ds.sql is not None:
+        serie = ds.sql.daily(selecoes, ini, fim)
+    elif (diario := daily_slice(ds, selecoes, ini, fim)) is not None:
+        serie = daily_totals(diario)
+    elif ds.df is not None:
+        cols = ["data_venda", *DIARIO_DIMS, "preco_total", "quantidade_vendida", "id_venda"]
+        serie = daily_totals(build_daily(filter_rows(ds, selecoes, ini, fim, cols)))
+    else:
+        serie = stream_daily(CSV_PATH, ds.offset, ds.chave, ds.partitions, tuple(sorted(ativos.items())),
+                             str(ini), str(fim))
+    return serie.reindex(pd.date_range(ini, fim, freq="D"), fill_value=0).rename_axis("dia")
+
+
+# ------------------------------------------------------------
+# Dataset — carga completa, cache colunar e ingestão incremental
+# ------------------------------------------------------------
+class Dataset(NamedTuple):
+    """Versão imutável do dataset: linhas, índice de filtros, cubo mensal e série diária.
+
+    Em memória `df`/`index` são a base (a do cache colunar) e `tails` os segmentos anexados
+    depois dela (ver `filter_rows`/`all_rows`). No modo streaming `df` e `index` são None:
+    só os agregados (pequenos) ficam em memória. Com um backend SQL também; as linhas ficam
+    no banco e `sql` aponta para o recorte desta versão.
+    """
+    df: pd.DataFrame | None
+    index: FilterIndex | None
+    cube: pd.DataFrame | None  # streaming: None se o cubo passar da sua parte do orçamento
+    diario: pd.DataFrame  # rollup diário: dia × `DIARIO_DIMS` (ver `build_daily`)
+    offset: int        # byte do CSV até onde as linhas foram consumidas
+    marker: str        # hash do prefixo consumido (ver `_prefix_marker`)
+    fingerprint: tuple
+    version: int
+    partitions: tuple = ()  # streaming: ((mês "AAAA-MM", arquivo Feather), ...) do cache particionado
+    sql: object = None      # backend SQL: `vendas_sql.SqlSnapshot` (linhas visíveis nesta versão)
+    opcoes: FilterOptions | None = None  # opções dos filtros desta versão
+    sketches: object = None  # modo aproximado: `vendas_sketch.Sketches` por célula (None no exato/SQL)
+    tails: tuple = ()        # em memória: `Segment`s anexados depois da base
+
+    @property
+    def chave(self) -> tuple:
+        """Identifica o conteúdo desta versão nos caches de resultados.
+
+        `offset`/`marker` sozinhos não bastam: uma reescrita do CSV com o mesmo tamanho pode
+        manter o marker amostrado, então o mtime do CSV lido também entra.
+        """
+        return self.offset, self.marker, self.fingerprint[0] if self.fingerprint else None
+
+
+def build_sketches(df: pd.DataFrame):
+    """Sketches por célula das linhas `df` no modo aproximado (`APPROX`); None no modo exato."""
+    if not APPROX:
+        return None
+    import vendas_sketch  # sob demanda: só o modo aproximado usa sketches
+    return vendas_sketch.Sketches.from_rows(df, vendas_sketch.hll_precisao(APPROX_ERRO_DISTINTOS),
+                                            vendas_sketch.tdigest_delta(APPROX_ERRO_QUANTIS))
+
+
+def _merge_sketches(*partes):
+    partes = [s for s in partes if s is not None]
+    return partes[0].merged(*partes[1:]) if partes else None
+
+
+class Agregados(NamedTuple):
+    """Resumos de um conjunto de linhas que se unem por soma: cubo mensal, rollup diário,
+    opções dos filtros e (modo aproximado) sketches.
+
+    Partes disjuntas do dataset (blocos, partições, cauda anexada) são unidas com `merged`.
+    """
+    cube: pd.DataFrame | None  # None quando o cubo não coube no orçamento do streaming
+    diario: pd.DataFrame
+    opcoes: FilterOptions
+    sketches: object = None
+
+    @classmethod
+    def from_rows(cls, df: pd.DataFrame) -> "Agregados":
+        return cls(build_cube(df), build_daily(df), FilterOptions.from_rows(df), build_sketches(df))
+
+    def merged(self, *outras: "Agregados") -> "Agregados":
+        partes = (self, *outras)
+        return Agregados(
+            cube=None if any(p.cube is None for p in partes) else compact_cube(
+                pd.concat([p.cube for p in partes], ignore_index=True)),
+            diario=merge_daily(*(p.diario for p in partes)),
+            opcoes=functools.reduce(FilterOptions.merged, (p.opcoes for p in partes)),
+            sketches=_merge_sketches(*(p.sketches for p in partes)),
+        )
+
+
+def _agregados(ds: Dataset) -> Agregados:
+    return Agregados(ds.cube, ds.diario, ds.opcoes, ds.sketches)
+
+
+def _extend_dataset(ds: Dataset, tail: pd.DataFrame, offset: int, marker: str, fingerprint: tuple) -> Dataset:
+    """Anexa linhas novas (já tipadas e em ordem de data) gerando uma nova versão; a anterior continua válida.
+
+    Em memória a cauda vira um segmento com índice próprio (custo proporcional às linhas
+    novas); a base só é refeita em `_compact`, quando as caudas passam do limite.
+    """
+    if tail.empty:
+        return ds._replace(offset=offset, marker=marker, fingerprint=fingerprint)
+    novo = ds._replace(
+        **_agregados(ds).merged(Agregados.from_rows(tail))._asdict(),
+        offset=offset,
+        marker=marker,
+        fingerprint=fingerprint,
+        version=ds.version + 1,
+    )
+    if ds.df is None:
+        return novo
+    return novo._replace(tails=(*ds.tails, Segment(tail, FilterIndex(tail))))
+
+
+def _compact(ds: Dataset, csv_path: str) -> Dataset:
+    """Une base e caudas num único DataFrame ordenado quando as caudas passam do limite.
+
+    O resultado é regravado no cache colunar (com cubo, série diária e índice) para que a
+    próxima carga parta dele.
+    """
+    n_caudas = sum(len(t.df) for t in ds.tails)
+    if not ds.tails or (n_caudas <= COMPACT_FRACTION * len(ds.df) and len(ds.tails) <= COMPACT_MAX_SEGMENTS):
+        return ds
+    df = sort_by_date(concat_compact([ds.df, *(t.df for t in ds.tails)]))
+    index = FilterIndex(df)
+    cache_path = _cache_path(csv_path)
+    _write_cache(df, cache_path, ds.offset, ds.marker, ds.fingerprint[0], ds.opcoes)
+    _write_aggregates(cache_path, ds.offset, ds.marker, ds.cube, ds.diario, index)
+    return ds._replace(df=df, index=index, tails=())
+
+
+def _full_load(csv_path: str, fingerprint: tuple, version: int) -> Dataset:
+    """Carga completa no backend/modo configurado (`BACKEND`, `DATA_MODE`)."""
+    if BACKEND != "pandas":
+        return _sql_load(csv_path, fingerprint, version)
+    if use_streaming(fingerprint[1]):
+        return _stream_load(csv_path, fingerprint, version)
+    return _memory_load(csv_path, fingerprint, version)
+
+
+def _memory_load(csv_path: str, fingerprint: tuple, version: int) -> Dataset:
+    """Carrega do cache colunar (mais a cauda anexada depois dele) ou relê o CSV inteiro.
+
+    Cubo, série diária e índice de filtros ficam em arquivos ao lado do cache, marcados
+    com o mesmo prefixo do CSV, e só são recalculados quando o cache é refeito. A cauda
+    anexada depois do cache entra como segmento (ver `_extend_dataset`).
+    """
+    cache_path = _cache_path(csv_path)
+    fim = fingerprint[1]
+    cached = _read_cache(cache_path, csv_path)
+    if cached is not None:
+        df, offset, opcoes, marker = cached
+        gravados = _read_aggregates(cache_path, df, offset, marker)
+    else:
+        df = sort_by_date(compact_dtypes(_clean_types(_read_csv_range(csv_path, 0, fim))))
+        offset, marker = fim, _prefix_marker(csv_path, fim)
+        opcoes, gravados = FilterOptions.from_rows(df), None
+        _write_cache(df, cache_path, offset, marker, fingerprint[0], opcoes)
+    if gravados is None:
+        gravados = build_cube(df), build_daily(df), FilterIndex(df)
+        _write_aggregates(cache_path, offset, marker, *gravados)
+    cube, diario, index = gravados
+    ds = Dataset(df, index, cube, diario, offset, marker, (), version, opcoes=opcoes, sketches=build_sketches(df))
+    if offset < fim:
+        tail = sort_by_date(compact_dtypes(_clean_types(_read_csv_range(csv_path, offset, fim))))
+        ds = _extend_dataset(ds, tail, fim, _prefix_marker(csv_path, fim), fingerprint)
+        ds = _compact(ds, csv_path)
+    return ds._replace(fingerprint=fingerprint, version=version)
+
+
+class DatasetStore:
+    """Mantém a versão corrente do dataset de um CSV, compartilhada entre sessões.
+
+    Quando o CSV muda, verifica se o prefixo já consumido está intacto: se sim, lê apenas
+    a cauda anexada (custo proporcional às linhas novas); senão faz a carga completa.
+    """
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        self._current: Dataset | None = None
+
+    def current(self) -> Dataset:
+        """Versão atualizada do dataset (verifica o CSV com um `stat`)."""
+        fingerprint = _csv_fingerprint(self.csv_path)
+        ds = self._current
+        if ds is not None and ds.fingerprint == fingerprint:
+            return ds
+        with self._lock:
+            ds = self._current
+            if ds is None or ds.fingerprint != fingerprint:
+                ds = self._refresh(ds, fingerprint)
+                self._current = ds
+        return ds
+
+    def _refresh(self, ds, fingerprint: tuple) -> Dataset:
+        if ds is None:
+            return _full_load(self.csv_path, fingerprint, 1)
+        if INCREMENTAL and _prefix_intact(self.csv_path, ds.offset, ds.marker, ds.fingerprint[0]):
+            fim = fingerprint[1]
+            if fim == ds.offset:  # só o mtime mudou (conteúdo confirmado pelo hash do prefixo inteiro)
+                return ds._replace(fingerprint=fingerprint)
+            tail = sort_by_date(compact_dtypes(_clean_types(_read_csv_range(self.csv_path, ds.offset, fim))))
+            marker = _prefix_marker(self.csv_path, fim)
+            novo = _extend_dataset(ds, tail, fim, marker, fingerprint)
+            if ds.sql is not None:
+                novo = novo._replace(sql=ds.sql.append(tail, fim, marker, fingerprint[0]))
+            elif ds.df is None:
+                novo = novo._replace(partitions=_stream_append(ds, novo, self.csv_path, tail))
+            else:
+                novo = _compact(novo, self.csv_path)
+            return novo
+        return _full_load(self.csv_path, fingerprint, ds.version + 1)
+
+
+@functools.lru_cache(maxsize=None)
+def dataset_store(csv_path: str) -> DatasetStore:
+    """Store único por processo (compartilhado entre sessões e requisições)."""
+    return DatasetStore(csv_path)
+
+
+def load_dataset(csv_path: str | None = None) -> Dataset:
+    """Versão corrente do dataset (padrão `CSV_PATH`); `FileNotFoundError` se o CSV não existir."""
+    csv_path = csv_path or CSV_PATH
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(csv_path)
+    return dataset_store(csv_path).current()
+
+
+def load_data(csv_path: str | None = None) -> pd.DataFrame:
+    """Carrega e higieniza o dataset fixo `vendas_dashboard.csv` (delimitador ;)
+
+    O DataFrame é compartilhado entre sessões e deve ser tratado como somente leitura.
+    """
+    return all_rows(load_dataset(csv_path))
+
+
+# ------------------------------------------------------------
+# Modo streaming — datasets maiores que a memória (out-of-core)
+# ------------------------------------------------------------
+# Agrupamentos fora do cubo calculados na passada em blocos (parciais mergeáveis)
+STREAM_GROUPS = [("nome_cliente",), ("nome_vendedor",), ("estado", "municipio")]
+
+
+def use_streaming(csv_bytes: int) -> bool:
+    """Decide o modo: forçado por `VENDAS_MODE` ou, em "auto", pelo orçamento de memória."""
+    if DATA_MODE in ("memoria", "streaming"):
+        return DATA_MODE == "streaming"
+    return csv_bytes * CSV_MEMORY_FACTOR > MEMORY_BUDGET_MB * 1024 * 1024
+
+
+def _stream_budget(csv_path: str) -> tuple:
+    """Linhas por bloco e tamanho da amostra que cabem no orçamento de memória.
+
+    Um quarto do orçamento vai para o bloco em processamento e um décimo para a amostra
+    de cada consulta; o cache de resultados fica com outro quarto (ver `result_cache`) e
+    o cubo residente com um décimo (ver `_fit_budget`).
+    """
+    with open(csv_path, "rb") as fh:
+        fh.readline()
+        amostra = fh.read(1 << 20)
+    bytes_linha = max(1, len(amostra) / max(1, amostra.count(b"\n"))) * CSV_MEMORY_FACTOR
+    orcamento = MEMORY_BUDGET_MB * 1024 * 1024
+    chunksize = max(10_000, int(orcamento / 4 / bytes_linha))
+    n_amostra = int(min(200_000, max(5_000, orcamento / 10 / bytes_linha)))
+    return chunksize, n_amostra
+
+
+def _partition_root(csv_path: str) -> str:
+    """Diretório do cache particionado por mês (modo streaming)."""
+    base = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(CACHE_DIR, f"{base}_por_mes")
+
+
+def _read_manifest(csv_path: str):
+    """Manifesto do cache particionado, se ainda corresponder ao prefixo atual do CSV (ver `_prefix_intact`)."""
+    try:
+        with open(os.path.join(_partition_root(csv_path), "manifest.json"), encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        offset = int(manifest["offset"])
+    except (OSError, ValueError, KeyError):
+        return None
+    if manifest.get("schema") != CACHE_SCHEMA \
+            or not _prefix_intact(csv_path, offset, manifest.get("marker"), manifest.get("mtime")):
+        return None
+    return manifest
+
+
+def _stream_cache_path(csv_path: str) -> str:
+    """Base dos agregados gravados ao lado do manifesto (ver `_aggregate_path`)."""
+    return os.path.join(_partition_root(csv_path), "agregados.feather")
+
+
+def _write_part(root: str, manifest: dict, mes: str, parte: pd.DataFrame) -> None:
+    rel = os.path.join(f"mes={mes}", f"part-{manifest['seq']:06d}.feather")
+    os.makedirs(os.path.join(root, f"mes={mes}"), exist_ok=True)
+    feather.write_feather(parte.reset_index(drop=True), os.path.join(root, rel))
+    manifest["parts"].append([mes, rel])
+    manifest["seq"] += 1
+
+
+def _write_partitions(csv_path: str, manifest: dict, chunk: pd.DataFrame) -> None:
+    """Grava um bloco como arquivos Feather por mês (`mes=AAAA-MM/part-N.feather`)."""
+    root = os.path.join(_partition_root(csv_path), manifest["geracao"])
+    meses = with_derived(chunk[["data_venda"]], "mes_ord")["mes_ord"]
+    for mes, parte in chunk.groupby(meses, sort=False):
+        _write_part(root, manifest, mes, parte)
+
+
+def _consolidate_partitions(csv_path: str, manifest: dict, desde: int, limite: int) -> None:
+    """Une as partes `manifest["parts"][desde:]` de cada mês em arquivos de até ~`limite` linhas.
+
+    Cada bloco do CSV deixa uma parte pequena por mês; unidas, uma consulta abre poucos
+    arquivos. Só são tocadas partes ainda fora do manifesto gravado (nenhum leitor as usa).
+    """
+    root = os.path.join(_partition_root(csv_path), manifest["geracao"])
+    por_mes = {}
+    for mes, rel in manifest["parts"][desde:]:
+        por_mes.setdefault(mes, []).append(rel)
+    del manifest["parts"][desde:]
+    for mes, rels in por_mes.items():
+        lote, n = [], 0
+        for i, rel in enumerate(rels):
+            lote.append(feather.read_feather(os.path.join(root, rel)))
+            n += len(lote[-1])
+            if n >= limite or i == len(rels) - 1:
+                _write_part(root, manifest, mes, pd.concat(lote, ignore_index=True))
+                lote, n = [], 0
+        for rel in rels:
+            os.remove(os.path.join(root, rel))
+
+
+def _commit_manifest(csv_path: str, manifest: dict, offset: int, marker: str, mtime_ns: int,
+                     opcoes: FilterOptions) -> tuple:
+    """Grava o manifesto (troca atômica) e devolve as partições para o `Dataset`."""
+    manifest.update(offset=offset, marker=marker, mtime=mtime_ns, schema=CACHE_SCHEMA, opcoes=opcoes.to_json())
+    root = _partition_root(csv_path)
+    tmp_path = os.path.join(root, f"manifest.json.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp_path, os.path.join(root, "manifest.json"))
+    for antiga in os.listdir(root):  # gerações anteriores (após reescrita do CSV)
+        if antiga.startswith("g-") and antiga != manifest["geracao"]:
+            shutil.rmtree(os.path.join(root, antiga), ignore_errors=True)
+    geracao = os.path.join(root, manifest["geracao"])
+    return tuple((mes, os.path.join(geracao, rel)) for mes, rel in manifest["parts"])
+
+
+def _accumulate(partes: list, novo: Agregados, limite: int) -> None:
+    """Acrescenta `novo` às partes, unindo-as quando cubos e rollups diários passam de `limite` células
+    (memória limitada)."""
+    partes.append(novo)
+    if sum(len(p.cube) + len(p.diario) for p in partes) > limite:
+        unido = partes[0].merged(*partes[1:])
+        partes[:] = [unido._replace(diario=_fit_daily(unido.diario))]
+
+
+def _stream_ingest(csv_path: str, manifest, inicio: int, fim: int, partes: list) -> None:
+    """Lê [inicio, fim) em blocos, acumulando os agregados de cada bloco e gravando partições mensais."""
+    chunksize, _ = _stream_budget(csv_path)
+    for chunk in _iter_csv_chunks(csv_path, inicio, fim, chunksize):
+        if manifest is not None:
+            _write_partitions(csv_path, manifest, chunk)
+        _accumulate(partes, Agregados.from_rows(chunk), chunksize)
+
+
+def _fit_budget(agg: Agregados) -> Agregados:
+    """Limita cubo e rollup diário residentes do streaming a um décimo do orçamento cada.
+
+    As consultas somam o cubo do recorte a partir das partições (ver `stream_query`); o
+    cubo residente só resume o dataset, então sai em vez de estourar a memória. O rollup
+    diário passa a totais por dia: a série sem filtros continua residente e as filtradas
+    voltam a ler as partições (ver `stream_daily`).
+    """
+    if agg.cube is not None and agg.cube.memory_usage(deep=True).sum() > MEMORY_BUDGET_MB * 1024 * 1024 / 10:
+        perf_log.warning("cubo residente maior que 1/10 do orçamento de memória; mantido só em disco")
+        agg = agg._replace(cube=None)
+    return agg._replace(diario=_fit_daily(agg.diario))
+
+
+def _fit_daily(diario: pd.DataFrame) -> pd.DataFrame:
+    """Rollup diário reduzido a totais por dia quando passa de um décimo do orçamento (ver `_fit_budget`).
+
+    Aplicado já durante a ingestão: uma vez reduzido, os blocos seguintes entram no mesmo grão.
+    """
+    if len(diario.columns) > 1 + len(CUBE_MEASURES) \
+            and diario.memory_usage(deep=True).sum() > MEMORY_BUDGET_MB * 1024 * 1024 / 10:
+        perf_log.warning("rollup diário maior que 1/10 do orçamento de memória; mantidos só os totais por dia")
+        return coarsen_daily(diario, [])
+    return diario
+
+
+def _stream_load(csv_path: str, fingerprint: tuple, version: int) -> Dataset:
+    """Constrói apenas os agregados, bloco a bloco; as linhas brutas nunca ficam todas em memória.
+
+    As linhas tipadas também são gravadas em partições mensais (Feather), reaproveitadas
+    na próxima carga e lidas seletivamente por `stream_query` conforme o período. Cubo,
+    série diária e opções ficam gravados ao lado do manifesto; sem eles (ou no modo
+    aproximado, cujos sketches não são gravados) as partições são relidas.
+    """
+    fim = fingerprint[1]
+    chunksize, _ = _stream_budget(csv_path)
+    partes = []
+    manifest = _read_manifest(csv_path)
+    if manifest is not None:
+        gravados = None
+        if not APPROX and "opcoes" in manifest:
+            gravados = _read_aggregates(_stream_cache_path(csv_path), None, manifest["offset"], manifest["marker"])
+        if gravados is not None:
+            partes.append(Agregados(gravados[0], gravados[1], FilterOptions.from_json(manifest["opcoes"])))
+        else:
+            geracao = os.path.join(_partition_root(csv_path), manifest["geracao"])
+            for _, rel in manifest["parts"]:
+                _accumulate(partes, Agregados.from_rows(feather.read_feather(os.path.join(geracao, rel))), chunksize)
+        inicio = manifest["offset"]
+    else:
+        manifest = {"geracao": f"g-{time.time_ns():x}", "parts": [], "seq": 0}
+        inicio = 0
+    marker = _prefix_marker(csv_path, fim)
+    try:
+        gravadas = len(manifest["parts"])
+        _stream_ingest(csv_path, manifest, inicio, fim, partes)
+        _consolidate_partitions(csv_path, manifest, gravadas, chunksize)
+        agg = _merge_agregados(csv_path, partes, fim)
+        partitions = _commit_manifest(csv_path, manifest, fim, marker, fingerprint[0], agg.opcoes)
+        _write_aggregates(_stream_cache_path(csv_path), fim, marker, agg.cube, agg.diario)
+    except OSError:  # sem escrita em disco: segue sem partições (consultas leem o CSV)
+        partes = []
+        _stream_ingest(csv_path, None, 0, fim, partes)
+        agg = _merge_agregados(csv_path, partes, fim)
+        partitions = ()
+    agg = _fit_budget(agg)
+    return Dataset(None, None, agg.cube, agg.diario, fim, marker, fingerprint, version, partitions,
+                   opcoes=agg.opcoes, sketches=agg.sketches)
+
+
+def _merge_agregados(csv_path: str, partes: list, fim: int) -> Agregados:
+    if partes:
+        return partes[0].merged(*partes[1:])
+    return Agregados.from_rows(compact_dtypes(_clean_types(_read_csv_range(csv_path, 0, fim))))
+
+
+def _stream_append(ds: Dataset, novo: Dataset, csv_path: str, tail: pd.DataFrame) -> tuple:
+    """Grava a cauda anexada como novas partições mensais e atualiza o manifesto e os agregados."""
+    manifest = _read_manifest(csv_path) if ds.partitions else None
+    if manifest is None or manifest["offset"] != ds.offset:
+        return ()
+    try:
+        _write_partitions(csv_path, manifest, _plain_keys(tail))
+        partitions = _commit_manifest(csv_path, manifest, novo.offset, novo.marker, novo.fingerprint[0], novo.opcoes)
+    except OSError:
+        return ()
+    if novo.cube is not None:
+        _write_aggregates(_stream_cache_path(csv_path), novo.offset, novo.marker, novo.cube, novo.diario)
+    return partitions
+
+
+def _filter_mask(chunk: pd.DataFrame, ativos: tuple, ini, fim) -> pd.Series:
+    """Máscara dos filtros do topo para um bloco (mesma semântica de `FilterIndex.select`)."""
+    mask = (chunk["data_venda"] >= ini) & (chunk["data_venda"] <= fim)
+    for dim, valor in ativos:
+        mask &= chunk[dim] == valor
+    return mask
+
+
+def _merge_measures(acum, parte: pd.DataFrame, dims: tuple):
+    """Soma medidas aditivas por `dims` de um bloco ao acumulado."""
+    g = parte.groupby(list(dims), observed=True)
+    novo = pd.DataFrame({m: (g.size() if agg == "size" else g[m].agg(agg)) for m, agg in CUBE_MEASURES.items()})
+    return novo if acum is None else acum.add(novo, fill_value=0)
+
+
+def _iter_stream_blocks(csv_path: str, offset: int, partitions: tuple, ini, fim):
+    """Blocos a varrer numa consulta: partições mensais do período (as demais nem são abertas)
+    ou, sem cache particionado, o CSV inteiro em blocos."""
+    if partitions:
+        mes_ini, mes_fim = ini.strftime("%Y-%m"), fim.strftime("%Y-%m")
+        for mes, path in partitions:
+            if mes != "NaT" and mes_ini <= mes <= mes_fim:
+                yield feather.read_feather(path)
+    else:
+        yield from _iter_csv_chunks(csv_path, 0, offset, _stream_budget(csv_path)[0])
+
+
+def stream_query(csv_path: str, offset: int, chave: tuple, partitions: tuple, ativos: tuple, data_ini: str, data_fim: str):
+    """Uma passada em blocos aplicando os filtros do topo.
+
+    Retorna `(amostra, extras, cubo)`: amostra uniforme (bottom-k por chave aleatória,
+    mergeável entre blocos) para os gráficos de linhas brutas; para cada agrupamento de
+    `STREAM_GROUPS`, as medidas agregadas por valor; e o cubo das linhas filtradas, que
+    responde KPIs e gráficos por colunas do cubo sem depender da amostra.
+    `offset`/`chave` identificam a versão do dataset (ver `Dataset.chave`). O resultado não é memoizado aqui:
+    o Rollup que o carrega já vai para o cache de resultados, limitado em bytes.
+    """
+    _, n_amostra = _stream_budget(csv_path)
+    ini, fim = pd.to_datetime(data_ini), pd.to_datetime(data_fim)
+    rng = np.random.default_rng(0)
+    amostra = None
+    acum = {grupo: None for grupo in STREAM_GROUPS}
+    cubos = []
+    for chunk in _iter_stream_blocks(csv_path, offset, partitions, ini, fim):
+        parte = chunk[_filter_mask(chunk, ativos, ini, fim)]
+        if parte.empty:
+            continue
+        for grupo in STREAM_GROUPS:
+            acum[grupo] = _merge_measures(acum[grupo], parte, grupo)
+        cubos.append(build_cube(parte))
+        parte = parte.assign(_chave=rng.random(len(parte)))
+        amostra = parte if amostra is None else pd.concat([amostra, parte])
+        amostra = amostra.nsmallest(n_amostra, "_chave")
+    if amostra is None:
+        vazio = pd.DataFrame(columns=["data_venda", *CUBE_DIMS, *CUBE_MEASURES, "ano", "mes", "mes_ord"])
+        return pd.DataFrame(), {grupo: pd.DataFrame(columns=[*grupo, *CUBE_MEASURES]) for grupo in STREAM_GROUPS}, vazio
+    extras = {grupo: acum[grupo].reset_index() for grupo in STREAM_GROUPS}
+    return amostra.drop(columns="_chave").sort_index(), extras, compact_cube(pd.concat(cubos, ignore_index=True))
+
+
+@functools.lru_cache(maxsize=32)
+def stream_daily(csv_path: str, offset: int, chave: tuple, partitions: tuple, ativos: tuple, data_ini: str, data_fim: str):
+    """Série diária das linhas filtradas numa passada pelas partições do período (ver `stream_query`).
+
+    Só é usada quando o rollup diário residente não cobre os filtros (ver `daily_series`).
+    """
+    ini, fim = pd.to_datetime(data_ini), pd.to_datetime(data_fim)
+    return daily_totals(merge_daily(*(build_daily(chunk[_filter_mask(chunk, ativos, ini, fim)])
+                                      for chunk in _iter_stream_blocks(csv_path, offset, partitions, ini, fim))))
+
+
+# ------------------------------------------------------------
+# Backend SQL — linhas num banco colunar embutido (DuckDB/SQLite)
+# ------------------------------------------------------------
+def _sql_load(csv_path: str, fingerprint: tuple, version: int, backend: str | None = None) -> Dataset:
+    """Sincroniza o banco embutido com o CSV e lê dele apenas os agregados (cubo, série diária, opções).
+
+    O banco persiste em `CACHE_DIR`: se o prefixo do CSV não mudou só a cauda é inserida.
+    KPIs, gráficos e a série diária consultam o banco (ver `vendas_sql.SqlRollup`).
+    """
+    import vendas_sql  # sob demanda: só este backend precisa do módulo (e do driver)
+    snap = vendas_sql.banco(csv_path, backend or BACKEND, CACHE_DIR).sync(csv_path, fingerprint[1], fingerprint[0])
+    agg = snap.agregados()
+    return Dataset(None, None, agg.cube, agg.diario, snap.offset, snap.marker, fingerprint, version, sql=snap,
+                   opcoes=agg.opcoes)
+
+
+# ------------------------------------------------------------
+# Redução de payload — histograma, boxplot e dispersão com tamanho constante
+# ------------------------------------------------------------
+def hist_bins(valores: pd.Series, nbins: int = HIST_BINS) -> pd.DataFrame:
+    """Histograma calculado no servidor (NumPy): uma linha por faixa (inicio, fim, centro, vendas).
+
+    Valores ausentes são ignorados; sem nenhum valor o resultado não tem faixas.
+    """
+    valores = valores.dropna()
+    if valores.empty:
+        return hist_frame(np.zeros(0, dtype="int64"), np.zeros(1))
+    return hist_frame(*np.histogram(valores.to_numpy(dtype="float64"), bins=nbins))
+
+
+def hist_frame(contagem: np.ndarray, bordas: np.ndarray) -> pd.DataFrame:
+    """Contagens e bordas de um histograma no formato de `hist_bins`."""
+    return pd.DataFrame({
+        "inicio": bordas[:-1],
+        "fim": bordas[1:],
+        "centro": (bordas[:-1] + bordas[1:]) / 2,
+        "vendas": contagem,
+    })
+
+
+def box_stats(df: pd.DataFrame, grupo: str, valor: str,
+              max_outliers: int = BOX_MAX_OUTLIERS) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Estatísticas do boxplot por grupo e outliers limitados aos mais extremos.
+
+    Mesma convenção do Plotly: quartis por interpolação linear, bigodes no valor mais
+    extremo dentro de 1,5×IQR. Retorna `(stats, outliers)`; `stats` tem uma linha por
+    grupo (q1, mediana, q3, bigode_inf, bigode_sup) e `outliers` até `max_outliers`
+    linhas por grupo, priorizando as mais distantes dos bigodes. Sem nenhum valor, ambos
+    vêm vazios.
+    """
+    base = _plain_keys(df[[grupo, valor]].dropna())
+    if base.empty:
+        return pd.DataFrame(columns=[grupo, "q1", "mediana", "q3", "bigode_inf", "bigode_sup"]), base
+    g = base.groupby(grupo)[valor]
+    stats = g.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "mediana", "q3"]
+    iqr = stats["q3"] - stats["q1"]
+    lim_inf = (stats["q1"] - 1.5 * iqr).reindex(base[grupo]).to_numpy()
+    lim_sup = (stats["q3"] + 1.5 * iqr).reindex(base[grupo]).to_numpy()
+    v = base[valor].to_numpy()
+    dentro = (v >= lim_inf) & (v <= lim_sup)
+    bigodes = base[dentro].groupby(grupo)[valor].agg(["min", "max"])
+    stats["bigode_inf"] = bigodes["min"]
+    stats["bigode_sup"] = bigodes["max"]
+    distancia = np.maximum(lim_inf - v, v - lim_sup)
+    outliers = (base[~dentro].assign(_dist=distancia[~dentro])
+                .sort_values("_dist", ascending=False)
+                .groupby(grupo).head(max_outliers)
+                .drop(columns="_dist"))
+    return stats.reset_index(), outliers
+
+
+def stratified_sample(df: pd.DataFrame, grupo: str, n: int = PLOT_MAX_POINTS, seed: int = 0) -> pd.DataFrame:
+    """Até `n` linhas, proporcionais ao tamanho de cada grupo (cada grupo mantém ao menos uma)."""
+    if len(df) <= n:
+        return df
+    tamanhos = df.groupby(grupo, observed=True).size()
+    cotas = np.maximum(1, np.floor(tamanhos * n / len(df))).astype(int)
+    chave = np.random.default_rng(seed).random(len(df))
+    ordem = pd.Series(chave, index=df.index).groupby(df[grupo], observed=True).rank(method="first")
+    return df[ordem.to_numpy() <= df[grupo].map(cotas).to_numpy(dtype="int64")]
+
+
+# ------------------------------------------------------------
+# Diagnóstico — spans de tempo por execução do script
+# ------------------------------------------------------------
+perf_log = logging.getLogger("vendas.perf")
+
+_SEM_SPAN = nullcontext({})  # desligado: nenhum relógio, lista ou lock é tocado
+
+
+class Tracer:
+    """Coleta spans (nome, pai, thread, início, duração e atributos) de uma execução.
+
+    Seguro entre threads; o span aberto em cada thread fica na própria thread, para que
+    código compartilhado entre sessões (ex.: `Rollup.by`) ache o tracer via `thread_span`.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans: list = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, nome: str, **attrs):
+        th = threading.current_thread()
+        pilha = th.__dict__.setdefault("vendas_spans", [])
+        registro = {"nome": nome, "pai": pilha[-1]["nome"] if pilha else None, "thread": th.name, **attrs}
+        anterior = th.__dict__.get("vendas_tracer")
+        pilha.append(registro)
+        th.vendas_tracer = self
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            registro["inicio_ms"] = round((inicio - self.t0) * 1000, 3)
+            registro["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+            pilha.pop()
+            th.vendas_tracer = anterior
+            with self._lock:
+                self.spans.append(registro)
+
+    def report(self) -> pd.DataFrame:
+        """Spans em ordem de início."""
+        return pd.DataFrame(self.spans).sort_values("inicio_ms", kind="stable").reset_index(drop=True)
+
+    def chrome_trace(self) -> dict:
+        """Formato Trace Event (chrome://tracing, Perfetto)."""
+        tids = {}
+        eventos = [{
+            "name": sp["nome"], "ph": "X", "pid": os.getpid(),
+            "tid": tids.setdefault(sp["thread"], len(tids)),
+            "ts": sp["inicio_ms"] * 1000, "dur": sp["duracao_ms"] * 1000,
+            "args": {k: v for k, v in sp.items() if k not in ("nome", "thread", "inicio_ms", "duracao_ms")},
+        } for sp in self.spans]
+        eventos += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": nome}}
+                    for nome, tid in tids.items()]
+        return {"traceEvents": eventos, "displayTimeUnit": "ms"}
+
+    def log(self) -> None:
+        """Um registro JSON por span no logger `vendas.perf`."""
+        for sp in self.spans:
+            perf_log.info(json.dumps(sp, ensure_ascii=False, default=str))
+
+
+class NullTracer:
+    """Tracer desligado: `span` devolve sempre o mesmo contexto vazio."""
+
+    enabled = False
+
+    def span(self, nome: str, **attrs):
+        return _SEM_SPAN
+
+
+def thread_span(nome: str, **attrs):
+    """Span no tracer ativo da thread atual (contexto vazio se não houver)."""
+    tracer = threading.current_thread().__dict__.get("vendas_tracer")
+    return tracer.span(nome, **attrs) if tracer is not None else _SEM_SPAN
+
+
+# ------------------------------------------------------------
+# Cache de resultados entre sessões — LRU + TTL com limite de memória
+# ------------------------------------------------------------
+class ResultCache:
+    """Cache do processo (todas as sessões) com despejo LRU, expiração por TTL e limite em bytes.
+
+    Chaves são `(versão do dataset, filtros normalizados, item)`; a troca de versão do
+    dataset descarta as entradas antigas. Mantém contadores de acerto/erro por tipo de item.
+    """
+
+    def __init__(self, max_bytes: int, ttl_s: float):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # chave -> (valor, bytes, instante, sizeof)
+        self._bytes = 0
+        self._versao = None
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def retain_version(self, versao) -> None:
+        """Descarta tudo o que não pertence à versão `versao` do dataset."""
+        if versao == self._versao:
+            return
+        with self._lock:
+            self._versao = versao
+            for chave in [k for k in self._entries if k[0] != versao]:
+                self._drop(chave)
+
+    def get_or_compute(self, chave: tuple, tipo: str, compute, sizeof):
+        """Valor em cache para `chave` ou `compute()` (armazenado se couber no limite)."""
+        agora = time.monotonic()
+        with self._lock:
+            item = self._entries.get(chave)
+            if item is not None and agora - item[2] <= self.ttl_s:
+                self._entries.move_to_end(chave)
+                self.hits[tipo] += 1
+                return item[0]
+            if item is not None:
+                self._drop(chave)
+            self.misses[tipo] += 1
+        valor = compute()
+        nbytes = sizeof(valor)
+        if self.max_bytes > 0 and nbytes <= self.max_bytes:
+            with self._lock:
+                if chave in self._entries:
+                    self._drop(chave)
+                self._remeasure()
+                self._entries[chave] = (valor, nbytes, agora, sizeof)
+                self._bytes += nbytes
+                while self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+        return valor
+
+    def _remeasure(self) -> None:
+        """Remede as entradas que crescem depois de guardadas (ex.: o memo de um Rollup)."""
+        for chave, (valor, nbytes, instante, sizeof) in self._entries.items():
+            novo = sizeof(valor)
+            if novo != nbytes:
+                self._entries[chave] = (valor, novo, instante, sizeof)
+                self._bytes += novo - nbytes
+
+    def _drop(self, chave) -> None:
+        nbytes = self._entries.pop(chave)[1]
+        self._bytes -= nbytes
+
+    def stats(self) -> pd.DataFrame:
+        """Acertos, erros e taxa de acerto por tipo, com ocupação atual."""
+        with self._lock:
+            self._remeasure()
+        tipos = sorted(set(self.hits) | set(self.misses))
+        rep = pd.DataFrame({"acertos": [self.hits[t] for t in tipos],
+                            "erros": [self.misses[t] for t in tipos]}, index=tipos)
+        rep["taxa_acerto_%"] = (100 * rep["acertos"] / (rep["acertos"] + rep["erros"]).clip(lower=1)).round(1)
+        rep.attrs.update(entradas=len(self._entries), mb=self._bytes / 1024 / 1024)
+        return rep
+
+
+@functools.lru_cache(maxsize=None)
+def result_cache() -> ResultCache:
+    """Instância única por processo, limitada também a um quarto do orçamento de memória."""
+    return ResultCache(int(min(RESULT_CACHE_MB, MEMORY_BUDGET_MB / 4) * 1024 * 1024), RESULT_CACHE_TTL_S)
+
+
+def filter_key(selecoes: dict, data_ini, data_fim) -> tuple:
+    """Tupla normalizada do estado de filtros (ignora "(Todos)"/"(Todas)", datas ISO)."""
+    ativos = tuple(sorted((dim, v) for dim, v in selecoes.items() if v != FILTER_DIMS[dim]))
+    return ativos, pd.Timestamp(data_ini).date().isoformat(), pd.Timestamp(data_fim).date().isoformat()
+
+
+def deep_nbytes(valor) -> int:
+    """Memória de um valor em cache: DataFrames/Series pela medida profunda do pandas,
+    contêineres pela soma dos itens e os demais por `sys.getsizeof`."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(deep_nbytes(k) + deep_nbytes(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(deep_nbytes(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def _rollup_nbytes(rollup: Rollup) -> int:
+    """Linhas, cubo, extras e rollup diário do Rollup (medidos uma vez) mais os agregados já memoizados.
+
+    O memo cresce depois que o Rollup entra no cache; cada agregado novo é medido na
+    primeira chamada seguinte (ver `ResultCache._remeasure`).
+    """
+    medidos = rollup.__dict__.setdefault("_nbytes", {})
+    if "fixo" not in medidos:
+        medidos["fixo"] = sum(deep_nbytes(v) for v in (rollup.rows, rollup.cube, rollup.extras, rollup.diario))
+    for chave, valor in list(rollup._memo.items()):
+        if ("memo", chave) not in medidos:
+            medidos["memo", chave] = deep_nbytes(valor)
+    return sum(medidos.values())
+
+
+def cached_rollup(ds: "Dataset", selecoes: dict, data_ini, data_fim) -> Rollup:
+    """`build_rollup` compartilhado entre sessões com o mesmo estado de filtros.
+
+    O Rollup guardado carrega as linhas filtradas e memoiza seus agregados, então sessões
+    posteriores também herdam os groupbys já calculados.
+    """
+    cache = result_cache()
+    chave = (ds.chave, filter_key(selecoes, data_ini, data_fim), "linhas")
+    return cache.get_or_compute(chave, "linhas", lambda: build_rollup(ds, selecoes, data_ini, data_fim), _rollup_nbytes)
+
+
+def fmt_currency(x: float) -> str:
+    """Formata valores monetários em BRL (R$) com separador PT-BR."""
+    return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def fmt_currency_series(valores: pd.Series) -> pd.Series:
+    """`fmt_currency` aplicado a uma série inteira."""
+    return "R$ " + valores.map("{:,.2f}".format).str.translate(str.maketrans(",.", ".,"))
+
+def safe_pct(a, b) -> float:
+    """Retorna a porcentagem (0–100) de a/b com proteção para divisão por zero."""
+    return 0.0 if b == 0 else round(100.0 * a / b, 2)
+
+
+# ------------------------------------------------------------
+# KPIs — uma função pura por indicador
+# ------------------------------------------------------------
+def n_vendas(rollup: Rollup) -> int:
+    """Nº de vendas no recorte."""
+    return int(rollup.total("n_linhas"))
+
+
+def faturamento(rollup: Rollup) -> float:
+    """Soma de `preco_total` no recorte (R$)."""
+    return float(rollup.total("preco_total")) if n_vendas(rollup) > 0 else 0.0
+
+
+def ticket_medio(rollup: Rollup) -> float:
+    """Faturamento / nº de vendas."""
+    n = n_vendas(rollup)
+    return faturamento(rollup) / n if n > 0 else 0.0
+
+
+def itens_por_venda(rollup: Rollup) -> float:
+    """Quantidade vendida / nº de vendas."""
+    n = n_vendas(rollup)
+    return float(rollup.total("quantidade_vendida")) / n if n > 0 else 0.0
+
+
+def clientes_unicos(rollup: Rollup) -> int:
+    """Nº de clientes distintos no recorte."""
+    return int(rollup.nunique("nome_cliente"))
+
+
+def pct_parceladas(rollup: Rollup) -> float:
+    """% das vendas que foram parceladas."""
+    por_parcelada = rollup.by("venda_parcelada", "n_linhas")
+    parc_sim = por_parcelada.loc[por_parcelada["venda_parcelada"] == "sim", "n_linhas"].sum()
+    return safe_pct(parc_sim, n_vendas(rollup))
+
+
+def estado_lider(rollup: Rollup) -> tuple:
+    """`(estado, % do faturamento)` do estado com maior faturamento; `("—", 0.0)` sem vendas."""
+    if n_vendas(rollup) == 0:
+        return "—", 0.0
+    por_estado = faturamento_por_estado(rollup)
+    return por_estado.iloc[0]["estado"], safe_pct(por_estado.iloc[0]["preco_total"], faturamento(rollup))
+
+
+def compute_kpis(rollup: Rollup) -> dict:
+    """KPIs do topo a partir do Rollup do estado de filtros."""
+    lider, part_lider = estado_lider(rollup)
+    return {
+        "fat": faturamento(rollup),
+        "n_vendas": n_vendas(rollup),
+        "ticket": ticket_medio(rollup),
+        "itens_por_venda": itens_por_venda(rollup),
+        "clientes_unicos": clientes_unicos(rollup),
+        "pct_parc": pct_parceladas(rollup),
+        "estado_lider": lider,
+        "part_lider": part_lider,
+    }
+
+
+# ------------------------------------------------------------
+# Agregados dos gráficos — uma função pura por gráfico (dados prontos para plotar)
+# ------------------------------------------------------------
+def faturamento_por_cliente(rollup: Rollup) -> pd.DataFrame:
+    """Faturamento por cliente, do maior para o menor."""
+    return rollup.by("nome_cliente", "preco_total").sort_values("preco_total", ascending=False)
+
+
+def faturamento_por_vendedor(rollup: Rollup) -> pd.DataFrame:
+    """Faturamento por vendedor, do maior para o menor."""
+    return rollup.by("nome_vendedor", "preco_total").sort_values("preco_total", ascending=False)
+
+
+def quantidade_por_categoria(rollup: Rollup) -> pd.DataFrame:
+    """Quantidade vendida por categoria de produto, da maior para a menor."""
+    return rollup.by("categoria_produto", "quantidade_vendida").sort_values("quantidade_vendida", ascending=False)
+
+
+def faturamento_por_loja(rollup: Rollup) -> pd.DataFrame:
+    """Faturamento por loja, do maior para o menor."""
+    return rollup.by("loja", "preco_total").sort_values("preco_total", ascending=False)
+
+
+def vendas_por_mes(rollup: Rollup) -> pd.DataFrame:
+    """Nº de vendas por (ano, mês), com o rótulo abreviado do mês."""
+    por_mes = (rollup.by(["ano", "mes"], "id_venda")
+               .rename(columns={"mes": "mes_ord", "id_venda": "qtd_vendas"}))
+    por_mes["mes_label"] = pd.to_datetime(por_mes["mes_ord"], format="%m").dt.strftime("%b")
+    return por_mes.sort_values(["ano", "mes_ord"])
+
+
+def top_clientes(rollup: Rollup, n: int = 5) -> pd.DataFrame:
+    """Os `n` clientes de maior faturamento."""
+    return faturamento_por_cliente(rollup).head(n)
+
+
+def top_vendedores(rollup: Rollup, n: int = 5) -> pd.DataFrame:
+    """Os `n` vendedores de maior faturamento."""
+    return faturamento_por_vendedor(rollup).head(n)
+
+
+def faturamento_por_estado(rollup: Rollup) -> pd.DataFrame:
+    """Faturamento por estado, do maior para o menor."""
+    return rollup.by("estado", "preco_total").sort_values("preco_total", ascending=False)
+
+
+def vendas_por_parcelamento(rollup: Rollup) -> pd.DataFrame:
+    """Nº de vendas parceladas e não parceladas."""
+    return rollup.by("venda_parcelada", "id_venda").rename(columns={"venda_parcelada": "parcelada", "id_venda": "vendas"})
+
+
+def faturamento_por_estado_municipio(rollup: Rollup) -> pd.DataFrame:
+    """Faturamento por (estado, município)."""
+    return rollup.by(["estado", "municipio"], "preco_total")
+
+
+def faturamento_mensal_por_categoria(rollup: Rollup) -> pd.DataFrame:
+    """Faturamento por (mês, categoria), em ordem de mês."""
+    return rollup.by(["mes_ord", "categoria_produto"], "preco_total").sort_values("mes_ord")
+
+
+def distribuicao_ticket(rollup: Rollup) -> pd.DataFrame:
+    """Histograma do valor das vendas (ver `hist_bins`)."""
+    return rollup.hist("preco_total")
+
+
+def boxplot_preco_por_categoria(rollup: Rollup) -> tuple:
+    """Quartis, bigodes e outliers do preço total por categoria (ver `box_stats`)."""
+    return rollup.box("categoria_produto", "preco_total")
+
+
+def dispersao_qtd_preco(rollup: Rollup) -> pd.DataFrame:
+    """Pontos (preço unitário, quantidade, categoria, preço total), no máximo `PLOT_MAX_POINTS`."""
+    cols = ["preco_unitario", "quantidade_vendida", "categoria_produto", "preco_total"]
+    return rollup.sample(cols, "categoria_produto")
+
+
+def geo_faturamento(rollup: Rollup) -> pd.DataFrame:
+    """Faturamento e nº de vendas por cidade geocodificada.
+
+    `Rollup.by` agrega por estado × município e só depois junta lat/lon pelo município
+    (`with_geocodes`); cidades sem geocódigo ficam de fora.
+    """
+    return (rollup.by(["estado", "municipio", "lat", "lon"], "preco_total", "id_venda")
+            .rename(columns={"preco_total": "faturamento", "id_venda": "vendas"}))
+
+
+def media_movel_faturamento(serie: pd.DataFrame, data_ini) -> pd.DataFrame:
+    """Faturamento diário com médias móveis de 7 e 30 dias a partir de `data_ini`."""
+    return serie[["preco_total"]].assign(
+        mm7=serie["preco_total"].rolling(7, min_periods=1).mean(),
+        mm30=serie["preco_total"].rolling(30, min_periods=1).mean(),
+    ).loc[pd.to_datetime(data_ini):].reset_index()
+
+
+def comparativo_mensal(serie: pd.DataFrame, data_ini) -> pd.DataFrame:
+    """Variação % do faturamento mensal contra o mês anterior (MoM) e o mesmo mês do ano anterior (YoY)."""
+    mensal = serie["preco_total"].resample("MS").sum()
+    base = pd.DataFrame({
+        "MoM (%)": mensal.pct_change(1, fill_method=None) * 100,
+        "YoY (%)": mensal.pct_change(12, fill_method=None) * 100,
+    }).replace([np.inf, -np.inf], np.nan)
+    base = base.loc[pd.to_datetime(data_ini).to_period("M").to_timestamp():]
+    base.index = base.index.strftime("%Y-%m")
+    return base.rename_axis("mes").reset_index().melt("mes", var_name="comparacao", value_name="variacao")
+
+
+# Registros usados pela API: nome -> função
+KPIS = {
+    "faturamento": faturamento,
+    "n_vendas": n_vendas,
+    "ticket_medio": ticket_medio,
+    "itens_por_venda": itens_por_venda,
+    "clientes_unicos": clientes_unicos,
+    "pct_parceladas": pct_parceladas,
+    "estado_lider": estado_lider,
+}
+AGREGADOS = {f.__name__: f for f in (
+    faturamento_por_cliente, faturamento_por_vendedor, quantidade_por_categoria, faturamento_por_loja,
+    vendas_por_mes, top_clientes, top_vendedores, faturamento_por_estado, vendas_por_parcelamento,
+    faturamento_por_estado_municipio, faturamento_mensal_por_categoria, distribuicao_ticket,
+    boxplot_preco_por_categoria, dispersao_qtd_preco, geo_faturamento,
+)}
+AGREGADOS_SERIE = {f.__name__: f for f in (media_movel_faturamento, comparativo_mensal)}
+SERIE_LOOKBACK_DIAS = 400  # 13 meses p/ YoY
+
+
+class NotFoundError(KeyError):
+    """KPI, agregado ou rota inexistente (a API responde 404)."""
+
+
+def resolve_filtros(ds: Dataset, params: dict) -> tuple:
+    """`(selecoes, data_ini, data_fim)` a partir de parâmetros avulsos (ex.: query string).
+
+    Dimensões ausentes ficam em "(Todos)"/"(Todas)" e o período padrão é o do dataset.
+    Levanta `ValueError` para parâmetros desconhecidos ou datas inválidas.
+    """
+    desconhecidos = set(params) - set(FILTER_DIMS) - {"data_ini", "data_fim"}
+    if desconhecidos:
+        raise ValueError(f"filtros desconhecidos: {', '.join(sorted(desconhecidos))}")
+    selecoes = {dim: params.get(dim, todos) for dim, todos in FILTER_DIMS.items()}
+    data_ini = pd.Timestamp(params.get("data_ini", ds.opcoes.data_min)).date()
+    data_fim = pd.Timestamp(params.get("data_fim", ds.opcoes.data_max)).date()
+    return selecoes, data_ini, data_fim
+
+
+def kpi(nome: str, ds: Dataset, selecoes: dict, data_ini, data_fim):
+    """Valor do KPI `nome` (ver `KPIS`) para um estado de filtros; `NotFoundError` se não existir."""
+    if nome not in KPIS:
+        raise NotFoundError(nome)
+    return KPIS[nome](cached_rollup(ds, selecoes, data_ini, data_fim))
+
+
+def agregado(nome: str, ds: Dataset, selecoes: dict, data_ini, data_fim):
+    """Dados do gráfico `nome` (ver `AGREGADOS`/`AGREGADOS_SERIE`); `NotFoundError` se não existir."""
+    if nome not in AGREGADOS and nome not in AGREGADOS_SERIE:
+        raise NotFoundError(nome)
+    if nome in AGREGADOS_SERIE:
+        serie = daily_series(ds, selecoes, data_ini, data_fim, lookback_dias=SERIE_LOOKBACK_DIAS)
+        return AGREGADOS_SERIE[nome](serie, data_ini)
+    return AGREGADOS[nome](cached_rollup(ds, selecoes, data_ini, data_fim))
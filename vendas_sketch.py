@@ -0,0 +1,471 @@
+# vendas_sketch.py
+# ------------------------------------------------------------
+# Modo aproximado — sketches mergeáveis por célula do dataset
+# ------------------------------------------------------------
+# Com VENDAS_APROXIMADO=1 a carga constrói, para cada célula (mês × estado × loja ×
+# categoria), um HyperLogLog dos clientes e um t-digest de `preco_total`. Um estado de
+# filtros coberto por células inteiras (períodos de meses completos, filtros só nessas
+# dimensões) responde clientes únicos, histograma e boxplot unindo os sketches das
+# células, sem tocar nas linhas; os demais continuam exatos.
+#
+# Erro observado contra o cálculo exato:
+#   python vendas_sketch.py --filtros 25
+#   python vendas_sketch.py --csv /tmp/vendas_1m.csv --erro-distintos 0.01
+
+import argparse
+import math
+import sys
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import vendas_engine as motor
+from vendas_engine import BOX_MAX_OUTLIERS, FILTER_DIMS, HIST_BINS
+
+SKETCH_DIMS = ["mes_ord", "estado", "loja", "categoria_produto"]
+COLUNA_DISTINTOS = "nome_cliente"  # HyperLogLog
+COLUNA_QUANTIS = "preco_total"     # t-digest
+
+
+# ------------------------------------------------------------
+# Parâmetros <-> erro
+# ------------------------------------------------------------
+def hll_precisao(erro: float) -> int:
+    """Bits de registro `p` (2^p registros) para um erro padrão relativo 1,04/√2^p ≤ `erro`."""
+    return int(min(18, max(4, math.ceil(2 * math.log2(1.04 / erro)))))
+
+
+def erro_hll(p: int) -> float:
+    """Erro padrão relativo da contagem de distintos com 2^p registros."""
+    return 1.04 / math.sqrt(1 << p)
+
+
+def tdigest_delta(erro: float) -> int:
+    """Compressão δ do t-digest para um erro de posição (rank) ≤ `erro` na mediana.
+
+    Com a escala k1 um centróide cobre no máximo π/δ das posições (na mediana; bem menos
+    nas caudas) e a interpolação erra até metade disso.
+    """
+    return max(10, math.ceil(math.pi / (2 * erro)))
+
+
+def erro_tdigest(delta: int) -> float:
+    """Erro de posição (fração do total) dos quantis no pior caso (mediana)."""
+    return math.pi / (2 * delta)
+
+
+# ------------------------------------------------------------
+# HyperLogLog — um por célula, esparso enquanto pequeno e denso depois (como no HLL++)
+# ------------------------------------------------------------
+class HllCelulas(NamedTuple):
+    """HLLs de várias células. Até 2^p/8 registros ocupados uma célula guarda só entradas
+    (célula, registro, ρ); acima disso, uma linha densa com os 2^p registros. Assim a memória
+    acompanha o nº de clientes por célula e nunca passa de ~2 bytes por registro."""
+    celula: np.ndarray    # int32, entradas esparsas
+    registro: np.ndarray  # uint32
+    rho: np.ndarray       # uint8
+    densas: np.ndarray    # int32, em ordem: células com registros densos
+    matriz: np.ndarray    # uint8 [len(densas), 2^p]
+
+    @classmethod
+    def from_values(cls, celula: np.ndarray, valores: pd.Series, p: int) -> "HllCelulas":
+        """Registro e ρ (posição do primeiro bit 1) do hash de 64 bits de cada valor não nulo."""
+        ok = valores.notna().to_numpy()
+        h = pd.util.hash_pandas_object(valores[ok], index=False).to_numpy()  # categorias: hash dos valores
+        q = 64 - p
+        registro = (h >> np.uint64(q)).astype(np.uint32)
+        resto = h & np.uint64((1 << q) - 1)
+        # frexp devolve o nº de bits significativos (0 para resto 0 -> ρ = q + 1)
+        rho = (q + 1 - np.frexp(resto.astype(np.float64))[1]).astype(np.uint8)
+        vazio = cls(np.empty(0, np.int32), np.empty(0, np.uint32), np.empty(0, np.uint8),
+                    np.empty(0, np.int32), np.empty((0, 1 << p), np.uint8))
+        return vazio._replace(celula=celula[ok].astype(np.int32), registro=registro, rho=rho)._normalizado(p)
+
+    @classmethod
+    def union(cls, partes: list, novos_ids: list, p: int) -> "HllCelulas":
+        """União das `partes`; `novos_ids[i]` renumera as células da parte i para as células unidas."""
+        return cls(
+            np.concatenate([ids[h.celula] for h, ids in zip(partes, novos_ids)]),
+            np.concatenate([h.registro for h in partes]),
+            np.concatenate([h.rho for h in partes]),
+            np.concatenate([ids[h.densas] for h, ids in zip(partes, novos_ids)]),
+            np.concatenate([h.matriz for h in partes]),
+        )._normalizado(p)
+
+    def _normalizado(self, p: int) -> "HllCelulas":
+        """Um só registro por (célula, registro) com o maior ρ — a união de HLLs é o máximo por
+        registro —, células densas sem repetição e promoção das esparsas que passaram do limite."""
+        densas, matriz = self.densas, self.matriz
+        if len(densas):  # a mesma célula pode vir densa de mais de uma parte
+            ordem = np.argsort(densas, kind="stable")
+            densas, matriz = densas[ordem], matriz[ordem]
+            inicio = np.flatnonzero(np.r_[True, densas[1:] != densas[:-1]])
+            densas, matriz = densas[inicio], np.maximum.reduceat(matriz, inicio, axis=0)
+        chave = (self.celula.astype(np.int64) << p) | self.registro
+        ordem = np.lexsort((self.rho, chave))
+        chave = chave[ordem]
+        sel = ordem[np.r_[chave[1:] != chave[:-1], True]] if len(chave) else ordem
+        celula, registro, rho = self.celula[sel], self.registro[sel], self.rho[sel]
+        promover = np.flatnonzero(np.bincount(celula) >= (1 << p) // 8).astype(np.int32)
+        if len(np.setdiff1d(promover, densas)):
+            novas = np.union1d(densas, promover)
+            expandida = np.zeros((len(novas), 1 << p), np.uint8)
+            expandida[np.searchsorted(novas, densas)] = matriz
+            densas, matriz = novas, expandida
+        if len(densas):  # entradas de células densas vão para a matriz
+            linha = np.minimum(np.searchsorted(densas, celula), len(densas) - 1)
+            e_densa = densas[linha] == celula
+            np.maximum.at(matriz, (linha[e_densa], registro[e_densa]), rho[e_densa])
+            celula, registro, rho = celula[~e_densa], registro[~e_densa], rho[~e_densa]
+        return HllCelulas(celula, registro, rho, densas, matriz)
+
+    def registros(self, mask: np.ndarray, p: int) -> np.ndarray:
+        """Registros do HLL da união das células de `mask`."""
+        registros = np.zeros(1 << p, dtype=np.uint8)
+        sel = mask[self.celula]
+        np.maximum.at(registros, self.registro[sel], self.rho[sel])
+        linhas = mask[self.densas]
+        if linhas.any():
+            np.maximum(registros, self.matriz[linhas].max(axis=0), out=registros)
+        return registros
+
+
+def _sigma(x: float) -> float:
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        anterior, z = z, z + x * y
+        y += y
+        if z == anterior:
+            return z
+
+
+def _tau(x: float) -> float:
+    if x in (0, 1):
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        anterior, z = z, z - (1 - x) ** 2 * y
+        if z == anterior:
+            return z / 3
+
+
+def hll_estimativa(registros: np.ndarray, p: int) -> float:
+    """Nº estimado de distintos a partir dos registros (estimador de Ertl, 2017).
+
+    Sem tabelas de viés: vale de conjuntos vazios a bilhões de valores com o mesmo erro.
+    """
+    m, q = 1 << p, 64 - p
+    c = np.bincount(registros, minlength=q + 2)
+    z = m * _tau(1 - c[q + 1] / m)
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + c[k])
+    z += m * _sigma(c[0] / m)
+    return m * m / (2 * math.log(2) * z)
+
+
+# ------------------------------------------------------------
+# t-digest — centróides (média, peso) por célula, comprimidos em lote
+# ------------------------------------------------------------
+def _comprimir(celula: np.ndarray, media: np.ndarray, peso: np.ndarray, delta: int) -> tuple:
+    """Une centróides (ou valores, com peso 1) de cada célula pela escala k1 do t-digest.
+
+    Ordena por (célula, valor) e agrupa os vizinhos cuja posição central cai na mesma
+    unidade de k(q) = δ/2π·asin(2q−1): centróides estreitos nas caudas e largos no meio.
+    Tudo vetorizado; a união de dois digests é comprimir a concatenação. Devolve os
+    centróides de todas as células juntos, em ordem de média.
+    """
+    ordem = np.lexsort((media, celula))
+    celula, media, peso = celula[ordem], media[ordem], peso[ordem]
+    if len(celula) == 0:
+        return celula, media, peso
+    inicio = np.flatnonzero(np.r_[True, celula[1:] != celula[:-1]])
+    tamanho = np.diff(np.r_[inicio, len(celula)])
+    acum = np.cumsum(peso)
+    antes = np.repeat(acum[inicio] - peso[inicio], tamanho)  # peso das células anteriores
+    total = np.repeat(acum[inicio + tamanho - 1], tamanho) - antes
+    q = (acum - antes - peso / 2) / total
+    k = np.floor(delta / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+    grupos = np.flatnonzero(np.r_[True, (celula[1:] != celula[:-1]) | (k[1:] != k[:-1])])
+    soma_peso = np.add.reduceat(peso, grupos)
+    celula, media = celula[grupos], np.add.reduceat(media * peso, grupos) / soma_peso
+    ordem = np.argsort(media, kind="stable")  # em ordem de média: qualquer seleção já sai ordenada
+    return celula[ordem], media[ordem], soma_peso[ordem]
+
+
+def quantis(media: np.ndarray, peso: np.ndarray, vmin: float, vmax: float, qs) -> np.ndarray:
+    """Quantis por interpolação linear entre centróides em ordem (como `Series.quantile`).
+
+    Cada centróide fica na posição (base 0) do seu elemento central, com mín./máx. exatos
+    nas pontas; se todos os centróides são unitários o resultado é exato.
+    """
+    n = peso.sum()
+    centro = np.cumsum(peso) - peso + (peso - 1) / 2
+    return np.interp(np.asarray(qs) * (n - 1), np.r_[0, centro, n - 1], np.r_[vmin, media, vmax])
+
+
+# ------------------------------------------------------------
+# Sketches por célula
+# ------------------------------------------------------------
+def _agrupar(colunas: list) -> tuple:
+    """Id do grupo de cada posição (combinação das colunas, NaN incluso) e a primeira posição de cada grupo."""
+    chave = np.zeros(len(colunas[0]), dtype=np.int64)
+    for col in colunas:
+        codigos, valores = pd.factorize(col)  # NaN -> -1
+        chave = chave * (len(valores) + 1) + (codigos + 1)
+    _, primeira, ids = np.unique(chave, return_index=True, return_inverse=True)
+    return ids.ravel(), primeira
+
+
+def _mes(data) -> str:
+    return pd.Timestamp(data).strftime("%Y-%m")
+
+
+class Sketches(NamedTuple):
+    """HLL de clientes e t-digest de `preco_total` por célula (mês × estado × loja × categoria).
+
+    `celulas` tem as chaves de `SKETCH_DIMS`, o nº de linhas e o mín./máx. de `preco_total`
+    de cada célula; `hll` e `digest` referenciam as células pela posição em `celulas`.
+    Imutável: `merged` devolve um novo objeto (cauda anexada, blocos do modo streaming).
+    """
+    celulas: pd.DataFrame
+    hll: HllCelulas
+    digest: tuple  # (célula int32, média float64, peso int64), em ordem de média
+    p: int
+    delta: int
+
+    @classmethod
+    def from_rows(cls, df: pd.DataFrame, p: int, delta: int) -> "Sketches":
+        d = df["data_venda"]
+        mes = (d.dt.year * 12 + d.dt.month - 1).fillna(-1).to_numpy(dtype="int64")
+        ids, primeira = _agrupar([mes, *(df[dim] for dim in SKETCH_DIMS[1:])])
+        linhas = motor.with_derived(df.iloc[primeira][["data_venda", *SKETCH_DIMS[1:]]], "mes_ord")
+        celulas = motor._plain_keys(linhas[SKETCH_DIMS].reset_index(drop=True))
+        valor = df[COLUNA_QUANTIS].to_numpy(dtype="float64")
+        ok = ~np.isnan(valor)
+        celulas = celulas.assign(n_linhas=np.bincount(ids, minlength=len(celulas)),
+                                 **_extremos(ids[ok], valor[ok], valor[ok], len(celulas)))
+        return cls(
+            celulas=celulas,
+            hll=HllCelulas.from_values(ids, df[COLUNA_DISTINTOS], p),
+            digest=_comprimir(ids[ok].astype(np.int32), valor[ok], np.ones(ok.sum(), dtype=np.int64), delta),
+            p=p,
+            delta=delta,
+        )
+
+    def merged(self, *outras: "Sketches") -> "Sketches":
+        """Sketches da união das linhas desta e das `outras` partes (células iguais são unidas)."""
+        partes = (self, *outras)
+        if len({(s.p, s.delta) for s in partes}) > 1:
+            raise ValueError("sketches com parâmetros diferentes não podem ser unidos")
+        chaves = pd.concat([s.celulas for s in partes], ignore_index=True)
+        ids, primeira = _agrupar([chaves[dim].to_numpy() for dim in SKETCH_DIMS])
+        limites = np.cumsum([0, *(len(s.celulas) for s in partes)])
+        novos_ids = [ids[a:b].astype(np.int32) for a, b in zip(limites[:-1], limites[1:])]
+        n = len(primeira)
+        celulas = chaves.iloc[primeira][SKETCH_DIMS].reset_index(drop=True).assign(
+            n_linhas=np.bincount(ids, weights=chaves["n_linhas"], minlength=n).astype(np.int64),
+            **_extremos(ids, chaves["vmin"].to_numpy(), chaves["vmax"].to_numpy(), n))
+        digest = _comprimir(np.concatenate([ids_[s.digest[0]] for s, ids_ in zip(partes, novos_ids)]),
+                            np.concatenate([s.digest[1] for s in partes]),
+                            np.concatenate([s.digest[2] for s in partes]), self.delta)
+        return self._replace(celulas=celulas, hll=HllCelulas.union([s.hll for s in partes], novos_ids, self.p),
+                             digest=digest)
+
+    def nbytes(self) -> int:
+        arrays = (*self.hll, *self.digest)
+        return int(sum(x.nbytes for x in arrays) + self.celulas.memory_usage(index=True, deep=True).sum())
+
+    def recorte(self, selecoes: dict, data_ini, data_fim, n_linhas: int) -> "Recorte | None":
+        """Células que cobrem exatamente as linhas do estado de filtros, ou None.
+
+        As células dos meses do período com os valores selecionados contêm todas as linhas
+        filtradas; se somam o mesmo nº de linhas do recorte (`n_linhas`), são exatamente elas.
+        Períodos que cortam um mês com vendas fora dele e filtros em outras dimensões não
+        fecham a conta e ficam com o cálculo exato.
+        """
+        if n_linhas == 0:
+            return None
+        cel = self.celulas
+        mask = ((cel["mes_ord"] >= _mes(data_ini)) & (cel["mes_ord"] <= _mes(data_fim))).to_numpy()
+        for dim in SKETCH_DIMS[1:]:
+            if selecoes.get(dim, FILTER_DIMS[dim]) != FILTER_DIMS[dim]:
+                mask = mask & (cel[dim] == selecoes[dim]).to_numpy()
+        if cel["n_linhas"].to_numpy()[mask].sum() != n_linhas:
+            return None
+        return Recorte(self, mask)
+
+
+def _extremos(ids: np.ndarray, vmin: np.ndarray, vmax: np.ndarray, n: int) -> dict:
+    """Mín./máx. por célula (NaN quando a célula não tem valores)."""
+    lo, hi = np.full(n, np.inf), np.full(n, -np.inf)
+    np.fmin.at(lo, ids, vmin)
+    np.fmax.at(hi, ids, vmax)
+    return {"vmin": np.where(np.isinf(lo), np.nan, lo), "vmax": np.where(np.isinf(hi), np.nan, hi)}
+
+
+class Recorte:
+    """Agregados aproximados de um estado de filtros, unindo os sketches das células escolhidas.
+
+    Usado pelo `Rollup` para `nunique(COLUNA_DISTINTOS)`, `hist(COLUNA_QUANTIS)` e
+    `box(<dimensão de SKETCH_DIMS>, COLUNA_QUANTIS)`; as saídas têm o formato das exatas.
+    """
+
+    distintos = COLUNA_DISTINTOS
+    quantis = COLUNA_QUANTIS
+    dims = SKETCH_DIMS
+
+    def __init__(self, sketches: Sketches, mask: np.ndarray):
+        self.sketches = sketches
+        self.mask = mask
+        self.erro_distintos = erro_hll(sketches.p)
+        self.erro_quantis = erro_tdigest(sketches.delta)
+
+    def nunique(self) -> int:
+        p = self.sketches.p
+        return int(round(hll_estimativa(self.sketches.hll.registros(self.mask, p), p)))
+
+    def _centroides(self) -> tuple:
+        celula, media, peso = self.sketches.digest
+        sel = self.mask[celula]
+        return celula[sel], media[sel], peso[sel]
+
+    def hist(self, nbins: int = HIST_BINS) -> pd.DataFrame:
+        """Mesmas bordas do exato (dependem só do mín./máx.); cada centróide conta na faixa da sua média."""
+        _, media, peso = self._centroides()
+        cel = self.sketches.celulas[self.mask]
+        vmin, vmax = cel["vmin"].min(), cel["vmax"].max()
+        if pd.isna(vmin):  # nenhum valor: sem faixas (como `hist_bins`)
+            return motor.hist_frame(np.zeros(0, dtype="int64"), np.zeros(1))
+        bordas = np.histogram_bin_edges(np.array([vmin, vmax], dtype="float64"), bins=nbins)
+        contagem, _ = np.histogram(media, bins=bordas, weights=peso)
+        return motor.hist_frame(contagem.astype("int64"), bordas)
+
+    def box(self, grupo: str, max_outliers: int = BOX_MAX_OUTLIERS) -> tuple:
+        """Quartis e bigodes por grupo a partir dos digests unidos; outliers são os centróides além dos bigodes.
+
+        Nas caudas os centróides são unitários (valores reais) até dezenas de milhares de vendas
+        por grupo; acima disso um outlier pode ser a média de alguns valores vizinhos.
+        """
+        celula, media, peso = self._centroides()
+        cel = self.sketches.celulas
+        codigos, grupos = pd.factorize(cel[grupo], sort=True)  # por célula; NaN -> -1 (fora, como no exato)
+        codigo = codigos[celula]
+        ok = self.mask & (codigos >= 0)
+        extremos = _extremos(codigos[ok], cel["vmin"].to_numpy()[ok], cel["vmax"].to_numpy()[ok], len(grupos))
+        stats, outliers = [], []
+        for i, g in enumerate(grupos):
+            s = codigo == i
+            m, w = media[s], peso[s]  # já em ordem de média
+            if len(m) == 0:
+                continue
+            vmin, vmax = extremos["vmin"][i], extremos["vmax"][i]
+            q1, mediana, q3 = quantis(m, w, vmin, vmax, [0.25, 0.5, 0.75])
+            lim_inf, lim_sup = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+            pontos = np.r_[vmin, m, vmax]
+            dentro = pontos[(pontos >= lim_inf) & (pontos <= lim_sup)]
+            stats.append((g, q1, mediana, q3, dentro.min(), dentro.max()))
+            fora = (m < lim_inf) | (m > lim_sup)
+            v = np.repeat(m[fora], np.minimum(w[fora], max_outliers))
+            distancia = np.maximum(lim_inf - v, v - lim_sup)
+            outliers.append(pd.DataFrame({grupo: g, self.quantis: v[np.argsort(-distancia, kind="stable")[:max_outliers]]}))
+        stats = pd.DataFrame(stats, columns=[grupo, "q1", "mediana", "q3", "bigode_inf", "bigode_sup"])
+        outliers = pd.concat(outliers, ignore_index=True) if outliers else pd.DataFrame(columns=[grupo, self.quantis])
+        return stats, outliers
+
+
+# ------------------------------------------------------------
+# Erro observado contra o cálculo exato
+# ------------------------------------------------------------
+def _estados_cobertos(ds: motor.Dataset, n: int, seed: int) -> list:
+    """Sem filtro mais `n` seleções de meses inteiros × valores de estado/loja/categoria."""
+    cube = ds.cube.dropna(subset=["data_venda"])
+    meses = pd.period_range(cube["data_venda"].min(), cube["data_venda"].max(), freq="M")
+    estados = [(dict(FILTER_DIMS), meses[0].start_time.date(), meses[-1].end_time.date())]
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        celula = cube.iloc[rng.integers(len(cube))]
+        dims = rng.choice(SKETCH_DIMS[1:], size=rng.integers(0, 3), replace=False)
+        sel = {**FILTER_DIMS, **{d: celula[d] for d in dims if pd.notna(celula[d])}}
+        a, b = sorted(rng.integers(len(meses), size=2)) if rng.random() < 0.6 else (0, len(meses) - 1)
+        estados.append((sel, meses[a].start_time.date(), meses[b].end_time.date()))
+    return estados
+
+
+def _erro_posicao(valores: np.ndarray, estimativa: float, q: float) -> float:
+    """Distância (fração das vendas) entre as posições da estimativa e do quantil exato nos valores em ordem."""
+    posicao = lambda x: (np.searchsorted(valores, x, "left") + np.searchsorted(valores, x, "right")) / 2
+    return abs(posicao(estimativa) - posicao(np.quantile(valores, q))) / len(valores)
+
+
+def avaliar(csv_path: str | None = None, erro_distintos: float | None = None, erro_quantis: float | None = None,
+            n_filtros: int = 25, seed: int = 0) -> pd.DataFrame:
+    """Compara clientes únicos, quartis e histograma aproximados com os exatos em estados cobertos.
+
+    Uma linha por estado de filtros: erro relativo dos distintos, maior erro de posição dos
+    quartis (entre categorias) e fração das vendas em faixas diferentes no histograma.
+    """
+    csv_path = csv_path or motor.CSV_PATH
+    p = hll_precisao(erro_distintos or motor.APPROX_ERRO_DISTINTOS)
+    delta = tdigest_delta(erro_quantis or motor.APPROX_ERRO_QUANTIS)
+    ref = motor._memory_load(csv_path, motor._csv_fingerprint(csv_path), 1)
+    sk = Sketches.from_rows(motor.all_rows(ref), p, delta)
+    linhas = []
+    for sel, ini, fim in _estados_cobertos(ref, n_filtros, seed):
+        exato = motor.build_rollup(ref, sel, ini, fim)
+        recorte = sk.recorte(sel, ini, fim, int(exato.total("n_linhas")))
+        if recorte is None:
+            continue
+        clientes, aprox = exato.nunique(COLUNA_DISTINTOS), recorte.nunique()
+        stats, _ = recorte.box("categoria_produto")
+        erro_q = 0.0
+        for _, s in stats.iterrows():
+            valores = np.sort(exato.rows.loc[exato.rows["categoria_produto"] == s["categoria_produto"], COLUNA_QUANTIS]
+                              .dropna().to_numpy())
+            erro_q = max(erro_q, *(_erro_posicao(valores, s[c], q) for c, q in (("q1", .25), ("mediana", .5), ("q3", .75))))
+        h_exato, h_aprox = exato.hist(COLUNA_QUANTIS), recorte.hist()
+        linhas.append({
+            "filtros": ", ".join(f"{k}={v}" for k, v in sel.items() if v != FILTER_DIMS[k]) or "(nenhum)",
+            "periodo": f"{_mes(ini)}..{_mes(fim)}",
+            "vendas": int(exato.total("n_linhas")),
+            "clientes": clientes,
+            "clientes_aprox": aprox,
+            "erro_clientes": abs(aprox - clientes) / clientes if clientes else 0.0,
+            "erro_quartis": erro_q,
+            "erro_hist": np.abs(h_exato["vendas"] - h_aprox["vendas"]).sum() / 2 / h_exato["vendas"].sum(),
+        })
+    resultado = pd.DataFrame(linhas)
+    resultado.attrs.update(p=p, delta=delta, erro_hll=erro_hll(p), erro_tdigest=erro_tdigest(delta),
+                           mb=sk.nbytes() / 2**20, celulas=len(sk.celulas))
+    return resultado
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Erro do modo aproximado (HLL e t-digest por célula) contra o exato.")
+    ap.add_argument("--csv", default=None, help="CSV de vendas (padrão VENDAS_CSV)")
+    ap.add_argument("--erro-distintos", type=float, default=None, help="erro padrão relativo do HLL (padrão VENDAS_ERRO_DISTINTOS)")
+    ap.add_argument("--erro-quantis", type=float, default=None, help="erro de posição do t-digest (padrão VENDAS_ERRO_QUANTIS)")
+    ap.add_argument("--filtros", type=int, default=25, help="nº de seleções aleatórias além de 'sem filtro'")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    r = avaliar(args.csv, args.erro_distintos, args.erro_quantis, args.filtros, args.seed)
+    a = r.attrs
+    with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+        print(r.round(4).to_string(index=False))
+    print(f"\nHLL p={a['p']} (erro padrão {a['erro_hll']:.2%}) • t-digest δ={a['delta']} (erro de posição ≤ {a['erro_tdigest']:.2%})"
+          f" • {a['celulas']} células, {a['mb']:.1f} MB")
+    print(f"erro clientes: médio {r['erro_clientes'].mean():.2%}, máx. {r['erro_clientes'].max():.2%} • "
+          f"erro quartis: máx. {r['erro_quartis'].max():.2%} • histograma: máx. {r['erro_hist'].max():.2%} das vendas")
+    # 4 erros padrão no HLL (~1 em 15 mil por estado) e o limite do t-digest
+    excedeu = (r["erro_clientes"] > 4 * a["erro_hll"]) | (r["erro_quartis"] > a["erro_tdigest"])
+    sys.exit(1 if excedeu.any() else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+# vendas_sql.py
+# ------------------------------------------------------------
+# Backend SQL do motor de vendas — DuckDB ou SQLite embutidos
+# ------------------------------------------------------------
+# Com VENDAS_BACKEND=duckdb (ou sqlite) as linhas do CSV ficam num banco em
+# CACHE_DIR e cada agregado do Rollup (filtros do topo, groupbys, totais,
+# distintos, histograma, boxplot, amostra e série diária) vira uma consulta;
+# só o resultado, pequeno, chega ao pandas/Plotly.
+#
+# Paridade com o caminho pandas em memória:
+#   python vendas_sql.py --backend duckdb --filtros 25
+#   python vendas_sql.py --backend sqlite --csv /tmp/vendas_1m.csv
+
+import argparse
+import functools
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import vendas_engine as motor
+from vendas_engine import CUBE_DIMS, CUBE_MEASURES, DIARIO_DIMS, FILTER_DIMS, HIST_BINS, PLOT_MAX_POINTS, BOX_MAX_OUTLIERS
+
+TABELA = "vendas"
+SQL_SCHEMA = 1  # incrementar quando o layout da tabela mudar
+
+# Colunas guardadas no banco -> (tipo DuckDB, tipo SQLite)
+COLUNAS = {
+    "_seq": ("BIGINT", "INTEGER"),  # ordem de ingestão: cada versão do dataset vê `_seq < linhas`
+    "id_venda": ("BIGINT", "INTEGER"),
+    "data_venda": ("TIMESTAMP", "TEXT"),
+    **{dim: ("VARCHAR", "TEXT") for dim in FILTER_DIMS},
+    "nome_cliente": ("VARCHAR", "TEXT"),
+    "quantidade_vendida": ("BIGINT", "INTEGER"),
+    "preco_unitario": ("DOUBLE", "REAL"),
+    "preco_total": ("DOUBLE", "REAL"),
+    "ano": ("INTEGER", "INTEGER"),
+    "mes": ("INTEGER", "INTEGER"),
+    "mes_ord": ("VARCHAR", "TEXT"),
+    "lat": ("DOUBLE", "REAL"),
+    "lon": ("DOUBLE", "REAL"),
+}
+
+# Medidas do cubo em SQL (mesma semântica de `CUBE_MEASURES`; soma vazia = 0 como no pandas)
+MEDIDAS_SQL = {
+    "preco_total": "COALESCE(SUM(preco_total), 0)",
+    "quantidade_vendida": "COALESCE(SUM(quantidade_vendida), 0)",
+    "id_venda": "COUNT(id_venda)",
+    "n_linhas": "COUNT(*)",
+}
+
+
+def _coluna(nome: str) -> str:
+    """Valida um nome de coluna antes de interpolá-lo no SQL (valores vão sempre como parâmetro)."""
+    if nome not in COLUNAS:
+        raise KeyError(nome)
+    return nome
+
+
+def linhas_sql(df: pd.DataFrame, seq0: int) -> pd.DataFrame:
+    """Linhas tipadas no layout da tabela: chaves de mês, geocódigo e `_seq`."""
+    base = motor._plain_keys(motor.with_geocodes(motor.with_derived(df, "ano", "mes", "mes_ord")))
+    base = base.assign(
+        ano=base["ano"].astype("Int64"),
+        mes=base["mes"].astype("Int64"),
+        _seq=np.arange(seq0, seq0 + len(base), dtype="int64"),
+    )
+    return base[list(COLUNAS)]
+
+
+# ------------------------------------------------------------
+# Dialetos — conexão por thread, consulta -> DataFrame e carga em lote
+# ------------------------------------------------------------
+class _DuckDB:
+    tipo = 0
+    dia = "CAST(data_venda AS DATE)"
+    mes = "date_trunc('month', data_venda)"
+    quantil = "quantile_cont(v, {p})"  # interpolação linear, como o pandas
+
+    def __init__(self, path: str):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("VENDAS_BACKEND=duckdb requer o pacote duckdb:  pip install duckdb") from e
+        try:
+            self._raiz = duckdb.connect(path)
+        except duckdb.IOException:  # arquivo aberto por outro processo (ex.: app e API juntos)
+            motor.perf_log.warning("banco %s em uso por outro processo; usando um banco em memória", path)
+            self._raiz = duckdb.connect(":memory:")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            with self._lock:  # `cursor()` cria uma conexão ao mesmo banco, própria desta thread
+                con = self._local.con = self._raiz.cursor()
+        return con
+
+    def consulta(self, sql: str, params=()) -> pd.DataFrame:
+        return self._con().execute(sql, list(params)).df()
+
+    def executar(self, sql: str, params=()) -> None:
+        self._con().execute(sql, list(params))
+
+    def inserir(self, linhas: pd.DataFrame) -> None:
+        con = self._con()
+        con.register("_bloco", linhas)
+        try:
+            con.execute(f"INSERT INTO {TABELA} SELECT * FROM _bloco")
+        finally:
+            con.unregister("_bloco")
+
+    @staticmethod
+    def data_param(valor):
+        return pd.Timestamp(valor).to_pydatetime()
+
+
+class _SQLite:
+    tipo = 1
+    dia = "substr(data_venda, 1, 10)"
+    mes = "substr(data_venda, 1, 7) || '-01'"
+    quantil = None  # sem função de quantil: calculado por posição (ver `SqlRollup.box`)
+
+    def __init__(self, path: str):
+        self._uri = f"file:vendas_{id(self)}?mode=memory&cache=shared" if path == ":memory:" else f"file:{path}"
+        self._local = threading.local()
+        self._memoria = self._con() if path == ":memory:" else None  # mantém o banco em memória vivo
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")  # leitores não bloqueiam a ingestão da cauda
+        return con
+
+    def consulta(self, sql: str, params=()) -> pd.DataFrame:
+        return pd.read_sql_query(sql, self._con(), params=list(params))
+
+    def executar(self, sql: str, params=()) -> None:
+        con = self._con()
+        con.execute(sql, list(params))
+        con.commit()
+
+    def inserir(self, linhas: pd.DataFrame) -> None:
+        linhas = linhas.assign(data_venda=linhas["data_venda"].dt.strftime("%Y-%m-%d %H:%M:%S"))
+        valores = linhas.astype(object).where(linhas.notna(), None)
+        con = self._con()
+        con.executemany(f"INSERT INTO {TABELA} VALUES ({', '.join('?' * len(linhas.columns))})",
+                        valores.itertuples(index=False, name=None))
+        con.commit()
+
+    @staticmethod
+    def data_param(valor):
+        return pd.Timestamp(valor).strftime("%Y-%m-%d %H:%M:%S")
+
+
+DIALETOS = {"duckdb": _DuckDB, "sqlite": _SQLite}
+
+
+# ------------------------------------------------------------
+# Banco de um CSV e a versão visível a cada Dataset
+# ------------------------------------------------------------
+class SqlDb:
+    """Banco embutido com as linhas de um CSV.
+
+    Só o `DatasetStore` escreve (sob o seu lock); leitores consultam por `SqlSnapshot`, que
+    fixa quantas linhas a sua versão enxerga — anexar linhas não altera versões antigas.
+    """
+
+    def __init__(self, backend: str, path: str):
+        self.backend = backend
+        self.db = DIALETOS[backend](path)
+        tipo = self.db.tipo
+        self._ddl = f"CREATE TABLE IF NOT EXISTS {TABELA} ({', '.join(f'{c} {t[tipo]}' for c, t in COLUNAS.items())})"
+        self.db.executar(self._ddl)
+        self.db.executar(f"CREATE TABLE IF NOT EXISTS {TABELA}_meta (chave VARCHAR PRIMARY KEY, valor VARCHAR)")
+
+    def _meta(self) -> dict | None:
+        linhas = self.db.consulta(f"SELECT valor FROM {TABELA}_meta WHERE chave = 'estado'")
+        return json.loads(linhas.iloc[0, 0]) if len(linhas) else None
+
+    def _gravar_meta(self, offset: int, marker: str, mtime_ns: int, linhas: int) -> None:
+        estado = json.dumps({"offset": offset, "marker": marker, "mtime": mtime_ns, "linhas": linhas,
+                             "schema": SQL_SCHEMA})
+        self.db.executar(f"DELETE FROM {TABELA}_meta")
+        self.db.executar(f"INSERT INTO {TABELA}_meta VALUES ('estado', ?)", [estado])
+
+    def _inserir(self, df: pd.DataFrame, seq: int) -> int:
+        if len(df):
+            self.db.inserir(linhas_sql(df, seq))
+        return seq + len(df)
+
+    def sync(self, csv_path: str, fim: int, mtime_ns: int) -> "SqlSnapshot":
+        """Deixa o banco igual ao CSV em [0, fim) (com mtime `mtime_ns`): reaproveita o prefixo
+        já inserido se ele não mudou (ver `motor._prefix_intact`)."""
+        meta = self._meta()
+        valido = (meta is not None and meta.get("schema") == SQL_SCHEMA and fim >= meta["offset"]
+                  and motor._prefix_intact(csv_path, meta["offset"], meta["marker"], meta.get("mtime")))
+        if valido:
+            inicio, seq = meta["offset"], meta["linhas"]
+            self.db.executar(f"DELETE FROM {TABELA} WHERE _seq >= ?", [seq])  # carga interrompida
+        else:
+            self.db.executar(f"DROP TABLE IF EXISTS {TABELA}")
+            self.db.executar(self._ddl)
+            inicio, seq = 0, 0
+        if inicio < fim:
+            chunksize, _ = motor._stream_budget(csv_path)
+            for chunk in motor._iter_csv_chunks(csv_path, inicio, fim, chunksize):
+                seq = self._inserir(chunk, seq)
+        marker = motor._prefix_marker(csv_path, fim)
+        self._gravar_meta(fim, marker, mtime_ns, seq)
+        return SqlSnapshot(self, seq, fim, marker)
+
+
+@functools.lru_cache(maxsize=None)
+def banco(csv_path: str, backend: str, cache_dir: str) -> SqlDb:
+    """Banco único por (CSV, backend, pasta de cache) no processo."""
+    if backend not in DIALETOS:
+        raise ValueError(f"VENDAS_BACKEND desconhecido: {backend!r} (use pandas, {', '.join(DIALETOS)})")
+    base = os.path.splitext(os.path.basename(csv_path))[0]
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{base}.{backend}")
+    except OSError:
+        path = ":memory:"  # sem escrita em disco: banco refeito a cada processo
+    return SqlDb(backend, path)
+
+
+class SqlSnapshot(NamedTuple):
+    """Linhas `_seq < linhas` do banco: o que uma versão do `Dataset` enxerga."""
+    banco: SqlDb
+    linhas: int
+    offset: int
+    marker: str
+
+    def where(self, selecoes: dict, data_ini, data_fim) -> tuple:
+        """Cláusula WHERE dos filtros do topo (mesma semântica de `FilterIndex.select`) e seus parâmetros."""
+        db = self.banco.db
+        termos = ["_seq < ?", "data_venda >= ?", "data_venda <= ?"]
+        params = [self.linhas, db.data_param(data_ini), db.data_param(data_fim)]
+        for dim, valor in selecoes.items():
+            if valor != FILTER_DIMS[dim]:
+                termos.append(f"{_coluna(dim)} = ?")
+                params.append(valor)
+        return " AND ".join(termos), params
+
+    def rollup(self, selecoes: dict, data_ini, data_fim) -> "SqlRollup":
+        return SqlRollup(self, *self.where(selecoes, data_ini, data_fim))
+
+    def cube(self) -> pd.DataFrame:
+        """Cubo (mês × `CUBE_DIMS`) agregado no banco; igual ao `build_cube` das linhas."""
+        dims = ", ".join(CUBE_DIMS)
+        medidas = ", ".join(f"{MEDIDAS_SQL[m]} AS {m}" for m in CUBE_MEASURES)
+        cube = self.banco.db.consulta(
+            f"SELECT {self.banco.db.mes} AS data_venda, {dims}, {medidas} FROM {TABELA} WHERE _seq < ? "
+            f"GROUP BY 1, {dims}", [self.linhas])
+        return motor.finish_cube(cube.assign(data_venda=pd.to_datetime(cube["data_venda"])))
+
+    def diario(self) -> pd.DataFrame:
+        """Rollup diário (dia × `DIARIO_DIMS`) agregado no banco; igual ao `build_daily` das linhas."""
+        dims = ", ".join(DIARIO_DIMS)
+        medidas = ", ".join(f"{MEDIDAS_SQL[m]} AS {m}" for m in CUBE_MEASURES)
+        diario = self.banco.db.consulta(
+            f"SELECT {self.banco.db.dia} AS data_venda, {dims}, {medidas} FROM {TABELA} "
+            f"WHERE _seq < ? AND data_venda IS NOT NULL GROUP BY 1, {dims}", [self.linhas])
+        diario = diario.assign(data_venda=pd.to_datetime(diario["data_venda"]))
+        return motor.compact_dtypes(motor.sort_by_date(diario))
+
+    def daily(self, selecoes: dict, ini, fim) -> pd.DataFrame:
+        """Faturamento e nº de vendas por dia no período (só dias com venda)."""
+        return self._diario(*self.where(selecoes, ini, fim))
+
+    def _diario(self, where: str, params: list) -> pd.DataFrame:
+        serie = self.banco.db.consulta(
+            f"SELECT {self.banco.db.dia} AS dia, {MEDIDAS_SQL['preco_total']} AS preco_total, COUNT(*) AS n_linhas "
+            f"FROM {TABELA} WHERE {where} GROUP BY 1 ORDER BY 1", params)
+        return serie.assign(dia=pd.to_datetime(serie["dia"])).set_index("dia")
+
+    def opcoes(self) -> motor.FilterOptions:
+        """Opções dos filtros (valores distintos, municípios por estado, período e nº de vendas)."""
+        db = self.banco.db
+        distintos = lambda cols: db.consulta(
+            f"SELECT DISTINCT {cols} FROM {TABELA} WHERE _seq < ? AND "
+            + " AND ".join(f"{c} IS NOT NULL" for c in cols.split(", ")), [self.linhas])
+        municipios: dict = {}
+        for estado, municipio in sorted(distintos("estado, municipio").itertuples(index=False, name=None)):
+            municipios.setdefault(estado, []).append(municipio)
+        datas = db.consulta(f"SELECT MIN(data_venda) AS ini, MAX(data_venda) AS fim, COUNT(*) AS n "
+                            f"FROM {TABELA} WHERE _seq < ?", [self.linhas]).iloc[0]
+        return motor.FilterOptions(
+            valores={dim: tuple(sorted(distintos(dim)[dim].tolist())) for dim in FILTER_DIMS},
+            municipios={estado: tuple(lista) for estado, lista in municipios.items()},
+            data_min=pd.Timestamp(datas["ini"]) if pd.notna(datas["ini"]) else pd.NaT,
+            data_max=pd.Timestamp(datas["fim"]) if pd.notna(datas["fim"]) else pd.NaT,
+            n_vendas=int(datas["n"]),
+        )
+
+    def agregados(self) -> motor.Agregados:
+        """Cubo, rollup diário e opções dos filtros desta versão, calculados no banco."""
+        return motor.Agregados(self.cube(), self.diario(), self.opcoes())
+
+    def append(self, tail: pd.DataFrame, offset: int, marker: str, mtime_ns: int) -> "SqlSnapshot":
+        """Insere a cauda anexada ao CSV e devolve a versão que a inclui."""
+        linhas = self.banco._inserir(tail, self.linhas)
+        self.banco._gravar_meta(offset, marker, mtime_ns, linhas)
+        return self._replace(linhas=linhas, offset=offset, marker=marker)
+
+
+# ------------------------------------------------------------
+# Rollup em SQL — cada agregado é uma consulta ao banco
+# ------------------------------------------------------------
+class SqlRollup(motor.Rollup):
+    """Rollup cujos agregados são calculados no banco; só o resultado vem para o pandas.
+
+    Mesma interface e mesmos resultados do `Rollup` em memória (verificado por `paridade`);
+    `rows` e `cube` ficam vazios. Memoiza como o `Rollup`.
+    """
+
+    def __init__(self, snap: SqlSnapshot, where: str, params: list):
+        super().__init__(pd.DataFrame(), pd.DataFrame())
+        self.snap = snap
+        self.where = where
+        self.params = params
+
+    def _consulta(self, span: str, sql: str, params=()) -> pd.DataFrame:
+        """Executa `WITH f AS (linhas filtradas) <sql>`; os parâmetros do filtro vêm primeiro."""
+        with motor.thread_span(span) as sp:
+            df = self.snap.banco.db.consulta(
+                f"WITH f AS (SELECT * FROM {TABELA} WHERE {self.where}) {sql}", [*self.params, *params])
+            sp.update(fonte=self.snap.banco.backend, linhas_saida=len(df))
+        return df
+
+    def by(self, dims, *medidas) -> pd.DataFrame:
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        key = (tuple(dims), medidas)
+        if key not in self._memo:
+            cols = ", ".join(_coluna(d) for d in dims)
+            aggs = ", ".join(f"{MEDIDAS_SQL[m]} AS {m}" for m in medidas)
+            nao_nulos = " AND ".join(f"{d} IS NOT NULL" for d in dims)  # groupby do pandas descarta NaN
+            self._memo[key] = self._consulta(
+                f"groupby:{'+'.join(dims)}",
+                f"SELECT {cols}, {aggs} FROM f WHERE {nao_nulos} GROUP BY {cols} ORDER BY {cols}")
+        return self._memo[key]
+
+    def total(self, medida: str) -> float:
+        key = ("total", medida)
+        if key not in self._memo:  # todas as medidas numa consulta só
+            totais = self._consulta("sql:totais", f"SELECT {', '.join(f'{e} AS {m}' for m, e in MEDIDAS_SQL.items())} FROM f")
+            self._memo.update({("total", m): totais.iloc[0][m] for m in MEDIDAS_SQL})
+        return self._memo[key]
+
+    def nunique(self, col: str) -> int:
+        key = ("nunique", col)
+        if key not in self._memo:
+            self._memo[key] = int(self._consulta(f"sql:distintos:{col}",
+                                                 f"SELECT COUNT(DISTINCT {_coluna(col)}) FROM f").iloc[0, 0])
+        return self._memo[key]
+
+    def hist(self, col: str, nbins: int = HIST_BINS) -> pd.DataFrame:
+        """Bordas do NumPy (dependem só de mín./máx.) e contagem por faixa no banco."""
+        key = ("hist", col, nbins)
+        if key not in self._memo:
+            col = _coluna(col)
+            mn, mx = self._consulta(f"sql:faixa:{col}", f"SELECT MIN({col}), MAX({col}) FROM f").iloc[0]
+            if pd.isna(mn):  # nenhum valor: sem faixas (como `hist_bins`)
+                self._memo[key] = motor.hist_frame(np.zeros(0, dtype="int64"), np.zeros(1))
+                return self._memo[key]
+            bordas = np.histogram_bin_edges(np.array([mn, mx], dtype="float64"), bins=nbins)
+            # Faixa i = [borda_i, borda_i+1), a última fechada (como `np.histogram`)
+            faixa = "CASE " + " ".join(f"WHEN {col} >= ? THEN {i}" for i in range(nbins - 1, 0, -1)) + " ELSE 0 END"
+            contagem = np.zeros(nbins, dtype="int64")
+            por_faixa = self._consulta(f"sql:hist:{col}",
+                                       f"SELECT {faixa} AS faixa, COUNT(*) AS n FROM f WHERE {col} IS NOT NULL GROUP BY 1",
+                                       [float(b) for b in bordas[nbins - 1:0:-1]])
+            contagem[por_faixa["faixa"].to_numpy(dtype="int64")] = por_faixa["n"].to_numpy()
+            self._memo[key] = motor.hist_frame(contagem, bordas)
+        return self._memo[key]
+
+    def box(self, grupo: str, valor: str) -> tuple:
+        """Quartis por interpolação linear (posições pela ordem por grupo), bigodes e outliers no banco."""
+        key = ("box", grupo, valor)
+        if key not in self._memo:
+            g, v = _coluna(grupo), _coluna(valor)
+
+            def quartil(k: int) -> str:
+                # posição (n-1)·k/4 = base + fração, sem divisão inteira (difere entre os dialetos)
+                pos = f"((n - 1) * {k})"
+                base = f"{pos} - {pos} % 4"
+                return (f"MAX(CASE WHEN i * 4 = {base} THEN v END) + "
+                        f"(COALESCE(MAX(CASE WHEN i * 4 = {base} + 4 THEN v END), MAX(CASE WHEN i * 4 = {base} THEN v END))"
+                        f" - MAX(CASE WHEN i * 4 = {base} THEN v END)) * (MAX({pos} % 4) / 4.0)")
+
+            quantil = self.snap.banco.db.quantil
+            if quantil:
+                q = (f"q AS (SELECT g, {quantil.format(p=0.25)} AS q1, {quantil.format(p=0.5)} AS mediana, "
+                     f"{quantil.format(p=0.75)} AS q3 FROM b GROUP BY g)")
+            else:
+                q = (f"o AS (SELECT g, v, ROW_NUMBER() OVER (PARTITION BY g ORDER BY v) - 1 AS i, "
+                     f"COUNT(*) OVER (PARTITION BY g) AS n FROM b), "
+                     f"q AS (SELECT g, {quartil(1)} AS q1, {quartil(2)} AS mediana, {quartil(3)} AS q3 FROM o GROUP BY g)")
+            ctes = (f", b AS (SELECT {g} AS g, {v} AS v FROM f WHERE {g} IS NOT NULL AND {v} IS NOT NULL), {q}, "
+                    f"s AS (SELECT g, q1, mediana, q3, q1 - 1.5 * (q3 - q1) AS lim_inf, q3 + 1.5 * (q3 - q1) AS lim_sup FROM q)")
+            # `_consulta` antepõe "WITH f AS (...)"; as CTEs acima continuam a mesma cláusula WITH
+            stats = self._consulta(
+                f"sql:box:{g}",
+                f"{ctes} SELECT s.g AS {g}, q1, mediana, q3, "
+                f"MIN(CASE WHEN v >= lim_inf AND v <= lim_sup THEN v END) AS bigode_inf, "
+                f"MAX(CASE WHEN v >= lim_inf AND v <= lim_sup THEN v END) AS bigode_sup "
+                f"FROM s JOIN b ON b.g = s.g GROUP BY s.g, q1, mediana, q3 ORDER BY s.g")
+            distancia = "CASE WHEN lim_inf - v > v - lim_sup THEN lim_inf - v ELSE v - lim_sup END"
+            outliers = self._consulta(
+                f"sql:outliers:{g}",
+                f"{ctes} SELECT g AS {g}, v AS {v} FROM ("
+                f"SELECT b.g, b.v, ROW_NUMBER() OVER (PARTITION BY b.g ORDER BY {distancia} DESC) AS r "
+                f"FROM b JOIN s ON b.g = s.g WHERE v < lim_inf OR v > lim_sup) t WHERE r <= ? ORDER BY g, r",
+                [BOX_MAX_OUTLIERS])
+            self._memo[key] = (stats, outliers)
+        return self._memo[key]
+
+    def sample(self, cols: list, grupo: str, n: int = PLOT_MAX_POINTS) -> pd.DataFrame:
+        """Todas as linhas até `n`; acima, as mesmas cotas por grupo de `stratified_sample`.
+
+        A escolha dentro de cada grupo usa um hash de `_seq` (determinístico, não o sorteio do NumPy).
+        """
+        key = ("sample", tuple(cols), grupo, n)
+        if key not in self._memo:
+            lista = ", ".join(_coluna(c) for c in cols)
+            total = int(self.total("n_linhas"))
+            if total <= n:
+                amostra = self._consulta("sql:amostra", f"SELECT {lista} FROM f ORDER BY data_venda, _seq")
+            else:
+                tamanhos = self.by(grupo, "n_linhas")
+                cotas = np.maximum(1, np.floor(tamanhos["n_linhas"] * n / total)).astype(int)
+                caso = "CASE g " + " ".join("WHEN ? THEN ?" for _ in range(len(cotas))) + " ELSE 0 END"
+                params = [x for par in zip(tamanhos[grupo].tolist(), cotas.tolist()) for x in par]
+                amostra = self._consulta(
+                    "sql:amostra",
+                    f", a AS (SELECT {lista}, {_coluna(grupo)} AS g, _seq, ROW_NUMBER() OVER "
+                    f"(PARTITION BY {grupo} ORDER BY (_seq * 2654435761) % 4294967296) AS r FROM f WHERE {grupo} IS NOT NULL) "
+                    f"SELECT {lista} FROM a WHERE r <= {caso} ORDER BY _seq", params)
+            self._memo[key] = amostra
+        return self._memo[key]
+
+
+# ------------------------------------------------------------
+# Paridade com o caminho pandas
+# ------------------------------------------------------------
+def _normalizado(df: pd.DataFrame) -> pd.DataFrame:
+    """DataFrame sem categorias, índice nem ordem de linhas (a ordem de empates pode variar)."""
+    df = motor._plain_keys(df.reset_index(drop=True))
+    df = df.assign(**{c: df[c].astype(object).where(df[c].notna(), None) for c in df.columns
+                      if df[c].dtype == object or pd.api.types.is_string_dtype(df[c])})
+    return df.sort_values(list(df.columns), kind="stable", na_position="last").reset_index(drop=True)
+
+
+def _diferenca(a, b) -> str | None:
+    """Descrição da diferença entre dois resultados (None se equivalentes)."""
+    if isinstance(a, tuple):
+        for i, (x, y) in enumerate(zip(a, b)):
+            if (d := _diferenca(x, y)) is not None:
+                return f"[{i}] {d}"
+        return None
+    if isinstance(a, pd.DataFrame):
+        if list(a.columns) != list(b.columns):
+            return f"colunas {list(a.columns)} != {list(b.columns)}"
+        try:
+            pd.testing.assert_frame_equal(_normalizado(a), _normalizado(b), check_dtype=False,
+                                          check_index_type=False, check_column_type=False, rtol=1e-9, atol=1e-6)
+        except AssertionError as e:
+            return str(e).splitlines()[0] + " " + " ".join(str(e).splitlines()[1:4])
+        return None
+    if isinstance(a, float) or isinstance(b, float):
+        return None if np.isclose(a, b, rtol=1e-9, atol=1e-6) else f"{a!r} != {b!r}"
+    return None if a == b else f"{a!r} != {b!r}"
+
+
+def _estados_filtro(ds: motor.Dataset, n: int, seed: int) -> list:
+    """Sem filtro mais `n` seleções aleatórias ancoradas em vendas existentes (raramente vazias)."""
+    linhas = motor.all_rows(ds).dropna(subset=["data_venda"])
+    dias = np.sort(linhas["data_venda"].unique())
+    ini, fim = dias[0], dias[-1]
+    estados = [(dict(FILTER_DIMS), pd.Timestamp(ini).date(), pd.Timestamp(fim).date())]
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        venda = linhas.iloc[rng.integers(len(linhas))]
+        dims = rng.choice(list(FILTER_DIMS), size=rng.integers(0, 4), replace=False)
+        sel = {**FILTER_DIMS, **{d: venda[d] for d in dims if pd.notna(venda[d])}}
+        a, b = sorted(rng.choice(dias, size=2)) if rng.random() < 0.6 else (ini, fim)
+        estados.append((sel, pd.Timestamp(a).date(), pd.Timestamp(b).date()))
+    return estados
+
+
+def paridade(csv_path: str | None = None, backend: str = "duckdb", n_filtros: int = 25, seed: int = 0) -> list:
+    """Compara os agregados da carga, cada KPI e cada agregado dos gráficos do backend SQL com o pandas em memória.
+
+    Retorna a lista de divergências `(filtro, saída, descrição)` — vazia quando há paridade.
+    A dispersão acima de `PLOT_MAX_POINTS` é uma amostra: compara só as cotas por categoria.
+    """
+    csv_path = csv_path or motor.CSV_PATH
+    fingerprint = motor._csv_fingerprint(csv_path)
+    ref = motor._memory_load(csv_path, fingerprint, 1)
+    sql = motor._sql_load(csv_path, fingerprint, 1, backend)
+    divergencias = []
+    for nome, a, b in (("cubo", ref.cube, sql.cube), ("diario", ref.diario, sql.diario),
+                       ("opcoes", ref.opcoes, sql.opcoes)):
+        if (d := _diferenca(a, b)) is not None:
+            divergencias.append(("(carga)", nome, d))
+    for sel, ini, fim in _estados_filtro(ref, n_filtros, seed):
+        rotulo = json.dumps({**{k: v for k, v in sel.items() if v != FILTER_DIMS[k]},
+                             "periodo": f"{ini}..{fim}"}, ensure_ascii=False, default=str)
+        r_ref, r_sql = motor.build_rollup(ref, sel, ini, fim), motor.build_rollup(sql, sel, ini, fim)
+        s_ref = motor.daily_series(ref, sel, ini, fim, lookback_dias=motor.SERIE_LOOKBACK_DIAS)
+        s_sql = motor.daily_series(sql, sel, ini, fim, lookback_dias=motor.SERIE_LOOKBACK_DIAS)
+        saidas = [*((f"kpi:{nome}", lambda r, s, f=f: f(r)) for nome, f in motor.KPIS.items()),
+                  *((nome, lambda r, s, f=f: f(r)) for nome, f in motor.AGREGADOS.items()),
+                  *((nome, lambda r, s, f=f: f(s, ini)) for nome, f in motor.AGREGADOS_SERIE.items())]
+        for nome, calc in saidas:
+            if motor.n_vendas(r_ref) == 0 and not nome.startswith("kpi:"):
+                continue  # sem vendas o app não desenha gráficos
+            a, b = calc(r_ref, s_ref), calc(r_sql, s_sql)
+            if nome == "dispersao_qtd_preco" and motor.n_vendas(r_ref) > PLOT_MAX_POINTS:
+                a, b = (x.groupby("categoria_produto").size().rename("n").reset_index() for x in (a, b))
+            if (d := _diferenca(a, b)) is not None:
+                divergencias.append((rotulo, nome, d))
+    return divergencias
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Verifica a paridade do backend SQL com o caminho pandas.")
+    ap.add_argument("--backend", default="duckdb", choices=list(DIALETOS))
+    ap.add_argument("--csv", default=None, help="CSV de vendas (padrão VENDAS_CSV)")
+    ap.add_argument("--filtros", type=int, default=25, help="nº de seleções aleatórias além de 'sem filtro'")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    divergencias = paridade(args.csv, args.backend, args.filtros, args.seed)
+    for filtro, saida, descricao in divergencias:
+        print(f"{saida}  {filtro}\n    {descricao}")
+    n_saidas = len(motor.KPIS) + len(motor.AGREGADOS) + len(motor.AGREGADOS_SERIE)
+    print(f"{args.backend}: {len(divergencias)} divergências em {args.filtros + 1} estados de filtro × {n_saidas} saídas")
+    sys.exit(1 if divergencias else 0)
+
+
+if __name__ == "__main__":
+    main()